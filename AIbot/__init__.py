@@ -1,9 +1,11 @@
 """
 AIbot包初始化，导出主要组件供外部调用。
+导入时没有I/O，使用前需要先await startup()，退出时await shutdown()。
 """
 
 from .command_handler import command_handler
 from .deepseek_client import deepseek_client
+from .lifecycle import shutdown, startup
 from .message_handler import message_handler
 from .session_manager import session_manager
 from .user_manager import user_manager
@@ -14,4 +16,7 @@ __all__ = [
     "message_handler",
     "session_manager",
     "user_manager",
-] 
\ No newline at end of file
+    "startup",
+    "shutdown",
+]
+ 
\ No newline at end of file
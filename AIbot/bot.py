@@ -3,8 +3,10 @@ AI机器人主程序
 """
 import asyncio
 import json
+import logging
 import os
 import sys
+import time
 from pathlib import Path
 from typing import Dict, List, Optional, Union, Any
 
@@ -17,12 +19,26 @@ if WECHATBOT_PATH not in sys.path:
     sys.path.insert(0, WECHATBOT_PATH)
 
 from AIbot.command_handler import command_handler
-from AIbot.config import DEEPSEEK_API_KEY
+from AIbot.config import BOT_NAME, DEEPSEEK_API_KEY, LOG_LEVEL, LISTEN_HOST, LISTEN_PORT, POLL_TIMEOUT, SESSION_FLUSH_INTERVAL, TRANSPORT
+from AIbot.http_client import create_client
+from AIbot.lifecycle import shutdown, startup
 from AIbot.message_handler import message_handler
 from AIbot.session_manager import session_manager
+from AIbot.transport import create_transport
 from AIbot.user_manager import user_manager
 
 
+class LoguruHandler(logging.Handler):
+    """把AIbot模块的标准库日志转交给loguru输出"""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            level = logger.level(record.levelname).name
+        except ValueError:
+            level = record.levelno
+        logger.opt(exception=record.exc_info).log(level, record.getMessage())
+
+
 class AIBot:
     """AI机器人，负责与OneBot API通信并处理微信私聊消息。"""
     
@@ -42,6 +58,11 @@ class AIBot:
         self.api_url = api_url.rstrip("/")
         self.access_token = access_token
         self.running = False
+        # OneBot API的长连接池，轮询与发送消息共用，由close()释放
+        self._client: Optional[httpx.AsyncClient] = None
+        # 推送式传输（ws/webhook），轮询模式为None
+        self.transport = create_transport(TRANSPORT, LISTEN_HOST, LISTEN_PORT, access_token, self._process_event)
+        self._stop_event: Optional[asyncio.Event] = None
         
         # 新增：调试输出API地址和Token（仅显示前后几位，防止泄露）
         logger.info(f"[调试] OneBot API地址: {self.api_url}")
@@ -54,30 +75,36 @@ class AIBot:
         if admin_wxid:
             command_handler.admin_wxid = admin_wxid
         
-        # 设置日志
+        # 设置日志，级别由LOG_LEVEL控制，级别以下的日志不做格式化
         logger.remove()
         logger.add(
             sys.stdout,
-            level="INFO",
+            level=LOG_LEVEL,
             format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level}</level> | <level>{message}</level>"
         )
         logger.add(
             Path(__file__).parent / "logs" / "bot_{time}.log",
             rotation="1 day",
             retention="7 days",
-            level="INFO"
+            level=LOG_LEVEL
         )
+        aibot_logger = logging.getLogger("AIbot")
+        aibot_logger.setLevel(LOG_LEVEL)
+        aibot_logger.propagate = False
+        if not any(isinstance(handler, LoguruHandler) for handler in aibot_logger.handlers):
+            aibot_logger.addHandler(LoguruHandler())
         
         # 检查API密钥
         if not DEEPSEEK_API_KEY:
             logger.warning("未设置DeepSeek API密钥，请设置环境变量DEEPSEEK_API_KEY")
     
-    async def _call_api(self, action: str, params: Dict[str, Any] = None) -> Dict:
+    async def _call_api(self, action: str, params: Dict[str, Any] = None, timeout: float = 30.0) -> Dict:
         """
         调用OneBot API接口
         参数：
             action: 动作名称
             params: 参数字典
+            timeout: 请求超时时间（秒）
         返回：
             API返回的字典结果
         """
@@ -88,23 +115,32 @@ class AIBot:
         # 修改：始终带上params字段
         data = {"action": action, "params": params if params is not None else {}}
         
-        logger.debug(f"[调试] 调用API: {self.api_url}/, action: {action}, params: {params}, headers: {headers}")
+        # 有WebSocket连接时，action通过同一连接发送
+        if self.transport is not None and self.transport.connected:
+            try:
+                return await self.transport.call_api(action, data["params"], timeout)
+            except Exception as e:
+                logger.error(f"通过WebSocket调用API出错: {e}")
+                return {"status": "failed", "retcode": -1, "message": str(e)}
+        
+        logger.debug("调用API: {} action={} params={}", self.api_url, action, params)
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{self.api_url}/",
-                    headers=headers,
-                    json=data
-                )
-                logger.debug(f"[调试] API响应状态: {response.status_code}, 响应内容: {response.text}")
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    logger.error(f"API调用失败: {response.status_code} {response.text}")
-                    return {"status": "failed", "retcode": response.status_code, "response": response.text}
+            if self._client is None or self._client.is_closed:
+                self._client = create_client()
+            response = await self._client.post(
+                f"{self.api_url}/",
+                headers=headers,
+                json=data,
+                timeout=timeout
+            )
+            logger.debug("API响应: action={} status={} body={}", action, response.status_code, response.text)
+            if response.status_code == 200:
+                return response.json()
+            else:
+                logger.error(f"API调用失败: {response.status_code} {response.text}")
+                return {"status": "failed", "retcode": response.status_code, "response": response.text}
         except Exception as e:
-            import traceback
-            logger.error(f"API调用出错: {e}\n[调试] 异常堆栈: {traceback.format_exc()}")
+            logger.opt(exception=e).error("API调用出错: action={} error={}", action, e)
             return {"status": "failed", "retcode": -1, "message": str(e)}
     
     async def _process_event(self, event: Dict) -> None:
@@ -115,21 +151,32 @@ class AIBot:
         """
         try:
             if event.get("type") == "message" and event.get("detail_type") == "private":
-                # 处理私聊消息
-                logger.info(f"收到私聊消息: {event.get('user_id')} -> {self._get_message_text(event)}")
+                # 处理私聊消息，消息内容只在DEBUG级别输出
+                logger.info("收到私聊消息: {}", event.get("user_id"))
+                logger.opt(lazy=True).debug("消息内容: {}", lambda: self._get_message_text(event))
                 
-                # 处理消息并获取回复
-                reply = await message_handler.handle_message(event)
-                logger.info(f"[调试] handle_message返回: {reply}")
+                # 处理消息并获取回复，流式回复会在生成过程中通过_send_reply分块发送
+                reply = await message_handler.handle_message(event, self._send_reply)
                 
                 # 发送回复
                 if reply:
-                    logger.info(f"发送回复: {reply.get('user_id')} <- {self._get_message_text(reply)}")
-                    result = await self._call_api("send_message", reply)
-                    logger.info(f"[调试] send_message API返回: {result}")
+                    await self._send_reply(reply)
         except Exception as e:
             logger.error(f"处理事件出错: {e}")
     
+    async def _send_reply(self, reply: Dict) -> None:
+        """
+        发送一条回复消息
+        参数：
+            reply: send_message的参数字典
+        """
+        logger.opt(lazy=True).debug(
+            "发送回复: {} <- {}", lambda: reply.get("user_id"), lambda: self._get_message_text(reply)
+        )
+        result = await self._call_api("send_message", reply)
+        if result.get("status") != "ok":
+            logger.warning("发送回复失败: {} {}", reply.get("user_id"), result)
+    
     def _get_message_text(self, event: Dict) -> str:
         """
         从事件中提取文本消息内容，用于日志输出
@@ -147,17 +194,20 @@ class AIBot:
     
     async def _fetch_events(self) -> List[Dict]:
         """
-        获取最新事件列表
+        获取最新事件列表，使用长轮询，没有事件时服务端最多挂起POLL_TIMEOUT秒
         返回：事件字典列表
         """
-        result = await self._call_api("get_latest_events", {"timeout": 30})
+        params = {"timeout": POLL_TIMEOUT, "wx.consumer": BOT_NAME}
+        result = await self._call_api("get_latest_events", params, timeout=POLL_TIMEOUT + 10)
         if result.get("status") == "ok" and "data" in result:
             # 兼容data为list或dict
             if isinstance(result["data"], list):
                 return result["data"]
             elif isinstance(result["data"], dict) and "events" in result["data"]:
                 return result["data"]["events"]
-        return []
+            return []
+        # 长轮询不再有固定间隔，请求失败时抛出异常由主循环退避重试
+        raise RuntimeError(f"get_latest_events调用失败: {result}")
     
     async def run(self) -> None:
         """
@@ -166,9 +216,12 @@ class AIBot:
         self.running = True
         logger.info("AI机器人启动...")
         # 新增：输出当前环境变量相关信息
-        logger.info(f"[调试] 当前ONEBOT_API_URL: {os.environ.get('ONEBOT_API_URL')}")
-        logger.info(f"[调试] 当前ONEBOT_ACCESS_TOKEN: {os.environ.get('ONEBOT_ACCESS_TOKEN')}")
-        logger.info(f"[调试] 当前ADMIN_WXID: {os.environ.get('ADMIN_WXID')}")
+        logger.debug(f"[调试] 当前ONEBOT_API_URL: {os.environ.get('ONEBOT_API_URL')}")
+        logger.debug(f"[调试] 当前ADMIN_WXID: {os.environ.get('ADMIN_WXID')}")
+        
+        if self.transport is not None:
+            await self._run_push()
+            return
         
         # 检查自身在线状态
         status = await self._call_api("get_self_info")
@@ -190,34 +243,65 @@ class AIBot:
                 events = await self._fetch_events()
                 for event in events:
                     asyncio.create_task(self._process_event(event))
-                await asyncio.sleep(1)  # 每秒轮询一次，降低请求频率
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logger.error(f"事件获取出错: {e}")
                 await asyncio.sleep(5)
     
+    async def _run_push(self) -> None:
+        """
+        推送模式主循环：启动ws/webhook监听，事件到达时直接处理，直到stop()被调用
+        """
+        self._stop_event = asyncio.Event()
+        await self.transport.start()
+        logger.info(f"以{TRANSPORT}方式等待事件推送: {LISTEN_HOST}:{LISTEN_PORT}")
+        cleanup_task = asyncio.create_task(self._session_cleanup_task())
+        try:
+            await self._stop_event.wait()
+        finally:
+            cleanup_task.cancel()
+            await self.transport.stop()
+    
     async def _session_cleanup_task(self) -> None:
         """
-        定时清理过期会话任务
+        定时写入会话变更，并每小时清理一次过期会话
         """
+        next_cleanup = time.monotonic()
         while self.running:
             try:
-                count = session_manager.clear_expired_sessions()
-                if count > 0:
-                    logger.info(f"已清理 {count} 个过期会话")
+                await session_manager.flush()
             except Exception as e:
-                logger.error(f"会话清理出错: {e}")
+                logger.error(f"会话写入出错: {e}")
+            if time.monotonic() >= next_cleanup:
+                next_cleanup = time.monotonic() + 3600
+                try:
+                    count = await session_manager.clear_expired_sessions()
+                    if count > 0:
+                        logger.info(f"已清理 {count} 个过期会话")
+                except Exception as e:
+                    logger.error(f"会话清理出错: {e}")
             
-            await asyncio.sleep(3600)  # 每小时清理一次
+            await asyncio.sleep(SESSION_FLUSH_INTERVAL)
     
     def stop(self) -> None:
         """
         停止机器人运行
         """
         self.running = False
+        if self._stop_event is not None:
+            self._stop_event.set()
         logger.info("AI机器人停止...")
 
+    async def close(self) -> None:
+        """
+        释放机器人持有的连接池，并写入剩余的会话与用户配置
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        await shutdown()
+
 
 async def run_bot():
     """
@@ -231,12 +315,14 @@ async def run_bot():
     bot = AIBot(api_url, access_token, admin_wxid)
     
     try:
+        await startup()
         await bot.run()
     except KeyboardInterrupt:
         bot.stop()
     except Exception as e:
         logger.exception(f"机器人运行出错: {e}")
     finally:
+        await bot.close()
         logger.info("机器人已关闭")
 
 
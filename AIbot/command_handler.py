@@ -2,34 +2,108 @@
 命令处理器，用于处理用户命令和管理员命令
 """
 import re
-from typing import Dict, Optional, Tuple
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 
 from .user_manager import user_manager
 from .session_manager import session_manager
+from .context_builder import context_builder
+from .deepseek_client import deepseek_client
+
+CommandFunc = Callable[..., Awaitable[str]]
+
+
+class Command:
+    """一条已注册的命令"""
+
+    def __init__(
+        self,
+        name: str,
+        func: CommandFunc,
+        args: Optional[str] = None,
+        admin: bool = False,
+        usage: str = "",
+        help: Optional[str] = None
+    ):
+        """
+        参数：
+            name: 命令名，可以包含子命令，如"/admin list"
+            func: 处理函数，调用方式为func(handler, wxid, *参数)
+            args: 参数的正则表达式，分组作为参数传给处理函数，None表示没有参数
+            admin: 是否仅管理员可用
+            usage: 帮助中显示的参数说明，如"<文本>"
+            help: 帮助中显示的说明，None表示不在帮助中显示
+        """
+        self.name = name
+        self.func = func
+        self.admin = admin
+        self.usage = f"{name} {usage}" if usage else name
+        self.help = help
+        # 第一个词之后的部分（子命令与参数）预先编译，分发时只对同名命令匹配
+        rest = name.split(" ", 1)[1] if " " in name else ""
+        if args is not None:
+            rest = f"{re.escape(rest)} {args}" if rest else args
+        else:
+            rest = re.escape(rest)
+        self.pattern = re.compile(rf"{rest}\s*")
+
+
+class CommandRegistry:
+    """命令注册表，按命令的第一个词分组，分发时直接查表，不随命令数量增加而变慢。"""
+
+    def __init__(self):
+        self.commands: Dict[str, List[Command]] = {}  # 第一个词 -> 命令列表
+        self.ordered: List[Command] = []  # 按注册顺序，用于生成帮助
+
+    def command(
+        self,
+        name: str,
+        args: Optional[str] = None,
+        admin: bool = False,
+        usage: str = "",
+        help: Optional[str] = None
+    ) -> Callable[[CommandFunc], CommandFunc]:
+        """
+        注册命令的装饰器
+        参数：与Command相同
+        返回：装饰器，被装饰的函数不变
+        """
+        def decorator(func: CommandFunc) -> CommandFunc:
+            command = Command(name, func, args, admin, usage, help)
+            self.commands.setdefault(name.split(" ", 1)[0], []).append(command)
+            self.ordered.append(command)
+            return func
+        return decorator
+
+    def match(self, text: str) -> Optional[Tuple[Command, Tuple[str, ...]]]:
+        """
+        查找与文本匹配的命令
+        参数：text: 去除首尾空白的命令文本
+        返回：(命令, 参数)，没有匹配的命令时返回None
+        """
+        head, _, rest = text.partition(" ")
+        for command in self.commands.get(head, ()):
+            match = command.pattern.fullmatch(rest)
+            if match:
+                return command, match.groups()
+        return None
+
+
+# 全局命令注册表，可以在其他模块中用@registry.command(...)添加命令
+registry = CommandRegistry()
 
 
 class CommandHandler:
     """命令处理器，负责解析和执行用户/管理员命令"""
     
-    def __init__(self, admin_wxid: Optional[str] = None):
+    def __init__(self, admin_wxid: Optional[str] = None, registry: CommandRegistry = registry):
         """
         初始化命令处理器
         参数：
             admin_wxid: 管理员微信ID
+            registry: 命令注册表
         """
         self.admin_wxid = admin_wxid
-        self.commands = {
-            r"^/help\s*$": self.help_command,
-            r"^/on\s*$": self.enable_auto_reply,
-            r"^/off\s*$": self.disable_auto_reply,
-            r"^/status\s*$": self.status_command,
-            r"^/clear\s*$": self.clear_history,
-            r"^/prompt (.+)$": self.set_prompt,
-            # 以下是管理员命令
-            r"^/admin list$": self.list_enabled_users,
-            r"^/admin enable (.+)$": self.admin_enable_user,
-            r"^/admin disable (.+)$": self.admin_disable_user,
-        }
+        self.registry = registry
     
     def is_command(self, text: str) -> bool:
         """
@@ -47,41 +121,36 @@ class CommandHandler:
             text: 命令文本
         返回：命令处理结果字符串或None
         """
-        print(f"[调试] handle_command收到: '{text}'")
         if not self.is_command(text):
             return None
         
-        for pattern, handler in self.commands.items():
-            match = re.match(pattern, text.strip())
-            if match:
-                args = match.groups()
-                return await handler(wxid, *args)
-        
-        return "未知命令，发送 /help 查看帮助"
+        result = self.registry.match(text.strip())
+        if result is None:
+            return "未知命令，发送 /help 查看帮助"
+        command, args = result
+        if command.admin and wxid != self.admin_wxid:
+            return "权限不足，此命令仅管理员可用"
+        return await command.func(self, wxid, *args)
     
+    @registry.command("/help")
     async def help_command(self, wxid: str) -> str:
         """
         帮助命令，返回命令帮助信息
         """
-        help_text = """AI机器人命令帮助：
-/on - 开启AI自动回复
-/off - 关闭AI自动回复
-/status - 查看当前状态
-/clear - 清除聊天历史
-/prompt <文本> - 设置个性化提示词
-
-发送任何不以/开头的消息将直接与AI对话"""
+        commands = [command for command in self.registry.ordered if command.help is not None]
+        lines = ["AI机器人命令帮助："]
+        lines.extend(f"{command.usage} - {command.help}" for command in commands if not command.admin)
+        lines.append("")
+        lines.append("发送任何不以/开头的消息将直接与AI对话")
 
         if wxid == self.admin_wxid:
-            help_text += """
-
-管理员命令：
-/admin list - 列出所有启用自动回复的用户
-/admin enable <wxid> - 为指定用户开启自动回复
-/admin disable <wxid> - 为指定用户关闭自动回复"""
+            lines.append("")
+            lines.append("管理员命令：")
+            lines.extend(f"{command.usage} - {command.help}" for command in commands if command.admin)
         
-        return help_text
+        return "\n".join(lines)
     
+    @registry.command("/on", help="开启AI自动回复")
     async def enable_auto_reply(self, wxid: str) -> str:
         """
         开启AI自动回复
@@ -89,6 +158,7 @@ class CommandHandler:
         user_manager.enable_auto_reply(wxid)
         return "已开启AI自动回复功能"
     
+    @registry.command("/off", help="关闭AI自动回复")
     async def disable_auto_reply(self, wxid: str) -> str:
         """
         关闭AI自动回复
@@ -96,6 +166,7 @@ class CommandHandler:
         user_manager.disable_auto_reply(wxid)
         return "已关闭AI自动回复功能"
     
+    @registry.command("/status", help="查看当前状态")
     async def status_command(self, wxid: str) -> str:
         """
         查询当前AI自动回复状态和个性化提示词
@@ -104,15 +175,34 @@ class CommandHandler:
         status = "已开启" if enabled else "已关闭"
         custom_prompt = user_manager.get_custom_prompt(wxid)
         prompt_info = f"\n当前提示词: {custom_prompt}" if custom_prompt else ""
-        return f"AI自动回复功能: {status}{prompt_info}"
+        cache_info = ""
+        if deepseek_client.cache is not None:
+            stats = deepseek_client.cache.stats()
+            hits = stats["hits"] + stats["disk_hits"]
+            cache_info = (
+                f"\n回复缓存命中率: {stats['hit_rate']:.1%}"
+                f"（命中 {hits}/{hits + stats['misses']}，其中磁盘 {stats['disk_hits']}，跳过 {stats['bypassed']}）"
+            )
+        backend_info = ""
+        if len(deepseek_client.router.backends) > 1:
+            lines = [
+                f"{item['name']}: {item['state']}，延迟 {item['ewma_ms'] or '-'}ms，p95 {item['p95_ms'] or '-'}ms，"
+                f"请求 {item['requests']}，失败 {item['errors']}"
+                for item in deepseek_client.router.stats()
+            ]
+            backend_info = "\n模型后端:\n" + "\n".join(lines)
+        return f"AI自动回复功能: {status}{prompt_info}{cache_info}{backend_info}"
     
+    @registry.command("/clear", help="清除聊天历史")
     async def clear_history(self, wxid: str) -> str:
         """
         清除当前用户的聊天历史
         """
         session_manager.clear_history(wxid)
+        context_builder.clear(wxid)
         return "已清除聊天历史记录"
     
+    @registry.command("/prompt", "(.+)", usage="<文本>", help="设置个性化提示词")
     async def set_prompt(self, wxid: str, prompt: str) -> str:
         """
         设置个性化提示词
@@ -120,36 +210,30 @@ class CommandHandler:
         user_manager.set_custom_prompt(wxid, prompt)
         return f"已设置个性化提示词:\n{prompt}"
     
+    @registry.command("/admin list", admin=True, help="列出所有启用自动回复的用户")
     async def list_enabled_users(self, wxid: str) -> str:
         """
         管理员命令：列出所有已启用自动回复的用户
         """
-        if wxid != self.admin_wxid:
-            return "权限不足，此命令仅管理员可用"
-        
         users = user_manager.get_all_enabled_users()
         if not users:
             return "当前没有用户启用AI自动回复"
         
         return "已启用AI自动回复的用户：\n" + "\n".join(users)
     
+    @registry.command("/admin enable", "(.+)", admin=True, usage="<wxid>", help="为指定用户开启自动回复")
     async def admin_enable_user(self, wxid: str, target_wxid: str) -> str:
         """
         管理员命令：为指定用户开启自动回复
         """
-        if wxid != self.admin_wxid:
-            return "权限不足，此命令仅管理员可用"
-        
         user_manager.enable_auto_reply(target_wxid)
         return f"已为用户 {target_wxid} 开启AI自动回复"
     
+    @registry.command("/admin disable", "(.+)", admin=True, usage="<wxid>", help="为指定用户关闭自动回复")
     async def admin_disable_user(self, wxid: str, target_wxid: str) -> str:
         """
         管理员命令：为指定用户关闭自动回复
         """
-        if wxid != self.admin_wxid:
-            return "权限不足，此命令仅管理员可用"
-        
         success = user_manager.disable_auto_reply(target_wxid)
         if success:
             return f"已为用户 {target_wxid} 关闭AI自动回复"
@@ -16,10 +16,27 @@ BOT_DESCRIPTION = os.environ.get("BOT_DESCRIPTION", "基于DeepSeek的AI自动
 
 # 存储配置
 DATA_DIR = Path(__file__).parent / "data"
+# 数据目录在第一次写入时创建，导入配置不产生文件
 USER_CONFIG_FILE = DATA_DIR / "user_config.json"
+USER_STORE = os.environ.get("USER_STORE", "json").lower()  # 用户配置存储方式：json或sqlite
+USER_DB_FILE = DATA_DIR / "users.db"
+USER_FLUSH_DELAY = float(os.environ.get("USER_FLUSH_DELAY", 1))  # 用户配置变更后延迟写入的时间（秒），期间的变更合并为一次写入
 
-# 确保数据目录存在
-DATA_DIR.mkdir(exist_ok=True)
+# 会话存储配置
+SESSION_STORE = os.environ.get("SESSION_STORE", "sqlite").lower()  # sqlite（持久化）或memory（重启后丢失）
+SESSION_DB_FILE = DATA_DIR / "sessions.db"
+SESSION_MEMORY_MB = float(os.environ.get("SESSION_MEMORY_MB", 64))  # 内存中会话的总占用上限（Mb），0 表示不限制
+SESSION_MAX_HISTORY = int(os.environ.get("SESSION_MAX_HISTORY", 50))  # 每个用户保存的最大消息数，实际发送的消息由token预算决定
+SESSION_FLUSH_INTERVAL = float(os.environ.get("SESSION_FLUSH_INTERVAL", 5))  # 会话变更批量写入的间隔（秒）
+
+# 事件传输方式：poll（轮询get_latest_events）、ws（反向WebSocket服务端）、webhook（webhook接收端）
+TRANSPORT = os.environ.get("TRANSPORT", "poll").lower()
+# ws/webhook模式下的监听地址与端口，需与客户端的websocket_url/webhook_url一致
+LISTEN_HOST = os.environ.get("LISTEN_HOST", "127.0.0.1")
+LISTEN_PORT = int(os.environ.get("LISTEN_PORT", 8080))
+
+# 事件长轮询等待时间（秒），get_latest_events没有事件时服务端最多挂起的时间
+POLL_TIMEOUT = int(os.environ.get("POLL_TIMEOUT", 30))
 
 # 日志配置
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
@@ -27,7 +44,42 @@ LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
 # 机器人默认设置
 DEFAULT_PROMPT = os.environ.get("DEFAULT_PROMPT", """你是一个友好的聊天助手，请用简洁友好的语气回复用户的消息。\n如果用户问题涉及敏感内容，请礼貌拒绝。\n回复尽量简短，不超过100字。""")
 MAX_TOKENS = int(os.environ.get("MAX_TOKENS", 1000))
+
+# 上下文配置
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 4000))  # 一次请求的上下文token预算（含系统提示词）
+CONTEXT_SUMMARY = os.environ.get("CONTEXT_SUMMARY", "false").lower() in ("1", "true", "yes")  # 是否用滚动摘要替代超出预算的早期对话
+CONTEXT_SUMMARY_TOKENS = int(os.environ.get("CONTEXT_SUMMARY_TOKENS", 300))  # 摘要的最大token数
 TEMPERATURE = float(os.environ.get("TEMPERATURE", 0.7))
 
 # 新增：支持本地.env配置初始自动回复好友
-DEFAULT_ENABLED_USERS = os.environ.get("DEFAULT_ENABLED_USERS", "")  # 逗号分隔的wxid字符串 
\ No newline at end of file
+DEFAULT_ENABLED_USERS = os.environ.get("DEFAULT_ENABLED_USERS", "")  # 逗号分隔的wxid字符串 
+
+# HTTP连接池配置，DeepSeek与OneBot各使用一个长连接池
+HTTP2 = os.environ.get("HTTP2", "false").lower() in ("1", "true", "yes")  # 是否启用HTTP/2，需要安装h2
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", 100))  # 每个连接池的最大连接数
+HTTP_MAX_KEEPALIVE = int(os.environ.get("HTTP_MAX_KEEPALIVE", 20))  # 保持的最大空闲长连接数
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", 30))  # 空闲长连接保持时间（秒）
+
+# 流式回复配置，开启后按句子/段落分块，每块生成完就立即发送
+STREAM_REPLY = os.environ.get("STREAM_REPLY", "false").lower() in ("1", "true", "yes")
+STREAM_MIN_CHUNK = int(os.environ.get("STREAM_MIN_CHUNK", 30))  # 每条消息的最少字数，避免刷屏
+
+# 多后端路由，LLM_BACKENDS为JSON数组，每项包含name、base_url、api_key、model，可选weight；为空时只使用DeepSeek
+LLM_BACKENDS = os.environ.get("LLM_BACKENDS", "")
+LLM_HEDGE = os.environ.get("LLM_HEDGE", "true").lower() in ("1", "true", "yes")  # 后端超过p95仍未返回时同时请求另一个后端
+LLM_HEDGE_DELAY = float(os.environ.get("LLM_HEDGE_DELAY", 3))  # 延迟样本不足时，发起对冲请求前的等待时间（秒）
+LLM_FAILURE_THRESHOLD = int(os.environ.get("LLM_FAILURE_THRESHOLD", 3))  # 连续失败多少次后暂停使用该后端
+LLM_COOLDOWN = float(os.environ.get("LLM_COOLDOWN", 30))  # 暂停使用后多久（秒）再试探一次
+
+# AI回复缓存，相同的提示词与最近消息直接返回之前的回复
+RESPONSE_CACHE = os.environ.get("RESPONSE_CACHE", "false").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_STORE = os.environ.get("RESPONSE_CACHE_STORE", "sqlite").lower()  # sqlite（重启后保留）或memory
+RESPONSE_CACHE_DB_FILE = DATA_DIR / "response_cache.db"
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", 1000))  # 内存中保留的最大条数
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", 86400))  # 缓存有效期（秒）
+RESPONSE_CACHE_WINDOW = int(os.environ.get("RESPONSE_CACHE_WINDOW", 1))  # 历史消息超过该条数时不使用缓存，1 表示只缓存对话的第一条消息
+RESPONSE_CACHE_MAX_TEMPERATURE = float(os.environ.get("RESPONSE_CACHE_MAX_TEMPERATURE", 1.0))  # 采样温度高于该值时不使用缓存
+
+# 消息合并与并发控制
+DEBOUNCE_SECONDS = float(os.environ.get("DEBOUNCE_SECONDS", 1.5))  # 同一用户在此时间内连续发送的消息合并为一次AI请求，0 表示不等待
+MAX_CONCURRENT_LLM = int(os.environ.get("MAX_CONCURRENT_LLM", 4))  # 同时进行的AI请求数上限
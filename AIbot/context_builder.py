@@ -0,0 +1,150 @@
+"""
+上下文构建，按token预算从最新消息开始挑选历史消息，可选地用滚动摘要替代更早的对话
+"""
+import re
+from functools import lru_cache
+from typing import Dict, List, Set, Tuple
+
+from . import log
+from .config import CONTEXT_SUMMARY, CONTEXT_SUMMARY_TOKENS, CONTEXT_TOKEN_BUDGET
+
+# 中日韩文字与全角符号，大约每字0.6个token；其他字符大约每4个字符1个token
+CJK_PATTERN = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uff00-\uffef]")
+MESSAGE_OVERHEAD_TOKENS = 4  # 每条消息的角色等格式开销
+SUMMARY_MIN_NEW = 6  # 至少有这么多条新消息超出预算时才重新生成摘要
+
+SUMMARY_PROMPT = "请将下面的对话整理为简洁的摘要，保留用户的关键信息、偏好和未解决的问题，不超过200字。"
+
+
+@lru_cache(maxsize=16384)
+def estimate_tokens(text: str) -> int:
+    """
+    用本地启发式规则估算文本的token数，结果按文本缓存
+    参数：text: 文本
+    返回：估算的token数
+    """
+    other = len(CJK_PATTERN.sub("", text))
+    cjk = len(text) - other
+    return int(cjk * 0.6 + other / 4) + 1
+
+
+def message_tokens(message: Dict[str, str]) -> int:
+    """
+    估算一条消息的token数
+    """
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+class ContextBuilder:
+    """上下文构建器，负责在token预算内挑选历史消息，并维护每个用户的滚动摘要。"""
+
+    def __init__(self, token_budget: int, summary_enabled: bool = False):
+        """
+        初始化上下文构建器
+        参数：
+            token_budget: 一次请求的token预算（包含系统提示词）
+            summary_enabled: 是否用摘要替代超出预算的早期对话
+        """
+        self.token_budget = token_budget
+        self.summary_enabled = summary_enabled
+        self.summaries: Dict[str, Tuple[Tuple[str, str], str]] = {}  # wxid -> (摘要覆盖的最后一条消息, 摘要)
+        self.summarizing: Set[str] = set()  # 正在生成摘要的用户
+
+    def build(
+        self, wxid: str, prompt: str, history: List[Dict[str, str]]
+    ) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+        """
+        从最新的消息开始，在预算内挑选历史消息；最新一条消息总会被保留
+        参数：
+            wxid: 用户ID
+            prompt: 系统提示词
+            history: 完整的历史消息，从旧到新
+        返回：(发送给模型的消息列表, 因超出预算未被选中的早期消息)
+        """
+        budget = self.token_budget - estimate_tokens(prompt) - MESSAGE_OVERHEAD_TOKENS
+        summary = self.summaries.get(wxid) if self.summary_enabled else None
+        if summary is not None:
+            budget -= CONTEXT_SUMMARY_TOKENS
+
+        selected = []
+        used = 0
+        for message in reversed(history):
+            tokens = message_tokens(message)
+            if selected and used + tokens > budget:
+                break
+            selected.append(message)
+            used += tokens
+        selected.reverse()
+        dropped = history[:len(history) - len(selected)]
+
+        if dropped and summary is not None:
+            selected.insert(0, {"role": "system", "content": f"之前对话的摘要：{summary[1]}"})
+        return selected, dropped
+
+    def _unsummarized(self, wxid: str, dropped: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """
+        被丢弃的消息中还没有被摘要覆盖的部分
+        """
+        summary = self.summaries.get(wxid)
+        if summary is None:
+            return dropped
+        keys = [self._key(message) for message in dropped]
+        if summary[0] not in keys:
+            return dropped
+        return dropped[len(keys) - keys[::-1].index(summary[0]):]
+
+    def need_summary(self, wxid: str, dropped: List[Dict[str, str]]) -> bool:
+        """
+        判断是否需要更新摘要：有足够多的新消息超出预算，或还没有摘要
+        """
+        if not self.summary_enabled or not dropped or wxid in self.summarizing:
+            return False
+        if wxid not in self.summaries:
+            return True
+        return len(self._unsummarized(wxid, dropped)) >= SUMMARY_MIN_NEW
+
+    async def update_summary(self, wxid: str, dropped: List[Dict[str, str]], client) -> None:
+        """
+        生成滚动摘要：把旧摘要和新超出预算的消息交给模型重新总结，结果缓存到下次使用
+        参数：
+            wxid: 用户ID
+            dropped: 被丢弃的早期消息
+            client: DeepSeekClient实例
+        """
+        self.summarizing.add(wxid)
+        try:
+            lines = []
+            previous = self.summaries.get(wxid)
+            if previous is not None:
+                lines.append(f"已有摘要：{previous[1]}")
+            role_names = {"user": "用户", "assistant": "助手"}
+            new_messages = self._unsummarized(wxid, dropped)
+            lines.extend(f"{role_names.get(m['role'], m['role'])}：{m['content']}" for m in new_messages)
+            summary = await client.complete(
+                SUMMARY_PROMPT,
+                [{"role": "user", "content": "\n".join(lines)}],
+                temperature=0.3,
+                max_tokens=CONTEXT_SUMMARY_TOKENS
+            )
+            self.summaries[wxid] = (self._key(dropped[-1]), summary)
+        except Exception as e:
+            log.warning("summary_failed", wxid=wxid, error=e)
+        finally:
+            self.summarizing.discard(wxid)
+
+    def clear(self, wxid: str) -> None:
+        """
+        清除用户的摘要
+        """
+        self.summaries.pop(wxid, None)
+
+    @staticmethod
+    def _key(message: Dict[str, str]) -> Tuple[str, str]:
+        """
+        消息的标识
+        """
+        return message["role"], message["content"]
+
+
+# 创建全局上下文构建器实例
+context_builder = ContextBuilder(CONTEXT_TOKEN_BUDGET, CONTEXT_SUMMARY)
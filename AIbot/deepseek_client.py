@@ -1,26 +1,62 @@
 """
 DeepSeek API客户端
 """
+import asyncio
 import json
 import time
-from typing import Dict, List, Optional, Union
+from typing import TYPE_CHECKING, AsyncGenerator, Dict, List, Optional, Set, Tuple, Union
 
-import httpx
+from . import log
+from .config import (
+    DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL, DEFAULT_PROMPT, LLM_BACKENDS, LLM_COOLDOWN, LLM_FAILURE_THRESHOLD,
+    LLM_HEDGE, LLM_HEDGE_DELAY, MAX_TOKENS, RESPONSE_CACHE, RESPONSE_CACHE_DB_FILE,
+    RESPONSE_CACHE_MAX_TEMPERATURE, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_STORE, RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_WINDOW, TEMPERATURE
+)
+from .http_client import create_client
+from .llm_router import Backend, LLMRouter, NoBackendError, RequestRejected, parse_backends, retryable_status
+from .metrics import LLM_FIRST_TOKEN, LLM_REPLIES, LLM_SECONDS
+from .response_cache import ResponseCache
 
-from .config import DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL, DEFAULT_PROMPT, MAX_TOKENS, TEMPERATURE
+if TYPE_CHECKING:
+    import httpx
+
+
+class DeepSeekError(Exception):
+    """DeepSeek API调用失败"""
+
+    def __init__(self, reply: str):
+        """
+        参数：reply: 可以直接回复给用户的错误提示
+        """
+        super().__init__(reply)
+        self.reply = reply
+
+
+class DeepSeekRequestError(DeepSeekError, RequestRejected):
+    """请求本身有问题（如上下文过长、参数错误），不换后端重试"""
 
 
 class DeepSeekClient:
     """DeepSeek API客户端，负责与DeepSeek服务交互，生成AI回复。"""
     
-    def __init__(self, api_key: str = DEEPSEEK_API_KEY, base_url: str = DEEPSEEK_BASE_URL):
+    def __init__(
+        self,
+        api_key: str = DEEPSEEK_API_KEY,
+        base_url: str = DEEPSEEK_BASE_URL,
+        cache: Optional[ResponseCache] = None,
+        router: Optional[LLMRouter] = None
+    ):
         """
         初始化DeepSeek客户端
         参数：
             api_key: DeepSeek API密钥
             base_url: DeepSeek API基础地址
+            cache: 回复缓存，为None时不缓存
+            router: 多后端路由，为None时只使用api_key与base_url对应的DeepSeek
         """
         self.api_key = api_key
+        self.cache = cache
         self.base_url = base_url
         self.default_prompt = DEFAULT_PROMPT
         self.model = "deepseek-chat"  # 使用deepseek-chat模型
@@ -28,6 +64,41 @@ class DeepSeekClient:
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"
         }
+        self.router = router if router is not None else LLMRouter(parse_backends("", api_key, base_url, self.model))
+        # 长连接池，第一次请求时创建，由机器人关闭时调用close()释放
+        self._client: Optional["httpx.AsyncClient"] = None
+
+    @property
+    def client(self) -> "httpx.AsyncClient":
+        """
+        获取共用的httpx客户端，不存在或已关闭时重新创建
+        """
+        if self._client is None or self._client.is_closed:
+            self._client = create_client(timeout=30.0)
+        return self._client
+
+    async def close(self) -> None:
+        """
+        关闭连接池
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self.cache is not None:
+            self.cache.close()
+
+    def _cache_keys(self, prompt: str, messages: List[Dict[str, str]], temperature: float) -> Dict[str, str]:
+        """
+        生成回复缓存的键，每个后端模型一个，回复按实际生成它的后端模型缓存
+        返回：模型名称 -> 缓存键，不使用缓存时为空
+        """
+        if self.cache is None or not self.cache.cacheable(temperature, messages):
+            return {}
+        prompt = prompt or self.default_prompt
+        return {
+            model: self.cache.make_key(model, prompt, messages, temperature)
+            for model in dict.fromkeys(backend.model for backend in self.router.backends)
+        }
     
     async def generate_response(
         self,
@@ -45,41 +116,246 @@ class DeepSeekClient:
             max_tokens: 最大token数
         返回：AI回复文本或错误提示
         """
-        if not self.api_key:
-            print("错误: DeepSeek API密钥未设置")
-            return "很抱歉，AI服务暂时不可用，请联系管理员设置API密钥。"
+        keys = self._cache_keys(prompt, messages, temperature)
+        if keys:
+            reply = await self.cache.get(*keys.values())
+            if reply is not None:
+                LLM_REPLIES.inc("cache")
+                return reply
+        try:
+            reply, model = await self._complete(prompt, messages, temperature, max_tokens)
+        except DeepSeekError as e:
+            LLM_REPLIES.inc("error")
+            return e.reply
+        LLM_REPLIES.inc("llm")
+        if model in keys:
+            await self.cache.put(keys[model], reply)
+        return reply
+
+    async def complete(
+        self,
+        prompt: str,
+        messages: List[Dict[str, str]],
+        temperature: float = TEMPERATURE,
+        max_tokens: int = MAX_TOKENS
+    ) -> str:
+        """
+        调用DeepSeek API生成回复，失败时抛出DeepSeekError
+        参数：
+            prompt: 系统提示词
+            messages: 聊天历史消息
+            temperature: 采样温度
+            max_tokens: 最大token数
+        返回：AI回复文本
+        """
+        return (await self._complete(prompt, messages, temperature, max_tokens))[0]
+
+    async def _complete(
+        self,
+        prompt: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int
+    ) -> Tuple[str, str]:
+        """
+        同complete，同时返回生成回复的后端模型名称
+        返回：(AI回复文本, 模型名称)
+        """
+        if not self.router.backends:
+            log.error("llm_no_api_key")
+            raise DeepSeekError("很抱歉，AI服务暂时不可用，请联系管理员设置API密钥。")
 
         # 添加系统提示词
         system_message = {"role": "system", "content": prompt or self.default_prompt}
         all_messages = [system_message] + messages
-        
+
+        try:
+            return await self.router.call(
+                lambda backend: self._post(backend, all_messages, temperature, max_tokens)
+            )
+        except NoBackendError as e:
+            log.error("llm_unavailable", error=e)
+            raise DeepSeekError("很抱歉，AI服务暂时不可用，请稍后再试。") from e
+
+    async def _post(
+        self,
+        backend: Backend,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int
+    ) -> Tuple[str, str]:
+        """
+        向一个后端发送请求，失败时抛出DeepSeekError
+        参数：
+            backend: 模型后端
+            messages: 包含系统提示词的完整消息列表
+            temperature: 采样温度
+            max_tokens: 最大token数
+        返回：(AI回复文本, 后端模型名称)
+        """
+        start = time.perf_counter()
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers=self.headers,
+            response = await self.client.post(
+                f"{backend.base_url}/chat/completions",
+                headers=backend.headers,
+                json={
+                    "model": backend.model,
+                    "messages": messages,
+                    "temperature": temperature,
+                    "max_tokens": max_tokens
+                }
+            )
+        except asyncio.CancelledError:
+            # 对冲请求中较慢的一方被取消
+            LLM_SECONDS.observe(time.perf_counter() - start, backend.name, "cancelled")
+            raise
+        except Exception as e:
+            LLM_SECONDS.observe(time.perf_counter() - start, backend.name, "error")
+            log.warning("llm_request_failed", backend=backend.name, error=e)
+            raise DeepSeekError("很抱歉，调用AI服务时出现了错误，请稍后再试。") from e
+        LLM_SECONDS.observe(time.perf_counter() - start, backend.name, "ok" if response.status_code == 200 else "error")
+
+        if response.status_code != 200:
+            log.warning("llm_bad_status", backend=backend.name, status=response.status_code, body=response.text)
+            if not retryable_status(response.status_code):
+                raise DeepSeekRequestError(f"AI服务拒绝了请求({response.status_code})。")
+            raise DeepSeekError(f"AI服务出现问题({response.status_code})，请稍后再试。")
+        try:
+            return response.json()["choices"][0]["message"]["content"], backend.model
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            log.warning("llm_bad_response", backend=backend.name, body=response.text)
+            raise DeepSeekError("AI生成回复失败，请稍后再试。") from e
+
+    async def stream_response(
+        self,
+        prompt: str,
+        messages: List[Dict[str, str]],
+        temperature: float = TEMPERATURE,
+        max_tokens: int = MAX_TOKENS
+    ) -> AsyncGenerator[str, None]:
+        """
+        以流式（SSE）方式调用DeepSeek API，逐段产出回复文本
+        参数：
+            prompt: 系统提示词
+            messages: 聊天历史消息
+            temperature: 采样温度
+            max_tokens: 最大token数
+        返回：异步生成器，产出回复的增量文本；出错且还未产出内容时产出错误提示
+        """
+        keys = self._cache_keys(prompt, messages, temperature)
+        if keys:
+            reply = await self.cache.get(*keys.values())
+            if reply is not None:
+                LLM_REPLIES.inc("cache")
+                yield reply
+                return
+
+        if not self.router.backends:
+            log.error("llm_no_api_key")
+            LLM_REPLIES.inc("error")
+            yield "很抱歉，AI服务暂时不可用，请联系管理员设置API密钥。"
+            return
+
+        system_message = {"role": "system", "content": prompt or self.default_prompt}
+        all_messages = [system_message] + messages
+        tried: Set[str] = set()
+        reply = "很抱歉，AI服务暂时不可用，请稍后再试。"  # 所有后端都失败时的提示
+
+        # 流式回复不做对冲，还没有产出内容时失败则换一个后端
+        while True:
+            backend = self.router.select(tried)
+            if backend is None:
+                LLM_REPLIES.inc("error")
+                yield reply
+                return
+            tried.add(backend.name)
+            produced = False
+            start = time.perf_counter()
+            parts = []  # 完整回复，成功时写入缓存
+            try:
+                async with self.client.stream(
+                    "POST",
+                    f"{backend.base_url}/chat/completions",
+                    headers=backend.headers,
                     json={
-                        "model": self.model,
+                        "model": backend.model,
                         "messages": all_messages,
                         "temperature": temperature,
-                        "max_tokens": max_tokens
+                        "max_tokens": max_tokens,
+                        "stream": True
                     }
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if "choices" in result and len(result["choices"]) > 0:
-                        return result["choices"][0]["message"]["content"]
-                    else:
-                        print(f"DeepSeek API返回了无效的响应: {result}")
-                        return "AI生成回复失败，请稍后再试。"
-                else:
-                    print(f"DeepSeek API调用失败，状态码: {response.status_code}，响应: {response.text}")
-                    return f"AI服务出现问题({response.status_code})，请稍后再试。"
-                    
-        except Exception as e:
-            print(f"调用DeepSeek API时出错: {e}")
-            return "很抱歉，调用AI服务时出现了错误，请稍后再试。"
+                ) as response:
+                    if response.status_code != 200:
+                        text = (await response.aread()).decode("utf-8", "replace")
+                        log.warning("llm_bad_status", backend=backend.name, status=response.status_code, body=text)
+                        LLM_SECONDS.observe(time.perf_counter() - start, backend.name, "error")
+                        if not retryable_status(response.status_code):
+                            # 请求本身有问题，换后端也一样，不计入后端失败
+                            backend.probing = False
+                            LLM_REPLIES.inc("error")
+                            yield f"AI服务拒绝了请求({response.status_code})。"
+                            return
+                        backend.record_failure(self.router.failure_threshold)
+                        reply = f"AI服务出现问题({response.status_code})，请稍后再试。"
+                        continue
+                    async for line in response.aiter_lines():
+                        # SSE格式: "data: {...}"，以"data: [DONE]"结束
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            break
+                        try:
+                            delta = json.loads(data)["choices"][0]["delta"].get("content")
+                        except (ValueError, KeyError, IndexError):
+                            log.warning("llm_bad_stream_data", backend=backend.name, data=data)
+                            continue
+                        if delta:
+                            if not produced:
+                                LLM_FIRST_TOKEN.observe(time.perf_counter() - start, backend.name)
+                            produced = True
+                            parts.append(delta)
+                            yield delta
+            except (asyncio.CancelledError, GeneratorExit):
+                backend.probing = False
+                LLM_SECONDS.observe(time.perf_counter() - start, backend.name, "cancelled")
+                raise
+            except Exception as e:
+                log.warning("llm_request_failed", backend=backend.name, error=e)
+                LLM_SECONDS.observe(time.perf_counter() - start, backend.name, "error")
+                backend.record_failure(self.router.failure_threshold)
+                if produced:
+                    LLM_REPLIES.inc("llm")
+                    return
+                reply = "很抱歉，调用AI服务时出现了错误，请稍后再试。"
+                continue
+
+            if not produced:
+                LLM_SECONDS.observe(time.perf_counter() - start, backend.name, "error")
+                backend.record_failure(self.router.failure_threshold)
+                reply = "AI生成回复失败，请稍后再试。"
+                continue
+            LLM_SECONDS.observe(time.perf_counter() - start, backend.name, "ok")
+            LLM_REPLIES.inc("llm")
+            backend.record_success(None)
+            if backend.model in keys:
+                await self.cache.put(keys[backend.model], "".join(parts))
+            return
 
 # 创建全局DeepSeek客户端实例
-deepseek_client = DeepSeekClient() 
\ No newline at end of file
+deepseek_client = DeepSeekClient(
+    cache=ResponseCache(
+        max_entries=RESPONSE_CACHE_SIZE,
+        ttl=RESPONSE_CACHE_TTL,
+        window=RESPONSE_CACHE_WINDOW,
+        max_temperature=RESPONSE_CACHE_MAX_TEMPERATURE,
+        path=RESPONSE_CACHE_DB_FILE if RESPONSE_CACHE_STORE == "sqlite" else None
+    ) if RESPONSE_CACHE else None,
+    router=LLMRouter(
+        parse_backends(LLM_BACKENDS, DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL, "deepseek-chat"),
+        hedge=LLM_HEDGE,
+        hedge_delay=LLM_HEDGE_DELAY,
+        failure_threshold=LLM_FAILURE_THRESHOLD,
+        cooldown=LLM_COOLDOWN
+    )
+)
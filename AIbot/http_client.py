@@ -0,0 +1,36 @@
+"""
+HTTP客户端工厂，为每个上游服务创建一个带长连接池的httpx客户端
+"""
+from typing import TYPE_CHECKING
+
+from . import log
+from .config import HTTP2, HTTP_KEEPALIVE_EXPIRY, HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE
+
+if TYPE_CHECKING:
+    import httpx
+
+
+def create_client(timeout: float = 30.0, **kwargs) -> "httpx.AsyncClient":
+    """
+    创建一个共用的httpx客户端，连接在请求之间复用
+    参数：
+        timeout: 默认请求超时时间（秒），单次请求可以单独指定
+        kwargs: 传给httpx.AsyncClient的其他参数
+    返回：httpx.AsyncClient实例，使用方负责在退出时调用aclose()
+    """
+    # httpx导入较慢，第一次创建客户端时再导入
+    import httpx
+
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    http2 = HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            log.warning("http2_unavailable", hint="pip install httpx[http2]")
+            http2 = False
+    return httpx.AsyncClient(timeout=timeout, limits=limits, http2=http2, **kwargs)
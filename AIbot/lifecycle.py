@@ -0,0 +1,34 @@
+"""
+AIbot生命周期管理：导入AIbot时不读写文件，也不需要事件循环；
+运行前调用startup()加载配置，退出时调用shutdown()写入剩余数据并释放连接
+"""
+import asyncio
+
+from .deepseek_client import deepseek_client
+from .session_manager import session_manager
+from .user_manager import user_manager
+
+_started = False  # 是否已经调用过startup()
+
+
+async def startup() -> None:
+    """
+    初始化全局组件，在线程池中加载用户配置，不阻塞事件循环；重复调用不会重复加载
+    """
+    global _started
+    if _started:
+        return
+    _started = True
+    if not user_manager.loaded:
+        await asyncio.to_thread(user_manager.load_config)
+
+
+async def shutdown() -> None:
+    """
+    写入剩余的会话与用户配置变更，关闭连接池和存储；可以重复调用
+    """
+    global _started
+    _started = False
+    await deepseek_client.close()
+    await session_manager.close()
+    await user_manager.close()
@@ -0,0 +1,294 @@
+"""
+多后端路由：在多个兼容OpenAI接口的模型服务之间选择后端，
+按延迟加权选择、连续失败时熔断，并在响应过慢时向另一个后端发起对冲请求
+"""
+import asyncio
+import json
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, TypeVar
+
+from . import log
+
+T = TypeVar("T")
+
+EWMA_ALPHA = 0.2  # 延迟EWMA的平滑系数
+LATENCY_SAMPLES = 100  # 计算p95使用的最近样本数
+MIN_SAMPLES = 20  # 样本数少于此值时使用默认对冲等待时间
+
+
+class NoBackendError(Exception):
+    """没有可用的后端（未配置或全部熔断）"""
+
+
+class RequestRejected(Exception):
+    """后端拒绝了请求本身（408、429以外的4xx），不计入后端失败，也不换后端重试"""
+
+
+def retryable_status(status_code: int) -> bool:
+    """
+    HTTP状态码是否说明后端有问题：5xx、408和429计入失败并换后端，其他4xx是请求本身的问题
+    """
+    return status_code >= 500 or status_code in (408, 429)
+
+
+class Backend:
+    """一个兼容OpenAI接口的模型服务，记录延迟与熔断状态。"""
+
+    def __init__(self, name: str, base_url: str, api_key: str, model: str, weight: float = 1.0):
+        """
+        参数：
+            name: 后端名称
+            base_url: API基础地址，如https://api.deepseek.com/v1
+            api_key: API密钥
+            model: 模型名称
+            weight: 选择权重
+        """
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+        self.weight = weight
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        }
+        self.ewma: Optional[float] = None  # 延迟EWMA（秒）
+        self.latencies: deque = deque(maxlen=LATENCY_SAMPLES)
+        self.failures = 0  # 连续失败次数
+        self.opened_at: Optional[float] = None  # 熔断开始时间，None表示未熔断
+        self.probing = False  # 熔断冷却后是否正在试探
+        self.requests = 0
+        self.errors = 0
+
+    def available(self, cooldown: float) -> bool:
+        """
+        是否可以发送请求：未熔断，或熔断冷却结束且没有正在进行的试探请求
+        """
+        if self.opened_at is None:
+            return True
+        return not self.probing and time.monotonic() - self.opened_at >= cooldown
+
+    def observe(self, latency: float) -> None:
+        """
+        记录一次延迟
+        """
+        self.latencies.append(latency)
+        self.ewma = latency if self.ewma is None else EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.ewma
+
+    def p95(self) -> Optional[float]:
+        """
+        最近请求延迟的p95（秒），样本不足时返回None
+        """
+        if len(self.latencies) < MIN_SAMPLES:
+            return None
+        samples = sorted(self.latencies)
+        return samples[int(len(samples) * 0.95) - 1]
+
+    def record_success(self, latency: Optional[float]) -> None:
+        """
+        请求成功，关闭熔断
+        参数：latency: 请求耗时（秒），流式请求不记录时为None
+        """
+        self.requests += 1
+        if latency is not None:
+            self.observe(latency)
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self, threshold: int) -> None:
+        """
+        请求失败，连续失败达到阈值或试探失败时熔断
+        参数：threshold: 熔断阈值
+        """
+        self.requests += 1
+        self.errors += 1
+        self.failures += 1
+        if self.probing or self.failures >= threshold:
+            if self.opened_at is None:
+                log.warning("backend_circuit_open", backend=self.name, failures=self.failures)
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+    def state(self) -> str:
+        """
+        熔断状态：closed/open/half-open
+        """
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if self.probing else "open"
+
+
+class LLMRouter:
+    """后端路由器，负责选择后端、故障转移和对冲请求。"""
+
+    def __init__(
+        self,
+        backends: List[Backend],
+        hedge: bool = True,
+        hedge_delay: float = 3.0,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0
+    ):
+        """
+        参数：
+            backends: 后端列表
+            hedge: 是否开启对冲请求，只有一个后端时无效
+            hedge_delay: 延迟样本不足时，等待多久（秒）后发起对冲请求
+            failure_threshold: 连续失败多少次后熔断
+            cooldown: 熔断后多久（秒）允许一次试探请求
+        """
+        self.backends = backends
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.hedged = 0  # 发起对冲请求的次数
+        self.hedge_wins = 0  # 对冲请求先返回的次数
+
+    def select(self, exclude: Set[str]) -> Optional[Backend]:
+        """
+        按权重/延迟EWMA加权随机选择一个可用后端，延迟越低越容易被选中
+        参数：exclude: 本次请求已经尝试过的后端名称
+        返回：后端，没有可用后端时返回None
+        """
+        candidates = [
+            backend for backend in self.backends
+            if backend.name not in exclude and backend.available(self.cooldown)
+        ]
+        if not candidates:
+            return None
+        known = [backend.ewma for backend in candidates if backend.ewma is not None]
+        # 没有延迟数据的后端按已知后端的平均延迟计算，保证能被选中
+        default = sum(known) / len(known) if known else 1.0
+        weights = [backend.weight / max(backend.ewma or default, 0.01) for backend in candidates]
+        backend = random.choices(candidates, weights)[0]
+        if backend.opened_at is not None:
+            backend.probing = True
+        return backend
+
+    def _delay(self, backend: Backend) -> float:
+        """
+        发起对冲请求前的等待时间：后端延迟的p95，样本不足时使用默认值
+        """
+        p95 = backend.p95()
+        return self.hedge_delay if p95 is None else p95
+
+    async def _attempt(self, func: Callable[[Backend], Awaitable[T]], backend: Backend) -> T:
+        """
+        向一个后端发送请求并记录结果；被取消时把已等待的时间作为延迟下限记录
+        """
+        start = time.monotonic()
+        try:
+            result = await func(backend)
+        except asyncio.CancelledError:
+            backend.observe(time.monotonic() - start)
+            backend.probing = False
+            raise
+        except RequestRejected:
+            backend.probing = False
+            raise
+        except Exception:
+            backend.record_failure(self.failure_threshold)
+            raise
+        backend.record_success(time.monotonic() - start)
+        return result
+
+    async def call(self, func: Callable[[Backend], Awaitable[T]]) -> T:
+        """
+        通过路由发送请求：失败时换一个后端重试；开启对冲时，
+        第一个后端超过p95仍未返回就同时向另一个后端发送，取先成功的结果
+        参数：func: 向指定后端发送请求的协程函数，失败时抛出异常，请求本身有问题时抛出RequestRejected
+        返回：func的返回值；所有后端都失败时抛出最后一个异常，RequestRejected直接抛出
+        """
+        tried: Set[str] = set()
+        tasks: Dict[asyncio.Task, Backend] = {}
+        last_error: Optional[BaseException] = None
+        hedge_backend: Optional[Backend] = None
+        try:
+            while True:
+                if not tasks:
+                    backend = self.select(tried)
+                    if backend is None:
+                        if last_error is not None:
+                            raise last_error
+                        raise NoBackendError("没有可用的模型后端")
+                    tried.add(backend.name)
+                    tasks[asyncio.create_task(self._attempt(func, backend))] = backend
+
+                timeout = None
+                if self.hedge and len(tasks) == 1 and len(tried) < len(self.backends):
+                    timeout = self._delay(next(iter(tasks.values())))
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # 第一个后端太慢，发起对冲请求
+                    hedge_backend = self.select(tried)
+                    if hedge_backend is not None:
+                        tried.add(hedge_backend.name)
+                        tasks[asyncio.create_task(self._attempt(func, hedge_backend))] = hedge_backend
+                        self.hedged += 1
+                        continue
+                    # 没有其他后端可用，继续等待
+                    done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    backend = tasks.pop(task)
+                    if task.exception() is None:
+                        if backend is hedge_backend:
+                            self.hedge_wins += 1
+                        return task.result()
+                    last_error = task.exception()
+                    if isinstance(last_error, RequestRejected):
+                        raise last_error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """
+        各后端的状态
+        返回：每个后端的名称、熔断状态、延迟EWMA与p95（毫秒）、请求数和失败数
+        """
+        return [
+            {
+                "name": backend.name,
+                "state": backend.state(),
+                "ewma_ms": round(backend.ewma * 1000) if backend.ewma is not None else None,
+                "p95_ms": round(backend.p95() * 1000) if backend.p95() is not None else None,
+                "requests": backend.requests,
+                "errors": backend.errors,
+            }
+            for backend in self.backends
+        ]
+
+
+def parse_backends(raw: str, api_key: Optional[str], base_url: str, model: str) -> List[Backend]:
+    """
+    解析后端配置
+    参数：
+        raw: JSON数组，每项包含name、base_url、api_key、model，可选weight；为空时只使用DeepSeek
+        api_key: DeepSeek API密钥
+        base_url: DeepSeek API基础地址
+        model: DeepSeek模型名称
+    返回：后端列表，没有API密钥的后端会被忽略
+    """
+    if not raw:
+        return [Backend("deepseek", base_url, api_key, model)] if api_key else []
+    backends = []
+    for index, item in enumerate(json.loads(raw)):
+        key = item.get("api_key", api_key)
+        name = item.get("name", f"backend{index}")
+        if not key:
+            log.warning("backend_ignored", backend=name, reason="no_api_key")
+            continue
+        backends.append(Backend(
+            name,
+            item.get("base_url", base_url),
+            key,
+            item.get("model", model),
+            float(item.get("weight", 1.0))
+        ))
+    return backends
@@ -0,0 +1,93 @@
+"""
+AIbot日志：使用标准库logging，日志为"事件 key=value ..."格式，字段同时放在record的extra中，
+日志级别未开启时不做任何字符串格式化。bot.py会把这些日志转交给loguru输出。
+"""
+import logging
+import time
+from typing import Any, Dict
+
+logger = logging.getLogger("AIbot")
+
+
+class Fields:
+    """延迟格式化的日志内容，只有日志真正输出时才拼接字符串"""
+
+    __slots__ = ("event", "fields")
+
+    def __init__(self, event: str, fields: Dict[str, Any]):
+        self.event = event
+        self.fields = fields
+
+    def __str__(self) -> str:
+        parts = [self.event]
+        for key, value in self.fields.items():
+            if isinstance(value, float):
+                value = f"{value:.1f}"
+            else:
+                value = str(value)
+                if not value or " " in value or "\n" in value:
+                    value = repr(value)
+            parts.append(f"{key}={value}")
+        return " ".join(parts)
+
+
+def log(level: int, event: str, **fields: Any) -> None:
+    """
+    输出一条结构化日志
+    参数：
+        level: 日志级别
+        event: 事件名
+        fields: 字段，只在日志输出时格式化，开销大的内容直接传对象而不是格式化好的字符串
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, "%s", Fields(event, fields), extra={"event": event, "fields": fields})
+
+
+def debug(event: str, **fields: Any) -> None:
+    """输出DEBUG级别的结构化日志"""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.log(logging.DEBUG, "%s", Fields(event, fields), extra={"event": event, "fields": fields})
+
+
+def info(event: str, **fields: Any) -> None:
+    """输出INFO级别的结构化日志"""
+    if logger.isEnabledFor(logging.INFO):
+        logger.log(logging.INFO, "%s", Fields(event, fields), extra={"event": event, "fields": fields})
+
+
+def warning(event: str, **fields: Any) -> None:
+    """输出WARNING级别的结构化日志"""
+    if logger.isEnabledFor(logging.WARNING):
+        logger.log(logging.WARNING, "%s", Fields(event, fields), extra={"event": event, "fields": fields})
+
+
+def error(event: str, **fields: Any) -> None:
+    """输出ERROR级别的结构化日志"""
+    if logger.isEnabledFor(logging.ERROR):
+        logger.log(logging.ERROR, "%s", Fields(event, fields), extra={"event": event, "fields": fields})
+
+
+class StageTimer:
+    """分阶段计时，记录一条消息在解析、命令、历史、AI、发送等阶段的耗时。"""
+
+    __slots__ = ("start", "last", "stages")
+
+    def __init__(self):
+        self.start = self.last = time.perf_counter()
+        self.stages: Dict[str, float] = {}  # 阶段名_ms -> 耗时（毫秒）
+
+    def mark(self, stage: str) -> None:
+        """
+        把上次标记到现在的时间计入指定阶段，同一阶段多次计时会累加
+        参数：stage: 阶段名
+        """
+        now = time.perf_counter()
+        key = f"{stage}_ms"
+        self.stages[key] = self.stages.get(key, 0.0) + (now - self.last) * 1000
+        self.last = now
+
+    def fields(self) -> Dict[str, float]:
+        """
+        各阶段耗时与总耗时（毫秒），作为日志字段
+        """
+        return {**self.stages, "total_ms": (time.perf_counter() - self.start) * 1000}
@@ -4,13 +4,47 @@
 import asyncio
 import json
 import re
-from typing import Dict, List, Optional, Union
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
 
+from . import log
 from .command_handler import command_handler
+from .context_builder import context_builder
+from .config import DEFAULT_PROMPT, DEBOUNCE_SECONDS, MAX_CONCURRENT_LLM, STREAM_MIN_CHUNK, STREAM_REPLY
 from .deepseek_client import deepseek_client
 from .session_manager import session_manager
 from .user_manager import user_manager
 
+# 句子/段落结束位置：换行，或中英文句末标点（可连续出现，如"？！"、"……"）
+SENTENCE_END = re.compile(r"\n+|[。！？!?；;…]+|\.(?=\s)")
+
+SendCallback = Callable[[dict], Awaitable[None]]
+
+
+async def chunk_stream(deltas: AsyncIterator[str], min_chunk: int = STREAM_MIN_CHUNK) -> AsyncIterator[str]:
+    """
+    将流式增量文本切分为句子/段落块
+    参数：
+        deltas: 增量文本的异步迭代器
+        min_chunk: 每块的最少字数，不足时继续累积到下一个句子结束处
+    返回：异步生成器，产出去除首尾空白后的文本块
+    """
+    buffer = ""
+    async for delta in deltas:
+        buffer += delta
+        # 找到最后一个满足最小长度的句子结束位置
+        cut = 0
+        for match in SENTENCE_END.finditer(buffer):
+            if match.end() >= min_chunk and match.end() < len(buffer):
+                cut = match.end()
+        if cut:
+            chunk, buffer = buffer[:cut].strip(), buffer[cut:]
+            if chunk:
+                yield chunk
+    chunk = buffer.strip()
+    if chunk:
+        yield chunk
+
 
 class MessageHandler:
     """消息处理器，负责处理私聊消息、命令和AI回复。"""
@@ -20,65 +54,70 @@ class MessageHandler:
         初始化消息处理器
         """
         self.is_processing = {}  # 用于跟踪正在处理的消息，避免重复处理
+        # 每个用户一个串行队列：待处理的(文本, 消息ID, 等待结果的future, 分阶段计时)
+        self.pending: Dict[str, List[Tuple[str, Optional[str], asyncio.Future, log.StageTimer]]] = {}
+        self.last_arrival: Dict[str, float] = {}  # 用户最后一条消息的到达时间
+        self.workers: Dict[str, asyncio.Task] = {}  # 每个用户的处理任务
+        self.llm_semaphore = asyncio.Semaphore(MAX_CONCURRENT_LLM)  # 限制同时进行的AI请求数
     
-    async def handle_message(self, message: dict) -> Optional[dict]:
+    async def handle_message(self, message: dict, send: Optional[SendCallback] = None) -> Optional[dict]:
         """
         处理收到的消息，支持命令和AI自动回复
         参数：
             message: 消息数据字典
-        返回：回复消息字典或None
+            send: 发送回复的回调，开启流式回复时AI回复会分块通过它立即发送
+        返回：回复消息字典或None（流式回复已发送时也返回None）
         """
-        # 增加调试日志，打印收到的消息内容
-        print(f"[调试] handle_message收到消息: {message}")
+        timer = log.StageTimer()
+        log.debug("message_received", message=message)
         # 提取消息类型和内容
         try:
             msg_type = message.get("type")
             detail_type = message.get("detail_type")
-            print(f"[调试] 消息类型: {msg_type}, detail_type: {detail_type}")
             if msg_type != "message" or detail_type != "private":
-                print("[调试] 非私聊消息，忽略")
+                log.debug("message_ignored", type=msg_type, detail_type=detail_type)
                 return None  # 只处理私聊消息
             
             wxid = message.get("user_id", "")
-            print(f"[调试] 用户wxid: {wxid}")
             if not wxid:
-                print("[调试] 未获取到用户wxid")
+                log.debug("message_ignored", reason="no_user_id")
                 return None
             
             # 避免重复处理同一条消息
             msg_id = message.get("message_id", "")
             if msg_id and self.is_processing.get(msg_id):
-                print(f"[调试] 消息ID {msg_id} 正在处理中，跳过")
+                log.debug("message_ignored", reason="duplicate", message_id=msg_id)
                 return None
             
             if msg_id:
                 self.is_processing[msg_id] = True
             
             content = self._extract_text_content(message)
-            print(f"[调试] 提取到的文本内容: {content}")
+            timer.mark("parse")
             if not content:
-                print("[调试] 未提取到文本内容")
+                log.debug("message_ignored", reason="no_text", wxid=wxid)
                 return None
             
             # 处理命令
             command_result = await command_handler.handle_command(wxid, content)
-            print(f"[调试] 命令处理结果: {command_result}")
+            timer.mark("command")
             if command_result is not None:
                 # 是命令，直接返回命令处理结果
+                log.info("command", wxid=wxid, **timer.fields())
                 self._clear_processing_state(msg_id)
                 return {"user_id": wxid, "detail_type": "private", "message": [{"type": "text", "data": {"text": command_result}}]}
             
             # 检查是否启用了自动回复
             if not user_manager.is_auto_reply_enabled(wxid):
-                print(f"[调试] 用户 {wxid} 未开启自动回复")
+                log.debug("message_ignored", reason="auto_reply_disabled", wxid=wxid)
                 self._clear_processing_state(msg_id)
                 return None
             
-            # 处理普通消息
-            return await self._process_ai_message(wxid, content, msg_id)
+            # 处理普通消息，进入用户的串行队列
+            return await self._enqueue_ai_message(wxid, content, msg_id, send, timer)
             
         except Exception as e:
-            print(f"处理消息时出错: {e}")
+            log.error("message_failed", error=e)
             self._clear_processing_state(msg_id if 'msg_id' in locals() else None)
             return None
     
@@ -87,50 +126,176 @@ class MessageHandler:
         提取消息中的文本内容
         """
         if "message" not in message:
-            print("[调试] 消息中无'message'字段")
             return None
             
         # 从消息段中提取文本
         text_segments = []
         for segment in message["message"]:
-            print(f"[调试] 消息段: {segment}")
             if segment.get("type") == "text" and "data" in segment and "text" in segment["data"]:
                 text_segments.append(segment["data"]["text"])
-        print(f"[调试] 提取到的所有文本段: {text_segments}")
         return "".join(text_segments) if text_segments else None
     
-    async def _process_ai_message(self, wxid: str, content: str, msg_id: Optional[str]) -> Optional[dict]:
+    async def _enqueue_ai_message(
+        self,
+        wxid: str,
+        content: str,
+        msg_id: Optional[str],
+        send: Optional[SendCallback],
+        timer: Optional[log.StageTimer] = None
+    ) -> Optional[dict]:
         """
-        处理需要AI回复的消息，调用AI生成回复
+        将消息加入用户的串行队列，防抖时间内连续到达的消息会合并为一次AI请求
+        参数：
+            wxid: 用户ID
+            content: 消息文本
+            msg_id: 消息ID
+            send: 发送回复的回调，有回调时回复由队列按顺序发送
+            timer: 分阶段计时，合并后的最后一条消息的计时会记录后续各阶段
+        返回：没有回调时，合并后的最后一条消息返回回复字典，其余返回None
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending.setdefault(wxid, []).append((content, msg_id, future, timer or log.StageTimer()))
+        self.last_arrival[wxid] = time.monotonic()
+        if wxid not in self.workers:
+            self.workers[wxid] = asyncio.create_task(self._user_worker(wxid, send))
+        return await future
+
+    async def _user_worker(self, wxid: str, send: Optional[SendCallback]) -> None:
+        """
+        用户队列的处理任务，按顺序处理合并后的消息，队列为空时退出
         """
+        batch = []
         try:
-            # 记录用户消息到会话
-            session_manager.add_message(wxid, "user", content)
-            
-            # 获取历史消息
-            history = session_manager.get_history(wxid)
-            
-            # 获取用户自定义提示词
-            custom_prompt = user_manager.get_custom_prompt(wxid)
-            
-            # 生成回复
+            while self.pending.get(wxid):
+                # 防抖：直到DEBOUNCE_SECONDS内没有新消息
+                while True:
+                    wait = self.last_arrival[wxid] + DEBOUNCE_SECONDS - time.monotonic()
+                    if wait <= 0:
+                        break
+                    await asyncio.sleep(wait)
+                batch = self.pending.pop(wxid)
+                content = "\n".join(item[0] for item in batch)
+                timer = batch[-1][3]
+                timer.mark("queue")
+                reply = None
+                try:
+                    if STREAM_REPLY and send is not None:
+                        await self._process_ai_message_stream(wxid, content, send, timer)
+                    else:
+                        reply = await self._process_ai_message(wxid, content, timer)
+                        if reply and send is not None:
+                            await send(reply)
+                            timer.mark("send")
+                            reply = None
+                    log.info("ai_reply", wxid=wxid, messages=len(batch), **timer.fields())
+                except Exception as e:
+                    log.error("ai_reply_failed", wxid=wxid, error=e)
+                for index, (_, msg_id, future, _) in enumerate(batch):
+                    self._clear_processing_state(msg_id)
+                    if not future.done():
+                        future.set_result(reply if index == len(batch) - 1 else None)
+                batch = []
+        finally:
+            self.workers.pop(wxid, None)
+            self.last_arrival.pop(wxid, None)
+            # 任务被取消时，避免调用方一直等待
+            for _, msg_id, future, _ in batch + self.pending.pop(wxid, []):
+                self._clear_processing_state(msg_id)
+                if not future.done():
+                    future.set_result(None)
+
+    async def _process_ai_message(
+        self, wxid: str, content: str, timer: Optional[log.StageTimer] = None
+    ) -> Optional[dict]:
+        """
+        处理需要AI回复的消息，调用AI生成回复
+        """
+        timer = timer or log.StageTimer()
+        # 记录用户消息到会话
+        await session_manager.add_message(wxid, "user", content)
+        
+        # 获取用户自定义提示词
+        custom_prompt = user_manager.get_custom_prompt(wxid)
+        
+        # 按token预算挑选历史消息
+        history = await self._build_context(wxid, custom_prompt)
+        timer.mark("history")
+        
+        # 生成回复
+        async with self.llm_semaphore:
+            timer.mark("llm_wait")
             reply = await deepseek_client.generate_response(custom_prompt, history)
+        timer.mark("llm")
+        
+        if reply:
+            # 记录AI回复到会话
+            await session_manager.add_message(wxid, "assistant", reply)
             
-            if reply:
-                # 记录AI回复到会话
-                session_manager.add_message(wxid, "assistant", reply)
-                
-                # 构建回复消息
-                return {
+            # 构建回复消息
+            return {
+                "user_id": wxid,
+                "detail_type": "private",
+                "message": [{"type": "text", "data": {"text": reply}}]
+            }
+        
+        return None
+    
+    async def _process_ai_message_stream(
+        self, wxid: str, content: str, send: SendCallback, timer: Optional[log.StageTimer] = None
+    ) -> None:
+        """
+        以流式方式生成AI回复，每生成完一个句子/段落块就立即发送；
+        llm与send阶段交替进行，耗时分别累加
+        """
+        timer = timer or log.StageTimer()
+        await session_manager.add_message(wxid, "user", content)
+        custom_prompt = user_manager.get_custom_prompt(wxid)
+        history = await self._build_context(wxid, custom_prompt)
+        timer.mark("history")
+
+        chunks = []
+        raw: List[str] = []  # 模型返回的原始增量，会话中记录未经切分的完整回复
+
+        async def record(deltas: AsyncIterator[str]) -> AsyncIterator[str]:
+            async for delta in deltas:
+                raw.append(delta)
+                yield delta
+
+        async with self.llm_semaphore:
+            timer.mark("llm_wait")
+            deltas = deepseek_client.stream_response(custom_prompt, history)
+            async for chunk in chunk_stream(record(deltas)):
+                timer.mark("llm")
+                if not chunks:
+                    log.debug("first_chunk", wxid=wxid, **timer.fields())
+                chunks.append(chunk)
+                await send({
                     "user_id": wxid,
                     "detail_type": "private",
-                    "message": [{"type": "text", "data": {"text": reply}}]
-                }
-            
-            return None
-        finally:
-            self._clear_processing_state(msg_id)
-    
+                    "message": [{"type": "text", "data": {"text": chunk}}]
+                })
+                timer.mark("send")
+
+        if chunks:
+            await session_manager.add_message(wxid, "assistant", "".join(raw))
+
+    async def _build_context(self, wxid: str, custom_prompt: Optional[str]) -> List[Dict[str, str]]:
+        """
+        在token预算内挑选历史消息，需要时在后台更新早期对话的摘要
+        """
+        history = await session_manager.get_history(wxid)
+        messages, dropped = context_builder.build(wxid, custom_prompt or DEFAULT_PROMPT, history)
+        if context_builder.need_summary(wxid, dropped):
+            asyncio.create_task(self._update_summary(wxid, dropped))
+        return messages
+
+    async def _update_summary(self, wxid: str, dropped: List[Dict[str, str]]) -> None:
+        """
+        生成对话摘要，与回复共用AI请求并发限制
+        """
+        async with self.llm_semaphore:
+            await context_builder.update_summary(wxid, dropped, deepseek_client)
+
     def _clear_processing_state(self, msg_id: Optional[str]) -> None:
         """
         清除消息处理状态，避免重复处理
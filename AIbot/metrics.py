@@ -0,0 +1,109 @@
+"""
+AIbot运行指标：计数器与直方图，以Prometheus文本格式输出，ws/webhook模式下在监听端口的/metrics提供。
+AIbot是独立进程，导入wechatbot_client会拖慢启动，这里只用标准库实现需要的部分，输出格式与客户端的/metrics一致。
+"""
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 20.0, 30.0, 60.0)  # 模型请求耗时分桶（秒）
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    """
+    拼接标签，extra为已格式化的附加标签
+    """
+    parts = [
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """计数器，只增不减。"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: Dict[Tuple[str, ...], float] = {}  # 标签值 -> 计数
+
+    def inc(self, *labels: str, value: float = 1) -> None:
+        """
+        增加计数
+        参数：
+            labels: 标签值，顺序与labelnames一致
+            value: 增加的数值
+        """
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def render(self) -> List[str]:
+        """
+        生成文本格式的各行
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """直方图，按分桶统计观测值的分布，以及总数与总和。"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=LLM_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self.values: Dict[Tuple[str, ...], list] = {}  # 标签值 -> [各分桶计数（不累加）..., +Inf计数, 总和]
+
+    def observe(self, value: float, *labels: str) -> None:
+        """
+        记录一次观测
+        参数：
+            value: 观测值（秒）
+            labels: 标签值，顺序与labelnames一致
+        """
+        data = self.values.get(labels)
+        if data is None:
+            data = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        data[bisect_left(self.buckets, value)] += 1
+        data[-1] += value
+
+    def render(self) -> List[str]:
+        """
+        生成文本格式的各行，分桶计数为累加值
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        bounds = [repr(float(bound)) for bound in self.buckets] + ["+Inf"]
+        for labels, data in self.values.items():
+            total = 0
+            for bound, count in zip(bounds, data):
+                total += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {total}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {data[-1]!r}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {total}")
+        return lines
+
+
+LLM_SECONDS = Histogram(
+    "aibot_llm_request_seconds", "向模型后端发送一次请求的耗时，流式请求为完整回复的耗时", ("backend", "result")
+)
+LLM_FIRST_TOKEN = Histogram("aibot_llm_first_token_seconds", "流式请求收到第一段内容的耗时", ("backend",))
+LLM_REPLIES = Counter("aibot_llm_replies_total", "AI回复的来源：cache缓存、llm模型、error错误提示", ("source",))
+
+METRICS = [LLM_SECONDS, LLM_FIRST_TOKEN, LLM_REPLIES]
+
+
+def render() -> str:
+    """
+    以Prometheus文本格式输出所有指标
+    """
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
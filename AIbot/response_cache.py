@@ -0,0 +1,206 @@
+"""
+AI回复缓存，相同的提示词和完整的消息列表直接返回之前的回复，不再请求模型。
+内存中是LRU缓存，未命中时再查sqlite，两层都有过期时间，sqlite的读写在线程池中执行。
+"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from . import log
+
+
+def normalize(text: str) -> str:
+    """
+    规范化文本：合并空白并统一大小写，"你好 "和"你好"视为相同
+    """
+    return " ".join(text.split()).casefold()
+
+
+class ResponseCache:
+    """回复缓存，键为(模型, 系统提示词, 完整的消息列表, 采样温度)的哈希。"""
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl: float = 86400,
+        window: int = 1,
+        max_temperature: float = 1.0,
+        path: Optional[Path] = None
+    ):
+        """
+        初始化回复缓存
+        参数：
+            max_entries: 内存中保留的最大条数
+            ttl: 缓存有效期（秒）
+            window: 消息列表超过该条数时不使用缓存，避免追问（如"继续"）命中其他对话的回复
+            max_temperature: 采样温度高于该值时不使用缓存，回复需要多样性
+            path: sqlite数据库文件路径，为None时只使用内存
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.window = window
+        self.max_temperature = max_temperature
+        self.path = Path(path) if path is not None else None
+        self.entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()  # 键 -> (回复, 过期时间)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()  # sqlite在线程池中读写，同一时间只有一个线程使用连接
+        # 统计
+        self.hits = 0  # 内存命中
+        self.disk_hits = 0  # sqlite命中
+        self.misses = 0
+        self.bypassed = 0  # 因温度过高或历史过长跳过缓存
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        打开数据库并建表，顺便清理过期的缓存，需要持有_lock
+        """
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, reply TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_expires ON responses(expires)")
+            self._conn.execute("DELETE FROM responses WHERE expires < ?", (time.time(),))
+            self._conn.commit()
+        return self._conn
+
+    def cacheable(self, temperature: float, messages: List[Dict[str, str]]) -> bool:
+        """
+        判断是否使用缓存：采样温度过高或历史消息超过window条时不使用，不使用时计入跳过次数
+        """
+        if temperature > self.max_temperature or len(messages) > self.window:
+            self.bypassed += 1
+            return False
+        return True
+
+    def make_key(self, model: str, prompt: str, messages: List[Dict[str, str]], temperature: float) -> str:
+        """
+        生成缓存键
+        参数：
+            model: 模型名称
+            prompt: 系统提示词
+            messages: 发送给模型的完整聊天历史
+            temperature: 采样温度
+        返回：缓存键
+        """
+        data = [
+            model,
+            normalize(prompt),
+            [(message["role"], normalize(message["content"])) for message in messages],
+            round(temperature, 2),
+        ]
+        return hashlib.sha256(json.dumps(data, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    async def get(self, *keys: str) -> Optional[str]:
+        """
+        读取缓存，先查内存再查sqlite
+        参数：keys: 候选的缓存键（如每个后端模型一个），返回第一个命中的
+        返回：缓存的回复，不存在或已过期时返回None
+        """
+        now = time.time()
+        for key in keys:
+            entry = self.entries.get(key)
+            if entry is None:
+                continue
+            if entry[1] >= now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            del self.entries[key]
+        if self.path is not None:
+            try:
+                row = await asyncio.to_thread(self._read, keys, now)
+            except sqlite3.Error as e:
+                log.warning("response_cache_read_failed", error=e)
+                row = None
+            if row is not None:
+                self._remember(*row)
+                self.disk_hits += 1
+                return row[1]
+        self.misses += 1
+        return None
+
+    def _read(self, keys: Tuple[str, ...], now: float) -> Optional[Tuple[str, str, float]]:
+        """
+        在线程池中查询sqlite
+        返回：(键, 回复, 过期时间)，没有命中时返回None
+        """
+        with self._lock:
+            conn = self._connect()
+            for key in keys:
+                row = conn.execute(
+                    "SELECT reply, expires FROM responses WHERE key = ? AND expires >= ?", (key, now)
+                ).fetchone()
+                if row is not None:
+                    return key, row[0], row[1]
+        return None
+
+    async def put(self, key: str, reply: str) -> None:
+        """
+        写入缓存，sqlite的写入在线程池中执行
+        参数：
+            key: 缓存键
+            reply: AI回复
+        """
+        expires = time.time() + self.ttl
+        self._remember(key, reply, expires)
+        if self.path is not None:
+            try:
+                await asyncio.to_thread(self._write, key, reply, expires)
+            except sqlite3.Error as e:
+                log.warning("response_cache_write_failed", error=e)
+
+    def _write(self, key: str, reply: str, expires: float) -> None:
+        """
+        在线程池中写入sqlite
+        """
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, reply, expires) VALUES (?, ?, ?)",
+                    (key, reply, expires),
+                )
+
+    def _remember(self, key: str, reply: str, expires: float) -> None:
+        """
+        写入内存缓存，超出条数时淘汰最久未使用的
+        """
+        self.entries[key] = (reply, expires)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        缓存统计
+        返回：命中、未命中、跳过次数与命中率
+        """
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "size": len(self.entries),
+        }
+
+    def close(self) -> None:
+        """
+        关闭数据库
+        """
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
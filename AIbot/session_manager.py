@@ -1,26 +1,95 @@
 """
 会话管理器，用于管理用户的对话历史
 """
+import asyncio
 import time
-from collections import defaultdict, deque
+from collections import OrderedDict, deque
 from typing import Dict, List, Optional
 
+from .config import SESSION_DB_FILE, SESSION_MAX_HISTORY, SESSION_MEMORY_MB, SESSION_STORE
+from .session_store import MemoryStore, create_store
+
+MESSAGE_OVERHEAD = 200  # 估算内存占用时每条消息的固定开销（字节）
+
 
 class SessionManager:
-    """会话管理器，负责管理每个用户的对话历史和会话超时。"""
-    
-    def __init__(self, max_history: int = 10, session_timeout: int = 1800):
+    """
+    会话管理器，负责管理每个用户的对话历史和会话超时。
+    内存中只保留最近活跃的会话（LRU），超出内存预算时淘汰最久未使用的会话，
+    被淘汰的会话需要时再从存储中读取，读取与写入存储都在工作线程中进行，不阻塞事件循环。
+    """
+
+    def __init__(
+        self,
+        max_history: int = 10,
+        session_timeout: int = 1800,
+        store: Optional[MemoryStore] = None,
+        memory_budget: int = 64 * 2**20
+    ):
         """
         初始化会话管理器
         参数：
             max_history: 每个用户保存的最大消息数
             session_timeout: 会话超时时间（秒）
+            store: 会话存储后端，默认为不持久化的内存存储
+            memory_budget: 内存中会话的总占用上限（字节），0 表示不限制
         """
         self.max_history = max_history
         self.session_timeout = session_timeout
-        self.sessions: Dict[str, Dict] = defaultdict(dict)
-    
-    def add_message(self, wxid: str, role: str, content: str) -> None:
+        self.store = store if store is not None else MemoryStore()
+        self.memory_budget = memory_budget
+        # wxid -> {"messages": deque, "last_time": float, "size": int}，按最近使用排序
+        self.sessions: "OrderedDict[str, Dict]" = OrderedDict()
+        self.memory_used = 0  # 内存中会话的估算占用（字节）
+
+    @staticmethod
+    def _message_size(message: Dict[str, str]) -> int:
+        """
+        估算一条消息的内存占用（字节）
+        """
+        return MESSAGE_OVERHEAD + len(message["content"]) * 2
+
+    async def _get_session(self, wxid: str) -> Optional[Dict]:
+        """
+        获取用户会话，内存中没有时从存储读取；会话超时时删除并返回None
+        """
+        session = self.sessions.get(wxid)
+        if session is None:
+            record = await asyncio.to_thread(self.store.load, wxid)
+            # 读取期间其他协程可能已经加载或创建了这个会话
+            session = self.sessions.get(wxid)
+        if session is None:
+            if record is None:
+                return None
+            messages, last_time = record
+            session = {
+                "messages": deque(messages, maxlen=self.max_history),
+                "last_time": last_time,
+                "size": sum(self._message_size(message) for message in messages)
+            }
+            self.sessions[wxid] = session
+            self.memory_used += session["size"]
+        else:
+            self.sessions.move_to_end(wxid)
+
+        # 访问时检查超时
+        if time.time() - session["last_time"] > self.session_timeout:
+            self.clear_history(wxid)
+            return None
+        self._evict()
+        return session
+
+    def _evict(self) -> None:
+        """
+        超出内存预算时淘汰最久未使用的会话，至少保留一个会话
+        """
+        if not self.memory_budget:
+            return
+        while self.memory_used > self.memory_budget and len(self.sessions) > 1:
+            _, session = self.sessions.popitem(last=False)
+            self.memory_used -= session["size"]
+
+    async def add_message(self, wxid: str, role: str, content: str) -> None:
         """
         添加消息到用户会话历史
         参数：
@@ -28,16 +97,29 @@ class SessionManager:
             role: 消息角色（user/assistant）
             content: 消息内容
         """
-        if wxid not in self.sessions:
-            self.sessions[wxid] = {
+        session = await self._get_session(wxid)
+        if session is None:
+            session = {
                 "messages": deque(maxlen=self.max_history),
-                "last_time": time.time()
+                "last_time": time.time(),
+                "size": 0
             }
-        
-        self.sessions[wxid]["messages"].append({"role": role, "content": content})
-        self.sessions[wxid]["last_time"] = time.time()
-    
-    def get_history(self, wxid: str, max_count: Optional[int] = None) -> List[Dict[str, str]]:
+            self.sessions[wxid] = session
+
+        messages = session["messages"]
+        if len(messages) == messages.maxlen:
+            # 最旧的消息将被挤出
+            session["size"] -= self._message_size(messages[0])
+            self.memory_used -= self._message_size(messages[0])
+        message = {"role": role, "content": content}
+        messages.append(message)
+        session["size"] += self._message_size(message)
+        self.memory_used += self._message_size(message)
+        session["last_time"] = time.time()
+        self.store.save(wxid, list(messages), session["last_time"])
+        self._evict()
+
+    async def get_history(self, wxid: str, max_count: Optional[int] = None) -> List[Dict[str, str]]:
         """
         获取用户的会话历史
         参数：
@@ -45,44 +127,60 @@ class SessionManager:
             max_count: 最大返回消息数，None为全部
         返回：消息历史列表
         """
-        if wxid not in self.sessions:
-            return []
-        
-        # 检查会话是否超时
-        if time.time() - self.sessions[wxid]["last_time"] > self.session_timeout:
-            self.clear_history(wxid)
+        session = await self._get_session(wxid)
+        if session is None:
             return []
-        
-        messages = list(self.sessions[wxid]["messages"])
+
+        messages = list(session["messages"])
         if max_count is not None and max_count > 0:
             messages = messages[-max_count:]
-        
+
         return messages
-    
+
     def clear_history(self, wxid: str) -> None:
         """
         清除指定用户的会话历史
         参数：wxid: 用户ID
         """
-        if wxid in self.sessions:
-            del self.sessions[wxid]
-    
-    def clear_expired_sessions(self) -> int:
+        session = self.sessions.pop(wxid, None)
+        if session is not None:
+            self.memory_used -= session["size"]
+        self.store.delete(wxid)
+
+    async def clear_expired_sessions(self) -> int:
         """
-        清理所有过期会话
+        清理过期会话：内存中从最久未使用的一端清理，遇到未过期的会话即停止；
+        存储中的过期会话按最后活跃时间索引删除
         返回：清理的会话数量
         """
-        current_time = time.time()
-        expired_wxids = [
-            wxid for wxid, session in self.sessions.items()
-            if current_time - session["last_time"] > self.session_timeout
-        ]
-        
-        for wxid in expired_wxids:
-            self.clear_history(wxid)
-        
-        return len(expired_wxids)
+        before = time.time() - self.session_timeout
+        count = 0
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if session["last_time"] >= before:
+                break
+            self.sessions.popitem(last=False)
+            self.memory_used -= session["size"]
+            count += 1
+        # 内存与存储中的会话大多重复，取较大值
+        return max(count, await asyncio.to_thread(self.store.delete_expired, before))
+
+    async def flush(self) -> None:
+        """
+        将会话变更批量写入存储
+        """
+        await asyncio.to_thread(self.store.flush)
+
+    async def close(self) -> None:
+        """
+        写入剩余的会话变更并关闭存储
+        """
+        await asyncio.to_thread(self.store.close)
 
 
 # 创建全局会话管理器实例
-session_manager = SessionManager() 
\ No newline at end of file
+session_manager = SessionManager(
+    max_history=SESSION_MAX_HISTORY,
+    store=create_store(SESSION_STORE, SESSION_DB_FILE),
+    memory_budget=int(SESSION_MEMORY_MB * 2**20)
+)
@@ -0,0 +1,177 @@
+"""
+会话存储后端，SessionManager的持久层
+"""
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+SessionRecord = Tuple[List[Dict[str, str]], float]  # (消息列表, 最后活跃时间)
+
+
+class MemoryStore:
+    """内存存储，不做持久化，重启后会话丢失。"""
+
+    def load(self, wxid: str) -> Optional[SessionRecord]:
+        """
+        读取用户会话
+        参数：wxid: 用户ID
+        返回：(消息列表, 最后活跃时间)，不存在时返回None
+        """
+        return None
+
+    def save(self, wxid: str, messages: List[Dict[str, str]], last_time: float) -> None:
+        """
+        保存用户会话
+        参数：
+            wxid: 用户ID
+            messages: 消息列表
+            last_time: 最后活跃时间
+        """
+
+    def delete(self, wxid: str) -> None:
+        """
+        删除用户会话
+        参数：wxid: 用户ID
+        """
+
+    def delete_expired(self, before: float) -> int:
+        """
+        删除最后活跃时间早于before的会话
+        返回：删除的会话数量
+        """
+        return 0
+
+    def flush(self) -> None:
+        """
+        将待写入的会话写入存储
+        """
+
+    def close(self) -> None:
+        """
+        写入剩余数据并关闭存储
+        """
+
+
+class SqliteStore(MemoryStore):
+    """
+    sqlite存储，使用WAL模式；保存操作先进入待写入表，由flush()在一个事务中批量写入。
+    读取时优先使用待写入的数据，所以内存前端可以随时淘汰会话。
+    load/delete_expired/flush/close可以在工作线程中调用：数据库连接由_lock保护，
+    待写入表由_dirty_lock保护，_dirty_lock不会在读写数据库期间持有，事件循环中的save/delete不会被阻塞。
+    """
+
+    def __init__(self, path: Path):
+        """
+        初始化sqlite存储，数据库在第一次使用时打开
+        参数：path: 数据库文件路径
+        """
+        self.path = Path(path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._dirty: Dict[str, Optional[SessionRecord]] = {}  # 待写入的会话，None表示待删除
+        self._lock = threading.Lock()  # 保护数据库连接，flush取出待写入表到提交完成期间不能读取
+        self._dirty_lock = threading.Lock()  # 保护待写入表，先获取_lock再获取_dirty_lock
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        打开数据库并建表
+        """
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "wxid TEXT PRIMARY KEY, messages TEXT NOT NULL, last_time REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_time ON sessions(last_time)")
+            self._conn.commit()
+        return self._conn
+
+    def load(self, wxid: str) -> Optional[SessionRecord]:
+        with self._lock:
+            with self._dirty_lock:
+                if wxid in self._dirty:
+                    return self._dirty[wxid]
+            row = self._connect().execute(
+                "SELECT messages, last_time FROM sessions WHERE wxid = ?", (wxid,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def save(self, wxid: str, messages: List[Dict[str, str]], last_time: float) -> None:
+        record = (list(messages), last_time)
+        with self._dirty_lock:
+            self._dirty[wxid] = record
+
+    def delete(self, wxid: str) -> None:
+        with self._dirty_lock:
+            self._dirty[wxid] = None
+
+    def delete_expired(self, before: float) -> int:
+        with self._lock:
+            with self._dirty_lock:
+                for wxid, record in self._dirty.items():
+                    if record is not None and record[1] < before:
+                        self._dirty[wxid] = None
+            conn = self._connect()
+            with conn:
+                count = conn.execute("DELETE FROM sessions WHERE last_time < ?", (before,)).rowcount
+        return count
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        """
+        批量写入待写入表，调用方持有锁
+        """
+        with self._dirty_lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, {}
+        upserts = [
+            (wxid, json.dumps(record[0], ensure_ascii=False), record[1])
+            for wxid, record in dirty.items()
+            if record is not None
+        ]
+        deletes = [(wxid,) for wxid, record in dirty.items() if record is None]
+        try:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO sessions (wxid, messages, last_time) VALUES (?, ?, ?) "
+                    "ON CONFLICT(wxid) DO UPDATE SET messages = excluded.messages, last_time = excluded.last_time",
+                    upserts,
+                )
+                conn.executemany("DELETE FROM sessions WHERE wxid = ?", deletes)
+        except Exception:
+            # 写入失败时放回待写入表，期间产生的新数据优先
+            with self._dirty_lock:
+                for wxid, record in dirty.items():
+                    self._dirty.setdefault(wxid, record)
+            raise
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def create_store(kind: str, path: Path) -> MemoryStore:
+    """
+    根据配置创建会话存储
+    参数：
+        kind: 存储类型，sqlite/memory
+        path: sqlite数据库文件路径
+    返回：存储实例
+    """
+    if kind == "sqlite":
+        return SqliteStore(path)
+    return MemoryStore()
@@ -0,0 +1,258 @@
+"""
+推送式事件传输，替代get_latest_events轮询：
+ - 反向WebSocket服务端：ComWeChat客户端连接过来推送事件，action通过同一连接发回，用echo对应响应
+ - webhook接收端：ComWeChat客户端POST推送事件，action仍通过HTTP接口调用
+websockets、fastapi与uvicorn导入较慢，只在对应的传输方式启动时导入
+两种方式都在监听端口的GET /metrics提供运行指标
+"""
+import asyncio
+import contextlib
+import json
+from http import HTTPStatus
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Union
+from uuid import uuid4
+
+from . import log, metrics
+
+EventCallback = Callable[[Dict], Awaitable[None]]
+
+
+def _check_token(authorization: Optional[str], access_token: Optional[str]) -> bool:
+    """
+    校验Authorization请求头
+    参数：
+        authorization: 请求头的值
+        access_token: 配置的访问令牌，为空时不校验
+    返回：是否通过
+    """
+    if not access_token:
+        return True
+    return authorization == f"Bearer {access_token}"
+
+
+class WebSocketServer:
+    """反向WebSocket服务端，事件由客户端推送，action通过同一连接发回。"""
+
+    def __init__(self, host: str, port: int, access_token: Optional[str], on_event: EventCallback):
+        """
+        初始化WebSocket服务端
+        参数：
+            host: 监听地址
+            port: 监听端口
+            access_token: 访问令牌，需与客户端配置的access_token一致
+            on_event: 收到事件时的回调
+        """
+        self.host = host
+        self.port = port
+        self.access_token = access_token
+        self.on_event = on_event
+        self.connection: Optional[Any] = None  # 当前客户端连接
+        self.pending: Dict[str, asyncio.Future] = {}  # 等待响应的action，键为echo
+        self._server = None
+
+    @property
+    def connected(self) -> bool:
+        """是否有客户端连接，可以通过连接发送action"""
+        return self.connection is not None
+
+    async def start(self) -> None:
+        """
+        开始监听
+        """
+        import websockets
+
+        self._server = await websockets.serve(
+            self._handler, self.host, self.port, max_size=None, process_request=self._process_request
+        )
+        log.info("transport_started", transport="ws", url=f"ws://{self.host}:{self.port}/")
+
+    async def stop(self) -> None:
+        """
+        关闭服务端和所有连接
+        """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def call_api(self, action: str, params: Dict[str, Any], timeout: float = 30.0) -> Dict:
+        """
+        通过WebSocket连接调用action，用echo字段对应响应
+        参数：
+            action: 动作名称
+            params: 参数字典
+            timeout: 等待响应的超时时间（秒）
+        返回：action响应字典
+        """
+        connection = self.connection
+        if connection is None:
+            raise ConnectionError("没有可用的WebSocket连接")
+        echo = uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self.pending[echo] = future
+        try:
+            await connection.send(json.dumps({"action": action, "params": params, "echo": echo}, ensure_ascii=False))
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.pending.pop(echo, None)
+
+    async def _process_request(self, path: str, request_headers) -> Optional[Tuple[HTTPStatus, list, bytes]]:
+        """
+        握手前处理普通HTTP请求：/metrics校验访问令牌后返回运行指标，其他路径继续WebSocket握手
+        """
+        if path != "/metrics":
+            return None
+        if not _check_token(request_headers.get("Authorization"), self.access_token):
+            return HTTPStatus.FORBIDDEN, [], b"Authorization Header is invalid"
+        return HTTPStatus.OK, [("Content-Type", metrics.CONTENT_TYPE)], metrics.render().encode("utf-8")
+
+    async def _handler(self, websocket, path: str = "/") -> None:
+        """
+        处理一个客户端连接，分发事件与action响应
+        """
+        import websockets
+
+        if not _check_token(websocket.request_headers.get("Authorization"), self.access_token):
+            log.warning("ws_rejected", reason="invalid_access_token")
+            await websocket.close(1008, "Authorization Header is invalid")
+            return
+        if self.connection is not None:
+            log.warning("ws_replaced")
+        self.connection = websocket
+        log.info("ws_connected", remote=websocket.remote_address)
+        try:
+            async for data in websocket:
+                try:
+                    frame = json.loads(data)
+                except ValueError:
+                    log.warning("ws_bad_frame", data=data[:200])
+                    continue
+                if not isinstance(frame, dict):
+                    continue
+                echo = frame.get("echo")
+                if echo is not None:
+                    # action响应
+                    future = self.pending.get(echo)
+                    if future is not None and not future.done():
+                        future.set_result(frame)
+                else:
+                    asyncio.create_task(self.on_event(frame))
+        except websockets.ConnectionClosed as e:
+            log.info("ws_disconnected", reason=e)
+        finally:
+            if self.connection is websocket:
+                self.connection = None
+                for future in self.pending.values():
+                    if not future.done():
+                        future.set_exception(ConnectionError("WebSocket连接已断开"))
+
+
+class WebhookReceiver:
+    """webhook接收端，事件由客户端POST推送；webhook不能回传action，action仍走HTTP接口。"""
+
+    def __init__(self, host: str, port: int, access_token: Optional[str], on_event: EventCallback):
+        """
+        初始化webhook接收端
+        参数：
+            host: 监听地址
+            port: 监听端口
+            access_token: 访问令牌，需与客户端配置的access_token一致
+            on_event: 收到事件时的回调
+        """
+        self.host = host
+        self.port = port
+        self.access_token = access_token
+        self.on_event = on_event
+        self.app = None
+        self._server = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def connected(self) -> bool:
+        """webhook无法回传action，始终为False"""
+        return False
+
+    async def start(self) -> None:
+        """
+        开始监听
+        """
+        import uvicorn
+        from fastapi import FastAPI, Request, Response
+
+        async def receive(request: Request) -> Response:
+            status_code, content = await self._receive(request)
+            return Response(status_code=status_code, content=content)
+
+        async def metrics_endpoint(request: Request) -> Response:
+            if not _check_token(request.headers.get("Authorization"), self.access_token):
+                return Response(status_code=403, content="Authorization Header is invalid")
+            return Response(content=metrics.render(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+        self.app = FastAPI()
+        self.app.add_api_route("/metrics", metrics_endpoint, methods=["GET"])
+        self.app.add_api_route("/{path:path}", receive, methods=["POST"])
+        config = uvicorn.Config(self.app, host=self.host, port=self.port, log_level="warning")
+        self._server = uvicorn.Server(config)
+        # 信号由机器人主程序处理
+        self._server.install_signal_handlers = lambda: None
+        self._task = asyncio.create_task(self._server.serve())
+        while not self._server.started:
+            if self._task.done():
+                # 启动失败，抛出异常
+                self._task.result()
+                raise RuntimeError("webhook接收端启动失败")
+            await asyncio.sleep(0.05)
+        log.info("transport_started", transport="webhook", url=f"http://{self.host}:{self.port}/")
+
+    async def stop(self) -> None:
+        """
+        关闭接收端
+        """
+        if self._server is not None:
+            self._server.should_exit = True
+        if self._task is not None:
+            with contextlib.suppress(Exception):
+                await self._task
+        self._server = None
+        self._task = None
+
+    async def call_api(self, action: str, params: Dict[str, Any], timeout: float = 30.0) -> Dict:
+        """webhook不支持回传action"""
+        raise ConnectionError("webhook接收端不能发送action")
+
+    async def _receive(self, request) -> Tuple[int, Optional[str]]:
+        """
+        接收推送的事件，支持单个事件或批量上报的事件数组
+        返回：(状态码, 响应内容)
+        """
+        if not _check_token(request.headers.get("Authorization"), self.access_token):
+            return 403, "Authorization Header is invalid"
+        try:
+            data = json.loads(await request.body())
+        except ValueError:
+            return 400, None
+        events = data if isinstance(data, list) else [data]
+        for event in events:
+            if isinstance(event, dict):
+                asyncio.create_task(self.on_event(event))
+        return 204, None
+
+
+def create_transport(
+    transport: str, host: str, port: int, access_token: Optional[str], on_event: EventCallback
+) -> Optional[Union[WebSocketServer, WebhookReceiver]]:
+    """
+    根据配置创建推送传输
+    参数：
+        transport: 传输方式，ws/webhook/poll
+        host: 监听地址
+        port: 监听端口
+        access_token: 访问令牌
+        on_event: 收到事件时的回调
+    返回：WebSocketServer或WebhookReceiver实例，轮询模式返回None
+    """
+    if transport == "ws":
+        return WebSocketServer(host, port, access_token, on_event)
+    if transport == "webhook":
+        return WebhookReceiver(host, port, access_token, on_event)
+    return None
@@ -1,46 +1,64 @@
 """
 用户管理器，用于管理用户的自动回复设置
 """
-import json
+import asyncio
+import contextlib
 import os
-from pathlib import Path
 from typing import Dict, List, Optional, Set
-import asyncio
-import httpx
 
-from .config import USER_CONFIG_FILE, DEFAULT_ENABLED_USERS, BOT_NAME, BOT_DESCRIPTION, LOG_LEVEL, DEFAULT_PROMPT, MAX_TOKENS, TEMPERATURE, DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL
+from . import log
+from .config import USER_CONFIG_FILE, USER_DB_FILE, USER_FLUSH_DELAY, USER_STORE, DEFAULT_ENABLED_USERS, BOT_NAME, BOT_DESCRIPTION, LOG_LEVEL, DEFAULT_PROMPT, MAX_TOKENS, TEMPERATURE, DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL
+from .user_store import JsonUserStore, build_rows, create_user_store
 
 # 新增：读取OneBot API地址
 ONEBOT_API_URL = os.environ.get("ONEBOT_API_URL", "http://127.0.0.1:8000")
 ONEBOT_ACCESS_TOKEN = os.environ.get("ONEBOT_ACCESS_TOKEN", "")
 
 class UserManager:
-    """用户管理器，负责管理用户的自动回复开关和个性化提示词。"""
+    """
+    用户管理器，负责管理用户的自动回复开关和个性化提示词。
+    配置变更只在内存中标记，延迟一段时间后合并为一次写入，写入在线程池中执行，不阻塞事件循环。
+    """
 
-    def __init__(self):
+    def __init__(self, store: Optional[JsonUserStore] = None, flush_delay: float = 1.0):
         """
-        初始化用户管理器，加载用户配置
+        初始化用户管理器，配置在startup()或第一次使用时加载
+        参数：
+            store: 用户配置存储，默认为json文件存储
+            flush_delay: 变更后延迟写入的时间（秒）
         """
         self.enabled_users: Set[str] = set()
         self.user_config: Dict[str, Dict] = {}
-        # 只加载配置，不再做微信号映射
-        asyncio.get_event_loop().run_until_complete(self.load_config_async())
+        self.store = store if store is not None else JsonUserStore(USER_CONFIG_FILE)
+        self.flush_delay = flush_delay
+        self._dirty: Set[str] = set()  # 有变更待写入的用户
+        self._changed = False  # 是否有待写入的变更
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self.loaded = False  # 配置是否已加载
 
-    async def load_config_async(self) -> None:
+    def _ensure_loaded(self) -> None:
         """
-        异步加载用户配置文件，如不存在则创建默认配置
+        没有通过startup()加载时，在第一次使用时同步加载
         """
-        if os.path.exists(USER_CONFIG_FILE):
-            try:
-                with open(USER_CONFIG_FILE, "r", encoding="utf-8") as f:
-                    config = json.load(f)
-                    self.user_config = config.get("user_config", {})
-                    self.enabled_users = set(config.get("enabled_users", []))
-            except Exception as e:
-                print(f"加载用户配置出错: {e}")
-                self.user_config = {}
-                self.enabled_users = set()
-        else:
+        if not self.loaded:
+            self.load_config()
+
+    def load_config(self) -> None:
+        """
+        加载用户配置，如不存在则创建默认配置；会读写文件，在事件循环中应通过线程池调用
+        """
+        self.loaded = True
+        try:
+            exists = self.store.exists()
+            if exists:
+                self.user_config, self.enabled_users = self.store.load()
+        except Exception as e:
+            log.error("user_config_load_failed", error=e)
+            self.user_config = {}
+            self.enabled_users = set()
+            return
+        if not exists:
             # 创建默认配置，并根据.env自动添加初始用户
             if DEFAULT_ENABLED_USERS:
                 wxids = [wxid.strip() for wxid in DEFAULT_ENABLED_USERS.split(',') if wxid.strip()]
@@ -48,37 +66,113 @@ class UserManager:
                 for wxid in wxids:
                     if wxid not in self.user_config:
                         self.user_config[wxid] = {"custom_prompt": None}
+                    self._dirty.add(wxid)
             self.save_config()
 
-    def save_config(self) -> None:
+    def save_config(self, wxid: Optional[str] = None) -> None:
+        """
+        标记配置有变更，延迟合并写入；没有运行中的事件循环时直接写入
+        参数：wxid: 有变更的用户
+        """
+        if wxid is not None:
+            self._dirty.add(wxid)
+        self._changed = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush_sync()
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self) -> None:
+        """
+        等待一段时间，把期间的变更合并写入；写入被shield保护，任务被取消时写入仍会完成
+        """
+        await asyncio.sleep(self.flush_delay)
+        await asyncio.shield(self.flush())
+
+    def _snapshot(self):
+        """
+        取出待写入的数据，json存储需要完整配置的快照，sqlite存储只需要有变更的用户
+        返回：(用户配置, 开启自动回复的用户, 数据行, 有变更的用户)
+        """
+        dirty, self._dirty = self._dirty, set()
+        self._changed = False
+        rows = build_rows(self.user_config, self.enabled_users, dirty)
+        if self.store.incremental:
+            return {}, set(), rows, dirty
+        user_config = {wxid: dict(config) for wxid, config in self.user_config.items()}
+        return user_config, set(self.enabled_users), rows, dirty
+
+    def _restore(self, dirty: Set[str]) -> None:
         """
-        保存当前用户配置到文件
+        写入失败时重新标记变更，等下次写入
         """
-        config = {
-            "user_config": self.user_config,
-            "enabled_users": list(self.enabled_users)
-        }
-        os.makedirs(os.path.dirname(USER_CONFIG_FILE), exist_ok=True)
-        with open(USER_CONFIG_FILE, "w", encoding="utf-8") as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
+        self._dirty |= dirty
+        self._changed = True
+
+    async def flush(self) -> None:
+        """
+        把待写入的变更写入存储，写入在线程池中执行，同一时间只有一个写入
+        """
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._changed:
+                return
+            user_config, enabled_users, rows, dirty = self._snapshot()
+            try:
+                await asyncio.to_thread(self.store.write, user_config, enabled_users, rows)
+            except Exception as e:
+                log.error("user_config_save_failed", error=e)
+                self._restore(dirty)
+
+    def flush_sync(self) -> None:
+        """
+        同步写入待写入的变更，用于没有事件循环时
+        """
+        if not self._changed:
+            return
+        user_config, enabled_users, rows, dirty = self._snapshot()
+        try:
+            self.store.write(user_config, enabled_users, rows)
+        except Exception as e:
+            log.error("user_config_save_failed", error=e)
+            self._restore(dirty)
+
+    async def close(self) -> None:
+        """
+        写入剩余的变更并关闭存储
+        """
+        task, self._flush_task = self._flush_task, None
+        if task is not None and not task.done():
+            # 还在等待的写入直接取消；已经开始的写入持有_flush_lock，下面的flush会等它完成
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        await self.flush()
+        self.store.close()
 
     def enable_auto_reply(self, wxid: str) -> bool:
         """
         开启指定用户的自动回复功能
         """
+        self._ensure_loaded()
         self.enabled_users.add(wxid)
         if wxid not in self.user_config:
             self.user_config[wxid] = {"custom_prompt": None}
-        self.save_config()
+        self.save_config(wxid)
         return True
 
     def disable_auto_reply(self, wxid: str) -> bool:
         """
         关闭指定用户的自动回复功能
         """
+        self._ensure_loaded()
         if wxid in self.enabled_users:
             self.enabled_users.remove(wxid)
-            self.save_config()
+            self.save_config(wxid)
             return True
         return False
 
@@ -86,31 +180,38 @@ class UserManager:
         """
         检查用户是否已开启自动回复
         """
+        self._ensure_loaded()
         return wxid in self.enabled_users
     
     def get_all_enabled_users(self) -> List[str]:
         """
         获取所有已开启自动回复的用户列表
         """
+        self._ensure_loaded()
         return list(self.enabled_users)
     
     def set_custom_prompt(self, wxid: str, prompt: str) -> None:
         """
         设置用户的个性化提示词
         """
+        self._ensure_loaded()
         if wxid not in self.user_config:
             self.user_config[wxid] = {}
         self.user_config[wxid]["custom_prompt"] = prompt
-        self.save_config()
+        self.save_config(wxid)
     
     def get_custom_prompt(self, wxid: str) -> Optional[str]:
         """
         获取用户的个性化提示词
         """
+        self._ensure_loaded()
         if wxid in self.user_config and "custom_prompt" in self.user_config[wxid]:
             return self.user_config[wxid]["custom_prompt"]
         return None
 
 
 # 创建全局用户管理器实例
-user_manager = UserManager() 
\ No newline at end of file
+user_manager = UserManager(
+    store=create_user_store(USER_STORE, USER_CONFIG_FILE, USER_DB_FILE),
+    flush_delay=USER_FLUSH_DELAY
+)
@@ -0,0 +1,152 @@
+"""
+用户配置存储后端，UserManager的持久层
+"""
+import json
+import os
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from . import log
+
+UserRow = Tuple[str, bool, Optional[str]]  # (wxid, 是否开启自动回复, 个性化提示词)
+
+
+def build_rows(user_config: Dict[str, Dict], enabled_users: Set[str], wxids: Iterable[str]) -> List[UserRow]:
+    """
+    生成指定用户的数据行
+    参数：
+        user_config: 用户配置
+        enabled_users: 开启自动回复的用户
+        wxids: 需要生成的用户
+    返回：数据行列表
+    """
+    return [
+        (wxid, wxid in enabled_users, user_config.get(wxid, {}).get("custom_prompt"))
+        for wxid in wxids
+    ]
+
+
+class JsonUserStore:
+    """json文件存储，每次写入完整配置，先写临时文件再原子替换，避免写到一半时文件损坏。"""
+
+    incremental = False  # 是否只写入有变更的用户
+
+    def __init__(self, path: Path):
+        """
+        参数：path: 配置文件路径
+        """
+        self.path = Path(path)
+
+    def exists(self) -> bool:
+        """
+        存储中是否已有配置
+        """
+        return self.path.exists()
+
+    def load(self) -> Tuple[Dict[str, Dict], Set[str]]:
+        """
+        读取用户配置
+        返回：(用户配置, 开启自动回复的用户)
+        """
+        with open(self.path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        return config.get("user_config", {}), set(config.get("enabled_users", []))
+
+    def write(self, user_config: Dict[str, Dict], enabled_users: Set[str], rows: Iterable[UserRow]) -> None:
+        """
+        写入用户配置，可能在线程池中执行，参数需要是快照
+        参数：
+            user_config: 用户配置快照，增量存储不使用
+            enabled_users: 开启自动回复的用户快照，增量存储不使用
+            rows: 有变更的用户，json存储不使用
+        """
+        config = {"user_config": user_config, "enabled_users": list(enabled_users)}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(config, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def close(self) -> None:
+        """
+        关闭存储
+        """
+
+
+class SqliteUserStore(JsonUserStore):
+    """sqlite存储，只写入有变更的用户，配置很多时写入量与变更数成正比。"""
+
+    incremental = True
+
+    def __init__(self, path: Path, json_path: Optional[Path] = None):
+        """
+        参数：
+            path: 数据库文件路径
+            json_path: 旧的json配置文件，数据库为空时从这里导入
+        """
+        super().__init__(path)
+        self.json_path = json_path
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        打开数据库并建表，写入在线程池中执行，同一时间只有一个写入
+        """
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS users ("
+                "wxid TEXT PRIMARY KEY, enabled INTEGER NOT NULL, custom_prompt TEXT)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def exists(self) -> bool:
+        if self._connect().execute("SELECT 1 FROM users LIMIT 1").fetchone() is not None:
+            return True
+        return self.json_path is not None and self.json_path.exists()
+
+    def load(self) -> Tuple[Dict[str, Dict], Set[str]]:
+        rows = self._connect().execute("SELECT wxid, enabled, custom_prompt FROM users").fetchall()
+        if not rows and self.json_path is not None and self.json_path.exists():
+            # 从json配置导入
+            user_config, enabled_users = JsonUserStore(self.json_path).load()
+            self.write(user_config, enabled_users, build_rows(user_config, enabled_users, set(user_config) | enabled_users))
+            log.info("user_config_imported", source=self.json_path, users=len(user_config))
+            return user_config, enabled_users
+        user_config = {wxid: {"custom_prompt": prompt} for wxid, _, prompt in rows}
+        enabled_users = {wxid for wxid, enabled, _ in rows if enabled}
+        return user_config, enabled_users
+
+    def write(self, user_config: Dict[str, Dict], enabled_users: Set[str], rows: Iterable[UserRow]) -> None:
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO users (wxid, enabled, custom_prompt) VALUES (?, ?, ?) "
+                "ON CONFLICT(wxid) DO UPDATE SET enabled = excluded.enabled, custom_prompt = excluded.custom_prompt",
+                [(wxid, int(enabled), prompt) for wxid, enabled, prompt in rows],
+            )
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def create_user_store(kind: str, json_path: Path, db_path: Path) -> JsonUserStore:
+    """
+    根据配置创建用户配置存储
+    参数：
+        kind: 存储类型，json/sqlite
+        json_path: json配置文件路径
+        db_path: sqlite数据库文件路径
+    返回：存储实例
+    """
+    if kind == "sqlite":
+        return SqliteUserStore(db_path, json_path)
+    return JsonUserStore(json_path)
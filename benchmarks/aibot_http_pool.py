@@ -0,0 +1,119 @@
+"""
+AIbot连接池基准测试
+
+在本地启动一个兼容OpenAI接口的模拟服务，对比每次请求新建`httpx.AsyncClient`
+与`DeepSeekClient`共用长连接池时的吞吐量(req/s)与p50延迟。
+
+运行: python benchmarks/aibot_http_pool.py
+"""
+import asyncio
+import socket
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+
+ROOT_PATH = str(Path(__file__).parent.parent.absolute())
+if ROOT_PATH not in sys.path:
+    sys.path.insert(0, ROOT_PATH)
+
+from AIbot.deepseek_client import DeepSeekClient  # noqa: E402
+
+REQUESTS = 500
+"""每组测试的请求数"""
+CONCURRENCY = (1, 8, 32)
+"""并发数"""
+
+app = FastAPI()
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(body: dict) -> dict:
+    """模拟的chat completions接口，直接返回固定回复"""
+    return {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion",
+        "model": body.get("model"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": "你好，有什么可以帮你？"},
+                "finish_reason": "stop",
+            }
+        ],
+    }
+
+
+def start_server() -> str:
+    """在后台线程启动模拟服务，返回base_url"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/v1"
+
+
+async def per_request(client: DeepSeekClient, messages: list) -> None:
+    """改动前的做法：每次请求新建客户端"""
+    async with httpx.AsyncClient(timeout=30.0) as http:
+        response = await http.post(
+            f"{client.base_url}/chat/completions",
+            headers=client.headers,
+            json={"model": client.model, "messages": messages},
+        )
+        response.json()["choices"][0]["message"]["content"]
+
+
+async def pooled(client: DeepSeekClient, messages: list) -> None:
+    """改动后的做法：共用连接池"""
+    await client.generate_response("", messages)
+
+
+async def run(func, client: DeepSeekClient, concurrency: int) -> tuple[float, float]:
+    """按并发数发起请求，返回(req/s, p50毫秒)"""
+    messages = [{"role": "user", "content": "你好"}]
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one() -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            await func(client, messages)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(REQUESTS)))
+    elapsed = time.perf_counter() - start
+    return REQUESTS / elapsed, statistics.median(latencies) * 1000
+
+
+async def main() -> None:
+    base_url = start_server()
+    client = DeepSeekClient(api_key="bench", base_url=base_url)
+    # 预热
+    await run(pooled, client, 4)
+    print(
+        f"{'concurrency':>11} {'new client(req/s)':>18} {'p50(ms)':>8} "
+        f"{'pooled(req/s)':>14} {'p50(ms)':>8} {'speedup':>8}"
+    )
+    for concurrency in CONCURRENCY:
+        old_rps, old_p50 = await run(per_request, client, concurrency)
+        new_rps, new_p50 = await run(pooled, client, concurrency)
+        print(
+            f"{concurrency:>11} {old_rps:>18.0f} {old_p50:>8.2f} "
+            f"{new_rps:>14.0f} {new_p50:>8.2f} {new_rps / old_rps:>7.1f}x"
+        )
+    await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
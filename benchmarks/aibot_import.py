@@ -0,0 +1,73 @@
+"""
+AIbot冷启动基准测试
+
+在新的解释器中多次执行`import AIbot`，统计导入耗时的中位数，
+并检查导入过程没有加载较慢的依赖、没有创建数据文件。
+超出预算时以非零状态退出，可以放进CI中防止导入变慢。
+
+运行: python benchmarks/aibot_import.py
+"""
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).parent.parent.absolute()
+
+ROUNDS = 10
+"""测试次数"""
+BUDGET_MS = 150.0
+"""导入耗时预算(ms)，中位数超出时失败"""
+HEAVY_MODULES = ("httpx", "fastapi", "uvicorn", "websockets", "loguru")
+"""导入AIbot时不应加载的模块"""
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import AIbot
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({"ms": elapsed, "modules": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def measure() -> dict:
+    """在新的解释器中导入一次AIbot"""
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT],
+        cwd=ROOT_PATH,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> int:
+    data_dir = ROOT_PATH / "AIbot" / "data"
+    data_existed = data_dir.exists()
+    # 预热，让.pyc写入磁盘
+    measure()
+    results = [measure() for _ in range(ROUNDS)]
+    times = [result["ms"] for result in results]
+    median = statistics.median(times)
+    loaded = sorted({module for result in results for module in result["modules"]})
+    print(f"import AIbot: median {median:.1f}ms, min {min(times):.1f}ms, max {max(times):.1f}ms (budget {BUDGET_MS:.0f}ms)")
+
+    failed = False
+    if median > BUDGET_MS:
+        print("FAIL: 导入耗时超出预算")
+        failed = True
+    if loaded:
+        print(f"FAIL: 导入时加载了较慢的模块: {', '.join(loaded)}")
+        failed = True
+    if not data_existed and data_dir.exists():
+        print(f"FAIL: 导入时创建了 {data_dir}")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
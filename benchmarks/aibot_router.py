@@ -0,0 +1,134 @@
+"""
+AIbot多后端路由基准测试
+
+在本地启动三个兼容OpenAI接口的模拟服务：
+ - spiky: 通常100ms返回，10%的请求会卡住2秒
+ - steady: 稳定150ms返回
+ - broken: 始终返回503
+对比只用spiky、路由不对冲、路由加对冲三种方式的p50/p95/p99延迟与失败数，
+并检查broken后端被熔断。
+
+运行: python benchmarks/aibot_router.py
+"""
+import asyncio
+import random
+import socket
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+import uvicorn
+from fastapi import FastAPI, Response
+
+ROOT_PATH = str(Path(__file__).parent.parent.absolute())
+if ROOT_PATH not in sys.path:
+    sys.path.insert(0, ROOT_PATH)
+
+from AIbot.deepseek_client import DeepSeekClient  # noqa: E402
+from AIbot.llm_router import Backend, LLMRouter  # noqa: E402
+
+REQUESTS = 300
+"""每组测试的请求数"""
+CONCURRENCY = 20
+"""并发数"""
+
+
+def make_app(latency: float, spike: float = 0.0, spike_rate: float = 0.0, status: int = 200) -> FastAPI:
+    """构造模拟服务：固定延迟，按比例出现延迟尖刺，或始终返回错误状态码"""
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(body: dict):
+        if status != 200:
+            return Response(status_code=status)
+        await asyncio.sleep(spike if random.random() < spike_rate else latency)
+        return {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "model": body.get("model"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "你好，有什么可以帮你？"},
+                    "finish_reason": "stop",
+                }
+            ],
+        }
+
+    return app
+
+
+def start_server(app: FastAPI) -> str:
+    """在后台线程启动模拟服务，返回base_url"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="error")
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/v1"
+
+
+async def run(client: DeepSeekClient) -> tuple:
+    """按并发数发起请求，返回(p50, p95, p99毫秒, 失败数)"""
+    messages = [{"role": "user", "content": "你好"}]
+    latencies = []
+    failures = 0
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def one() -> None:
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            reply = await client.generate_response("", messages)
+            latencies.append(time.perf_counter() - start)
+            if reply != "你好，有什么可以帮你？":
+                failures += 1
+
+    await asyncio.gather(*(one() for _ in range(REQUESTS)))
+    latencies.sort()
+    return (
+        statistics.median(latencies) * 1000,
+        latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        failures,
+    )
+
+
+async def main() -> None:
+    spiky = start_server(make_app(0.1, spike=2.0, spike_rate=0.1))
+    steady = start_server(make_app(0.15))
+    broken = start_server(make_app(0.1, status=503))
+
+    def backends() -> list:
+        return [
+            Backend("spiky", spiky, "bench", "mock"),
+            Backend("steady", steady, "bench", "mock"),
+            Backend("broken", broken, "bench", "mock"),
+        ]
+
+    cases = [
+        ("spiky only", LLMRouter([Backend("spiky", spiky, "bench", "mock")])),
+        ("router", LLMRouter(backends(), hedge=False)),
+        ("router+hedge", LLMRouter(backends(), hedge=True, hedge_delay=0.5)),
+    ]
+    print(f"{'case':>13} {'p50(ms)':>8} {'p95(ms)':>8} {'p99(ms)':>8} {'failed':>7} {'hedged':>7}")
+    for name, router in cases:
+        client = DeepSeekClient(api_key="bench", router=router)
+        # 预热，积累延迟样本
+        await run(client)
+        router.hedged = 0
+        p50, p95, p99, failures = await run(client)
+        print(f"{name:>13} {p50:>8.0f} {p95:>8.0f} {p99:>8.0f} {failures:>7} {router.hedged:>7}")
+        if len(router.backends) > 1:
+            for item in router.stats():
+                print(f"{'':>13} {item['name']}: {item['state']}, ewma {item['ewma_ms'] or '-'}ms, errors {item['errors']}")
+        await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
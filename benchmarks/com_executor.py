@@ -0,0 +1,116 @@
+"""
+com执行器基准测试
+
+用`FakeRobot`模拟一个耗时的批量查询(`CExecuteSQL`)，同时不断发送消息，对比：
+ - 直接在事件循环中同步调用com(旧方式)；
+ - 通过`ComExecutor`在专用线程中按优先级执行。
+输出发送消息的延迟(从计划发送时间到发送完成)与事件循环延迟。
+
+运行: python benchmarks/com_executor.py
+"""
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT_PATH = str(Path(__file__).parent.parent.absolute())
+if ROOT_PATH not in sys.path:
+    sys.path.insert(0, ROOT_PATH)
+
+from wechatbot_client.com_wechat.executor import (  # noqa: E402
+    ComExecutor,
+    Lane,
+    com_call,
+)
+from wechatbot_client.com_wechat.fake import FakeRobot  # noqa: E402
+
+QUERY_SECONDS = 0.2
+"""模拟的批量查询耗时"""
+QUERIES = 10
+"""批量查询次数"""
+SENDS = 50
+"""发送消息次数"""
+SEND_INTERVAL = 0.02
+"""发送消息间隔，单位：秒"""
+TICK = 0.005
+"""测量事件循环延迟的唤醒间隔，单位：秒"""
+
+
+class Api:
+    """只包含两个方法的com接口"""
+
+    def __init__(self, robot: FakeRobot) -> None:
+        self.robot = robot
+
+    @com_call(Lane.SEND)
+    def send_text(self, wxid: str, message: str) -> bool:
+        return self.robot.CSendText(0, wxid, message) == 0
+
+    @com_call(Lane.BULK)
+    def execute_sql(self, handle: int, sql: str) -> list:
+        return self.robot.CExecuteSQL(0, handle, sql)
+
+
+async def measure_lag(lags: list[float], done: asyncio.Event) -> None:
+    """记录事件循环的唤醒延迟"""
+    while not done.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+async def run(executor: ComExecutor = None) -> tuple[list[float], list[float]]:
+    """执行一组测试，返回发送延迟与事件循环延迟"""
+    api = Api(FakeRobot({"CSendText": 0}, delays={"CExecuteSQL": QUERY_SECONDS}))
+
+    async def call(func, *args):
+        if executor is None:
+            return func(*args)
+        return await executor.run(func, *args)
+
+    async def queries() -> None:
+        await asyncio.gather(
+            *(call(api.execute_sql, 1, "select 1") for _ in range(QUERIES))
+        )
+
+    async def send(latencies: list[float], planned: float, text: str) -> None:
+        # 延迟从计划发送的时间开始计算，包括事件循环被阻塞的时间
+        await asyncio.sleep(max(0, planned - time.perf_counter()))
+        await call(api.send_text, "wxid", text)
+        latencies.append(time.perf_counter() - planned)
+
+    async def sends(latencies: list[float]) -> None:
+        base = time.perf_counter()
+        await asyncio.gather(
+            *(send(latencies, base + i * SEND_INTERVAL, str(i)) for i in range(SENDS))
+        )
+
+    latencies, lags = [], []
+    done = asyncio.Event()
+    lag_task = asyncio.create_task(measure_lag(lags, done))
+    await asyncio.gather(queries(), sends(latencies))
+    done.set()
+    await lag_task
+    return latencies, lags
+
+
+def main() -> None:
+    print(
+        f"{'mode':>8} {'send p50(ms)':>13} {'send max(ms)':>13} "
+        f"{'lag p50(ms)':>12} {'lag max(ms)':>12}"
+    )
+    executor = ComExecutor()
+    executor.start()
+    for name, target in (("inline", None), ("executor", executor)):
+        latencies, lags = asyncio.run(run(target))
+        print(
+            f"{name:>8} {statistics.median(latencies) * 1e3:>13.2f} "
+            f"{max(latencies) * 1e3:>13.2f} {statistics.median(lags) * 1e3:>12.2f} "
+            f"{max(lags) * 1e3:>12.2f}"
+        )
+    executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
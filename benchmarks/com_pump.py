@@ -0,0 +1,134 @@
+"""
+com消息接收基准测试
+
+用`FakeMessageSource`模拟com上报，对比旧的在事件循环中轮询`PumpEvents(0.01)`的方式，
+与独立泵线程 + 有界队列的方式，输出消息吞吐量(条/秒)与事件循环延迟。
+事件循环延迟为一个每 5ms 唤醒一次的任务实际唤醒时间的超时量。
+
+不需要Windows与com组件，直接按路径加载`pump.py`，避免导入包时加载comtypes。
+
+运行: python benchmarks/com_pump.py
+"""
+import asyncio
+import importlib.util
+import statistics
+import threading
+import time
+from pathlib import Path
+
+PUMP_PATH = Path(__file__).parent.parent / "wechatbot_client/com_wechat/pump.py"
+spec = importlib.util.spec_from_file_location("com_pump", PUMP_PATH)
+pump = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(pump)
+
+MESSAGES = 20000
+"""每组测试的消息数"""
+RATES = (0, 2000)
+"""消息上报速率(条/秒)，0 表示不限速"""
+TICK = 0.005
+"""测量事件循环延迟的唤醒间隔，单位：秒"""
+
+
+def produce(source, rate: int) -> None:
+    """在线程中模拟com上报消息"""
+    start = time.perf_counter()
+    for i in range(MESSAGES):
+        if rate:
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        source.send(f"msg-{i}")
+
+
+async def measure_lag(lags: list[float], done: asyncio.Event) -> None:
+    """记录事件循环的唤醒延迟"""
+    while not done.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+class Counter:
+    """消息处理函数，全部处理完后通知"""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.done = asyncio.Event()
+
+    async def __call__(self, message: str) -> None:
+        await asyncio.sleep(0)
+        self.count += 1
+        if self.count == MESSAGES:
+            self.done.set()
+
+
+async def run_polling(rate: int) -> tuple[float, list[float]]:
+    """旧方式：事件循环中`sleep(0)`后阻塞调用`PumpEvents(0.01)`"""
+    source = pump.FakeMessageSource()
+    handler = Counter()
+    tasks = set()
+
+    def emit(message: str) -> None:
+        task = asyncio.create_task(handler(message))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    source.open(emit)
+    lags = []
+    lag_task = asyncio.create_task(measure_lag(lags, handler.done))
+
+    async def pump_event() -> None:
+        while not handler.done.is_set():
+            await asyncio.sleep(0)
+            source.pump(0.01)
+
+    start = time.perf_counter()
+    producer = threading.Thread(target=produce, args=(source, rate))
+    producer.start()
+    pump_task = asyncio.create_task(pump_event())
+    await handler.done.wait()
+    elapsed = time.perf_counter() - start
+    await pump_task
+    await lag_task
+    producer.join()
+    return elapsed, lags
+
+
+async def run_thread(rate: int) -> tuple[float, list[float]]:
+    """新方式：独立泵线程，通过有界队列交给事件循环"""
+    source = pump.FakeMessageSource()
+    handler = Counter()
+    message_pump = pump.MessagePump(source, handler)
+    message_pump.start()
+    lags = []
+    lag_task = asyncio.create_task(measure_lag(lags, handler.done))
+    start = time.perf_counter()
+    producer = threading.Thread(target=produce, args=(source, rate))
+    producer.start()
+    await handler.done.wait()
+    elapsed = time.perf_counter() - start
+    await lag_task
+    producer.join()
+    message_pump.stop()
+    return elapsed, lags
+
+
+def main() -> None:
+    print(
+        f"{'mode':>8} {'rate':>6} {'msgs/s':>9} "
+        f"{'lag p50(ms)':>12} {'lag p99(ms)':>12} {'lag max(ms)':>12}"
+    )
+    for rate in RATES:
+        for name, func in (("polling", run_polling), ("thread", run_thread)):
+            elapsed, lags = asyncio.run(func(rate))
+            lags.sort()
+            p99 = lags[int(len(lags) * 0.99)] if lags else 0.0
+            print(
+                f"{name:>8} {rate or 'max':>6} {MESSAGES / elapsed:>9.0f} "
+                f"{statistics.median(lags) * 1e3 if lags else 0.0:>12.2f} "
+                f"{p99 * 1e3:>12.2f} {max(lags, default=0.0) * 1e3:>12.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+事件扇出序列化基准测试
+
+对比每个消费者各自序列化事件，与使用`EventEnvelope`只序列化一次的耗时，
+输出每增加一个消费者带来的额外耗时。
+
+运行: python benchmarks/event_fanout.py
+"""
+import sys
+import time
+from pathlib import Path
+from timeit import timeit
+from uuid import uuid4
+
+ROOT_PATH = str(Path(__file__).parent.parent.absolute())
+if ROOT_PATH not in sys.path:
+    sys.path.insert(0, ROOT_PATH)
+
+from wechatbot_client.onebot12 import Message, MessageSegment  # noqa: E402
+from wechatbot_client.onebot12.event import BotSelf, GroupMessageEvent  # noqa: E402
+from wechatbot_client.utils import DataclassEncoder  # noqa: E402
+from wechatbot_client.wechat.envelope import EventEnvelope  # noqa: E402
+
+ROUNDS = 2000
+"""每组测试的事件数"""
+CONSUMERS = (1, 2, 4, 8, 16)
+"""消费者数量(websocket连接数 + webhook地址数)"""
+
+
+def make_event() -> GroupMessageEvent:
+    """构造一个典型的群消息事件"""
+    message = Message(
+        [
+            MessageSegment.text("OneBot is not a bot " * 5),
+            MessageSegment.mention("wxid_123456"),
+            MessageSegment.image(str(uuid4())),
+        ]
+    )
+    return GroupMessageEvent(
+        id=str(uuid4()),
+        time=time.time(),
+        self=BotSelf(user_id="wxid_self"),
+        message_id="6283",
+        message=message,
+        alt_message=str(message),
+        user_id="wxid_123456",
+        group_id="123456@chatroom",
+    )
+
+
+def per_consumer(event: GroupMessageEvent, consumers: int) -> None:
+    """每个消费者各自序列化"""
+    for _ in range(consumers):
+        event.json(by_alias=True, ensure_ascii=False, cls=DataclassEncoder)
+
+
+def shared_envelope(event: GroupMessageEvent, consumers: int) -> None:
+    """所有消费者共用同一个信封"""
+    envelope = EventEnvelope(event)
+    for _ in range(consumers):
+        envelope.json_bytes
+
+
+def main() -> None:
+    event = make_event()
+    print(f"{'consumers':>9} {'per-consumer(us)':>17} {'envelope(us)':>13} {'speedup':>8}")
+    for consumers in CONSUMERS:
+        old = timeit(lambda: per_consumer(event, consumers), number=ROUNDS) / ROUNDS
+        new = timeit(lambda: shared_envelope(event, consumers), number=ROUNDS) / ROUNDS
+        print(
+            f"{consumers:>9} {old * 1e6:>17.1f} {new * 1e6:>13.1f} {old / new:>7.1f}x"
+        )
+    single = timeit(lambda: per_consumer(event, 1), number=ROUNDS) / ROUNDS
+    extra = timeit(lambda: EventEnvelope(event).json_bytes, number=ROUNDS) / ROUNDS
+    cached = EventEnvelope(event)
+    cached.json_bytes
+    hit = timeit(lambda: cached.json_bytes, number=ROUNDS) / ROUNDS
+    print(
+        f"\n每增加一个消费者: 各自序列化 +{single * 1e6:.1f}us, "
+        f"共用信封 +{hit * 1e6:.3f}us (首次序列化 {extra * 1e6:.1f}us)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -24,6 +24,7 @@ class ModelConfig(BaseConfig):
     """action模型config"""
 
     extra = Extra.forbid
+    arbitrary_types_allowed = True
 
 
 def check_action_params(request: ActionRequest) -> tuple[str, BaseModel]:
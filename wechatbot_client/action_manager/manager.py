@@ -1,22 +1,41 @@
+import asyncio
+import hashlib
 import time
 from base64 import b64decode
 from inspect import iscoroutinefunction
 from pathlib import Path
 from sys import exit
-from typing import Callable, Literal, Optional, ParamSpec, TypeVar, Union
+from typing import Awaitable, Callable, Literal, Optional, ParamSpec, TypeVar, Union
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from wechatbot_client.com_wechat import ComWechatApi
+from wechatbot_client.com_wechat.directory import contact_type
+from wechatbot_client.com_wechat.executor import (
+    AsyncComApi,
+    ComCallTimeout,
+    Lane,
+    com_call,
+)
+from wechatbot_client.com_wechat.members import is_member_change
+from wechatbot_client.com_wechat.model import Message as WechatMessage
+from wechatbot_client.com_wechat.type import WxType
 from wechatbot_client.config import Config
 from wechatbot_client.consts import IMPL, ONEBOT_VERSION, PREFIX, VERSION
 from wechatbot_client.exception import FileNotFound, NoThisUserInGroup
-from wechatbot_client.file_manager import FileCache, FileManager
+from wechatbot_client.file_manager import FileCache, FileManager, SpooledFile
+from wechatbot_client.metrics import REGISTRY
 from wechatbot_client.onebot12 import Message, MessageSegment
+from wechatbot_client.onebot12.event import (
+    Event,
+    FriendIncreaseEvent,
+    FriendRequestEvent,
+)
 from wechatbot_client.utils import escape_tag, logger_wrapper
 
 from .check import expand_action, get_supported_actions, standard_action
 from .model import ActionResponse, BotSelf
+from .sender import SendPriority, SendScheduler
 
 log = logger_wrapper("Action Manager")
 P = ParamSpec("P")
@@ -25,6 +44,10 @@ R = TypeVar("R")
 SEGMENT_HANDLER: dict[str, Callable[P, R]] = {}
 """消息段处理函数"""
 
+ACTION_SECONDS = REGISTRY.histogram(
+    "onebot_action_seconds", "action调用耗时", ("action", "status")
+)
+
 
 def add_segment_handler(_type: str) -> Callable[P, R]:
     """
@@ -46,14 +69,23 @@ class ApiManager:
 
     com_api: ComWechatApi
     """com交互api"""
+    com: AsyncComApi
+    """com交互api的异步门面，在事件循环中使用，调用在com执行器线程中执行"""
     file_manager: FileManager
     """文件管理器"""
     file_base_url: str
     """文件base url"""
+    status_handlers: dict[str, Callable[[], dict]]
+    """运行状态拓展字段，会以`<PREFIX>.<name>`加入get_status的返回中"""
+    sender: SendScheduler
+    """发送调度器，`send_message`的消息在这里排队发送"""
 
     def __init__(self) -> None:
         self.com_api = ComWechatApi()
+        self.com = AsyncComApi(self.com_api, self.com_api.executor)
         self.file_manager = None
+        self.status_handlers = {}
+        self.sender = SendScheduler(self._flush_message)
 
     def init(self, file_manager: FileManager, config: Config) -> None:
         """
@@ -61,6 +93,26 @@ class ApiManager:
         """
         self.file_manager = file_manager
         self.file_base_url = f"http://{config.host}:{config.port}/get_file/"
+        timeout = config.com_timeout / 1000 or None
+        bulk_timeout = config.com_bulk_timeout / 1000 or None
+        self.com_api.executor.timeouts = {
+            Lane.SEND: timeout,
+            Lane.QUERY: timeout,
+            Lane.BULK: bulk_timeout,
+        }
+        self.register_status_handler("com_executor", self.com_api.executor.get_status)
+        self.register_status_handler("contacts", self.com_api.contacts.get_status)
+        self.com_api.members.ttl = config.group_member_ttl
+        self.register_status_handler("group_members", self.com_api.members.get_status)
+        self.sender.configure(
+            rate=config.send_rate,
+            burst=config.send_burst,
+            chat_rate=config.chat_send_rate,
+            chat_burst=config.chat_send_burst,
+            max_queue=config.send_queue_size,
+            coalesce=config.send_coalesce,
+        )
+        self.register_status_handler("send_queue", self.sender.get_status)
         # 初始化com组件
         log("DEBUG", "<y>初始化com组件...</y>")
         if not self.com_api.init():
@@ -101,12 +153,13 @@ class ApiManager:
             except KeyboardInterrupt:
                 return False
 
-    def open_recv_msg(self, file_path: str) -> None:
+    def open_recv_msg(self, file_path: str, queue_size: int = 1000) -> None:
         """
         注册接收消息
         """
-        # 注册消息事件
-        self.com_api.register_msg_event()
+        # 注册消息事件，在独立线程中接收
+        self.com_api.register_msg_event(queue_size=queue_size)
+        self.register_status_handler("message_pump", self.com_api.pump.get_status)
         log("DEBUG", "<g>注册消息事件成功...</g>")
         # 启动消息hook
         result = self.com_api.start_receive_message()
@@ -131,6 +184,7 @@ class ApiManager:
         """
         关闭
         """
+        self.sender.stop()
         self.com_api.close()
 
     def get_info(self) -> dict:
@@ -154,34 +208,84 @@ class ApiManager:
             * `response`: action返回值
         """
         func = getattr(self, action_name)
+        start = time.perf_counter()
         try:
             if iscoroutinefunction(func):
                 result = await func(**action_model.dict())
             else:
-                result = func(**action_model.dict())
+                # 同步action都会调用com，在com执行器线程中执行；不调用com的action需要定义为异步函数
+                result = await self.com_api.executor.run(func, **action_model.dict())
+        except ComCallTimeout as e:
+            ACTION_SECONDS.observe(time.perf_counter() - start, action_name, "timeout")
+            log("ERROR", f"<r>调用api超时: {e}</r>")
+            return ActionResponse(
+                status="failed", retcode=20002, message=repr(e), data=None
+            )
         except Exception as e:
+            ACTION_SECONDS.observe(time.perf_counter() - start, action_name, "error")
             log("ERROR", f"<r>调用api错误: {e}</r>")
             return ActionResponse(
                 status="failed", retcode=20002, message="内部服务错误", data=None
             )
+        ACTION_SECONDS.observe(
+            time.perf_counter() - start, action_name, getattr(result, "status", "ok")
+        )
         log("DEBUG", f"<g>调用api成功，返回:</g> {escape_tag(str(result))}")
         return result
 
-    def register_message_handler(self, func: Callable[[str], None]) -> None:
+    def register_message_handler(self, func: Callable[[str], Awaitable[None]]) -> None:
         """注册一个消息处理器"""
         self.com_api.register_message_handler(func)
 
+    def register_status_handler(self, name: str, func: Callable[[], dict]) -> None:
+        """
+        说明:
+            注册一个运行状态拓展字段，`get_status`时会调用`func`获取状态
+
+        参数:
+            * `name`: 字段名，返回时会加上拓展前缀
+            * `func`: 获取状态的函数
+        """
+        self.status_handlers[name] = func
+
+    async def handle_contact_event(self, event: Event) -> None:
+        """
+        说明:
+            根据事件增量更新通讯录目录
+
+        参数:
+            * `event`: 已上报的事件
+        """
+        if isinstance(event, FriendIncreaseEvent):
+            await self.com.refresh_contact(event.user_id)
+        elif isinstance(event, FriendRequestEvent):
+            self.com_api.contacts.add_request(event.v3, event.user_id, event.nickname)
+
+    def handle_member_notice(self, msg: WechatMessage) -> None:
+        """
+        说明:
+            收到群成员增加、减少的系统提示时，使该群的成员缓存失效
+
+        参数:
+            * `msg`: 微信消息
+        """
+        if msg.type not in (WxType.SYSTEM_NOTICE, WxType.SYSTEM_MSG):
+            return
+        if is_member_change(msg.sender, msg.message):
+            if self.com_api.members.invalidate(msg.sender):
+                log("DEBUG", f"群成员变动，清除缓存:{msg.sender}")
+
     @add_segment_handler("text")
-    def _send_text(
+    async def _send_text(
         self, id: str, segment: MessageSegment, at_list: list[str] = None
     ) -> bool:
         """
         发送文本
         """
         if at_list is None:
-            return self.com_api.send_text(wxid=id, message=segment.data["text"])
+            return await self.com.send_text(wxid=id, message=segment.data["text"])
         else:
-            return self.com_api.send_at_message(
+            return await self.com.send_at_message(
                 group_id=id,
                 at_users=at_list,
                 message=segment.data["text"],
@@ -195,7 +299,7 @@ class ApiManager:
         file_path, _ = await self.file_manager.get_file(file_id)
         if file_path is None:
             raise FileNotFound(file_id)
-        return self.com_api.send_image(id, file_path)
+        return await self.com.send_image(id, file_path)
 
     @add_segment_handler("file")
     async def _send_file(self, id: str, segment: MessageSegment) -> bool:
@@ -204,7 +308,7 @@ class ApiManager:
         file_path, _ = await self.file_manager.get_file(file_id)
         if file_path is None:
             raise FileNotFound(file_id)
-        return self.com_api.send_file(id, file_path)
+        return await self.com.send_file(id, file_path)
 
     @add_segment_handler(f"{PREFIX}.emoji")
     async def _send_emoji(self, id: str, segment: MessageSegment) -> bool:
@@ -213,7 +317,7 @@ class ApiManager:
         file_path, _ = await self.file_manager.get_file(file_id)
         if file_path is None:
             raise FileNotFound(file_id)
-        return self.com_api.send_gif(id, file_path)
+        return await self.com.send_gif(id, file_path)
 
     @add_segment_handler(f"{PREFIX}.link")
     async def _send_link(self, id: str, segment: MessageSegment) -> bool:
@@ -227,7 +331,7 @@ class ApiManager:
         title = segment.data["title"]
         des = segment.data["des"]
         url = segment.data["url"]
-        return self.com_api.send_message_card(id, title, des, url, file_path)
+        return await self.com.send_message_card(id, title, des, url, file_path)
 
 
 class ActionManager(ApiManager):
@@ -236,7 +340,7 @@ class ActionManager(ApiManager):
     """
 
     @standard_action
-    def get_supported_actions(self) -> ActionResponse:
+    async def get_supported_actions(self) -> ActionResponse:
         """
         获取支持的动作列表
         """
@@ -244,20 +348,22 @@ class ActionManager(ApiManager):
         return ActionResponse(status="ok", retcode=0, data=actions)
 
     @standard_action
-    def get_status(self) -> ActionResponse:
+    async def get_status(self) -> ActionResponse:
         """
-        获取运行状态
+        获取运行状态，状态处理函数在事件循环中调用
         """
-        user_info = self.get_self_info()
+        info = await self.com.get_self_info()
         bot = {
-            "self": BotSelf(user_id=user_info.data["user_id"]).dict(),
+            "self": BotSelf(user_id=info["wxId"]).dict(),
             "online": True,
         }
         data = {"good": True, "bots": [bot]}
+        for name, func in self.status_handlers.items():
+            data[f"{PREFIX}.{name}"] = func()
         return ActionResponse(status="ok", retcode=0, data=data)
 
     @standard_action
-    def get_version(self) -> ActionResponse:
+    async def get_version(self) -> ActionResponse:
         """
         获取版本信息
         """
@@ -277,9 +383,18 @@ class ActionManager(ApiManager):
         group_id: str = None,
         guild_id: str = None,
         channel_id: str = None,
+        priority: Literal["reply", "normal", "broadcast"] = Field(
+            "normal", alias=f"{PREFIX}.priority"
+        ),
+        wait: bool = Field(True, alias=f"{PREFIX}.wait"),
     ) -> ActionResponse:
         """
-        发送消息
+        说明:
+            发送消息，消息先进入发送队列，按优先级与速率限制发送
+
+        参数:
+            * `priority`: 拓展参数，优先级，回复优先于普通消息，普通消息优先于广播
+            * `wait`: 拓展参数，是否等待发送完成，为False时入队后立即返回回执
         """
         match detail_type:
             case "channel":
@@ -287,24 +402,59 @@ class ActionManager(ApiManager):
                     status="failed", retcode=10004, data=None, message="不支持channel发送"
                 )
             case "private":
-                if user_id is None:
-                    return ActionResponse(
-                        status="failed", retcode=10003, data=None, message="参数缺失"
-                    )
-                return await self._send_private_msg(message, user_id)
+                chat_id = user_id
             case "group":
-                if group_id is None:
-                    return ActionResponse(
-                        status="failed", retcode=10003, data=None, message="参数缺失"
-                    )
-                return await self._send_group_msg(message, group_id)
+                chat_id = group_id
+        if chat_id is None:
+            return ActionResponse(
+                status="failed", retcode=10003, data=None, message="参数缺失"
+            )
+        try:
+            job = self.sender.submit(
+                detail_type, chat_id, message, SendPriority[priority.upper()]
+            )
+        except asyncio.QueueFull:
+            return ActionResponse(
+                status="failed", retcode=36000, data=None, message="发送队列已满"
+            )
+        if not wait:
+            data = {
+                "message_id": job.id,
+                "time": job.time,
+                f"{PREFIX}.status": "queued",
+            }
+            return ActionResponse(status="ok", retcode=0, data=data)
+        response = await job.future
+        if response.status == "ok":
+            data = {"message_id": job.id, "time": job.time}
+            return ActionResponse(status="ok", retcode=0, data=data)
+        return response
+
+    async def _flush_message(
+        self, detail_type: str, chat_id: str, message: Message
+    ) -> ActionResponse:
+        """
+        发送队列调用，实际发送消息
+        """
+        if detail_type == "private":
+            return await self._send_private_msg(message, chat_id)
+        return await self._send_group_msg(message, chat_id)
 
-    def _pre_handle_msg(
+    async def _pre_handle_msg(
         self, group_id: str, message: Message
     ) -> tuple[list[list[str]], Message]:
         """
         消息预处理，将at合并到text中
         """
+        # 一次解析消息中所有@的昵称
+        mentions = [
+            segment.data["user_id"] for segment in message if segment.type == "mention"
+        ]
+        nicknames = (
+            await self.com.get_groupmember_nicknames(group_id, mentions)
+            if mentions
+            else {}
+        )
         new_msg = Message()
         all_at_list: list[list[str]] = []
         current_text = None
@@ -316,7 +466,7 @@ class ActionManager(ApiManager):
                 new_msg.append(segment)
             elif segment.type == "mention":
                 user_id = segment.data["user_id"]
-                nickname = self.com_api.get_groupmember_nickname(group_id, user_id)
+                nickname = nicknames[user_id]
                 if nickname == "":
                     raise NoThisUserInGroup(group_id, user_id)
                 seg = MessageSegment.text(f"@{nickname} ")
@@ -350,6 +500,8 @@ class ActionManager(ApiManager):
         发送私聊消息
         """
         exceptions: list[str] = []
+        # 连续的文本合并为一次发送
+        message.ruduce()
         for segment in message:
             try:
                 if segment.type == "mention" or segment.type == "mention_all":
@@ -385,7 +537,7 @@ class ActionManager(ApiManager):
         """
         exceptions: list[str] = []
         try:
-            all_at_list, message = self._pre_handle_msg(group_id, message)
+            all_at_list, message = await self._pre_handle_msg(group_id, message)
         except NoThisUserInGroup as e:
             log("ERROR", repr(e))
             return ActionResponse(
@@ -402,7 +554,7 @@ class ActionManager(ApiManager):
                         at_list = None
                     else:
                         at_list = all_at_list.pop(0)
-                    handler(self, group_id, segment, at_list)
+                    await handler(self, group_id, segment, at_list)
                 elif iscoroutinefunction(handler):
                     await handler(self, group_id, segment)
                 else:
@@ -459,6 +611,7 @@ class ActionManager(ApiManager):
         return ActionResponse(status="ok", retcode=0, data=data)
 
     @standard_action
+    @com_call(Lane.BULK)
     def get_friend_list(self) -> ActionResponse:
         """
         获取好友列表
@@ -492,6 +645,7 @@ class ActionManager(ApiManager):
         return ActionResponse(status="ok", retcode=0, data=data)
 
     @standard_action
+    @com_call(Lane.BULK)
     def get_group_list(self) -> ActionResponse:
         """
         获取群列表
@@ -511,30 +665,25 @@ class ActionManager(ApiManager):
         """
         获取群成员信息
         """
-        res = self.com_api.get_group_members(group_id)
-        members = res["members"]
-        flag = False
-        for one in members:
-            if one["wxId"] == user_id:
-                data = {
-                    "user_id": one["wxId"],
-                    "user_name": one["wxNickName"],
-                    "user_displayname": "",
-                    f"{PREFIX}.avatar": one["wxBigAvatar"],  # 头像
-                    f"{PREFIX}.wx_number": one["wxNumber"],  # 微信号
-                    f"{PREFIX}.nation": one["wxNation"],  # 国家
-                    f"{PREFIX}.province": one["wxProvince"],  # 省份
-                    f"{PREFIX}.city": one["wxCity"],  # 城市
-                }
-                flag = True
-                break
-        if not flag:
+        one = self.com_api.get_group_member(group_id, user_id)
+        if one is None:
             return ActionResponse(
                 status="failed", retcode=35001, data=None, message="群内没有该联系人"
             )
+        data = {
+            "user_id": one["wxId"],
+            "user_name": one["wxNickName"],
+            "user_displayname": "",
+            f"{PREFIX}.avatar": one["wxBigAvatar"],  # 头像
+            f"{PREFIX}.wx_number": one["wxNumber"],  # 微信号
+            f"{PREFIX}.nation": one["wxNation"],  # 国家
+            f"{PREFIX}.province": one["wxProvince"],  # 省份
+            f"{PREFIX}.city": one["wxCity"],  # 城市
+        }
         return ActionResponse(status="ok", retcode=0, data=data)
 
     @standard_action
+    @com_call(Lane.BULK)
     def get_group_member_list(self, group_id: str) -> ActionResponse:
         """
         获取群成员列表
@@ -577,11 +726,11 @@ class ActionManager(ApiManager):
         url: Optional[str] = None,
         headers: Optional[dict[str, str]] = None,
         path: Optional[str] = None,
-        data: Optional[Union[str, bytes]] = None,
+        data: Optional[Union[SpooledFile, str, bytes]] = None,
         sha256: Optional[str] = None,
     ) -> ActionResponse:
         """
-        上传文件
+        上传文件，大请求体的data由driver流式写入临时文件，这里只需要重命名
         """
         if type == "url":
             if url is None:
@@ -611,8 +760,19 @@ class ActionManager(ApiManager):
             return ActionResponse(
                 status="failed", retcode=10003, data=None, message="缺少data参数"
             )
+        if isinstance(data, SpooledFile):
+            if sha256 is not None and sha256.lower() != data.sha256:
+                return ActionResponse(
+                    status="failed", retcode=10003, data=None, message="sha256校验失败"
+                )
+            file_id = await self.file_manager.cache_file_id_from_spooled(data, name)
+            return ActionResponse(status="ok", retcode=0, data={"file_id": file_id})
         if isinstance(data, str):
             data = b64decode(data)
+        if sha256 is not None and sha256.lower() != hashlib.sha256(data).hexdigest():
+            return ActionResponse(
+                status="failed", retcode=10003, data=None, message="sha256校验失败"
+            )
         file_id = await self.file_manager.cache_file_id_from_data(data, name)
         return ActionResponse(status="ok", retcode=0, data={"file_id": file_id})
 
@@ -649,6 +809,7 @@ class ActionManager(ApiManager):
         )
 
     @expand_action
+    @com_call(Lane.BULK)
     def get_public_account_list(self) -> ActionResponse:
         """
         获取公众号列表
@@ -682,15 +843,17 @@ class ActionManager(ApiManager):
             )
 
     @expand_action
+    @com_call(Lane.BULK)
     def search_contact_by_remark(self, remark: str) -> ActionResponse:
         """
         通过备注搜索联系人
         """
-        info = self.com_api.search_friend_by_remark(remark)
-        if info is None:
+        contact = self.com_api.search_friend_by_remark(remark)
+        if contact is None:
             return ActionResponse(
                 status="failed", retcode=35001, data=None, message="未找到联系人"
             )
+        info = self.com_api.get_user_info(contact["wxid"])
         data = {
             "user_id": info["wxId"],
             "user_name": info["wxNickName"],
@@ -705,15 +868,17 @@ class ActionManager(ApiManager):
         return ActionResponse(status="ok", retcode=0, data=data)
 
     @expand_action
+    @com_call(Lane.BULK)
     def search_contact_by_wxnumber(self, wx_number: str) -> ActionResponse:
         """
         通过微信号搜索联系人
         """
-        info = self.com_api.search_friend_by_wxnumber(wx_number)
-        if info is None:
+        contact = self.com_api.search_friend_by_wxnumber(wx_number)
+        if contact is None:
             return ActionResponse(
                 status="failed", retcode=35001, data=None, message="未找到联系人"
             )
+        info = self.com_api.get_user_info(contact["wxid"])
         data = {
             "user_id": info["wxId"],
             "user_name": info["wxNickName"],
@@ -728,15 +893,17 @@ class ActionManager(ApiManager):
         return ActionResponse(status="ok", retcode=0, data=data)
 
     @expand_action
+    @com_call(Lane.BULK)
     def search_contact_by_nickname(self, nickname: str) -> ActionResponse:
         """
         通过昵称搜索联系人
         """
-        info = self.com_api.search_friend_by_nickname(nickname)
-        if info is None:
+        contact = self.com_api.search_friend_by_nickname(nickname)
+        if contact is None:
             return ActionResponse(
                 status="failed", retcode=35001, data=None, message="未找到联系人"
             )
+        info = self.com_api.get_user_info(contact["wxid"])
         data = {
             "user_id": info["wxId"],
             "user_name": info["wxNickName"],
@@ -750,6 +917,57 @@ class ActionManager(ApiManager):
         }
         return ActionResponse(status="ok", retcode=0, data=data)
 
+    @expand_action
+    @com_call(Lane.BULK)
+    def search_contacts(
+        self,
+        keyword: str,
+        field: Literal["nickname", "remark", "wx_number"] = "nickname",
+        match: Literal["exact", "prefix", "substring"] = "prefix",
+        limit: int = 20,
+    ) -> ActionResponse:
+        """
+        说明:
+            在通讯录中搜索联系人，返回好友、群聊、公众号
+
+        参数:
+            * `keyword`: 关键字
+            * `field`: 搜索的字段：昵称、备注、微信号
+            * `match`: 匹配方式：精确、前缀、包含
+            * `limit`: 最多返回的数量
+        """
+        fields = {"nickname": "wxNickName", "remark": "wxRemark", "wx_number": "wxNumber"}
+        contacts = self.com_api.ensure_contacts().search(
+            fields[field], keyword, match, limit
+        )
+        data = [
+            {
+                "user_id": one["wxid"],
+                "user_name": one["wxNickName"],
+                "user_remark": one.get("wxRemark", ""),
+                f"{PREFIX}.wx_number": one.get("wxNumber", ""),
+                f"{PREFIX}.type": contact_type(one).value,
+            }
+            for one in contacts
+        ]
+        return ActionResponse(status="ok", retcode=0, data=data)
+
+    @expand_action
+    async def get_send_receipt(self, message_id: str) -> ActionResponse:
+        """
+        说明:
+            获取`send_message`的发送回执，用于查询不等待发送完成时的发送结果
+
+        参数:
+            * `message_id`: `send_message`返回的`message_id`
+        """
+        receipt = self.sender.get_receipt(message_id)
+        if receipt is None:
+            return ActionResponse(
+                status="failed", retcode=35001, data=None, message="未找到该发送回执"
+            )
+        return ActionResponse(status="ok", retcode=0, data=receipt)
+
     @expand_action
     def check_friend_status(self, user_id: str) -> ActionResponse:
         """
@@ -771,6 +989,7 @@ class ActionManager(ApiManager):
         return ActionResponse(status="ok", retcode=0, data=data)
 
     @expand_action
+    @com_call(Lane.BULK)
     def get_db_info(self) -> ActionResponse:
         """
         获取数据库句柄和表信息
@@ -779,6 +998,7 @@ class ActionManager(ApiManager):
         return ActionResponse(status="ok", retcode=0, data=data)
 
     @expand_action
+    @com_call(Lane.BULK)
     def execute_sql(self, handle: int, sql: str) -> ActionResponse:
         """
         执行SQL
@@ -787,6 +1007,7 @@ class ActionManager(ApiManager):
         return ActionResponse(status="ok", retcode=0, data=data)
 
     @expand_action
+    @com_call(Lane.BULK, timeout=300)
     def backup_db(self, handle: int, file_path: str) -> ActionResponse:
         """
         备份数据库
@@ -811,6 +1032,9 @@ class ActionManager(ApiManager):
         """
         status = self.com_api.verify_friend_apply(v3, v4)
         if status:
+            request = self.com_api.contacts.pop_request(v3)
+            if request is not None:
+                self.com_api.refresh_contact(request[0])
             return ActionResponse(status="ok", retcode=0, data=None)
         else:
             return ActionResponse(
@@ -849,7 +1073,7 @@ class ActionManager(ApiManager):
         """
         status = self.com_api.delete_friend(user_id)
         if status:
-            self.com_api.get_contacts()
+            self.com_api.contacts.remove(user_id)
             return ActionResponse(status="ok", retcode=0, data=None)
         else:
             return ActionResponse(
@@ -868,7 +1092,7 @@ class ActionManager(ApiManager):
         """
         status = self.com_api.edit_remark(user_id, remark)
         if status:
-            self.com_api.get_contacts()
+            self.com_api.contacts.update(user_id, wxRemark=remark or "")
             return ActionResponse(status="ok", retcode=0, data=None)
         else:
             return ActionResponse(
@@ -884,7 +1108,6 @@ class ActionManager(ApiManager):
         """
         status = self.com_api.set_group_announcement(group_id, announcement)
         if status:
-            self.com_api.get_contacts()
             return ActionResponse(status="ok", retcode=0, data=None)
         else:
             return ActionResponse(
@@ -899,7 +1122,6 @@ class ActionManager(ApiManager):
         """
         status = self.com_api.set_group_nickname(group_id, nickname)
         if status:
-            self.com_api.get_contacts()
             return ActionResponse(status="ok", retcode=0, data=None)
         else:
             return ActionResponse(
@@ -929,7 +1151,6 @@ class ActionManager(ApiManager):
         """
         status = self.com_api.delete_groupmember(group_id, user_list)
         if status:
-            self.com_api.get_contacts()
             return ActionResponse(status="ok", retcode=0, data=None)
         else:
             return ActionResponse(
@@ -950,7 +1171,6 @@ class ActionManager(ApiManager):
         """
         status = self.com_api.add_groupmember(group_id, user_list)
         if status:
-            self.com_api.get_contacts()
             return ActionResponse(status="ok", retcode=0, data=None)
         else:
             return ActionResponse(
@@ -958,6 +1178,7 @@ class ActionManager(ApiManager):
             )
 
     @expand_action
+    @com_call(Lane.BULK)
     def get_public_history(self, public_id: str, offset: str = "") -> ActionResponse:
         """
         说明:
@@ -971,6 +1192,7 @@ class ActionManager(ApiManager):
         return ActionResponse(status="ok", retcode=0, data=data)
 
     @expand_action
+    @com_call(Lane.SEND)
     def send_forward_msg(self, user_id: str, message_id: int) -> ActionResponse:
         """
         说明:
@@ -982,7 +1204,6 @@ class ActionManager(ApiManager):
         """
         status = self.com_api.send_forward_msg(user_id, message_id)
         if status:
-            self.com_api.get_contacts()
             return ActionResponse(status="ok", retcode=0, data=None)
         else:
             return ActionResponse(
@@ -990,6 +1211,7 @@ class ActionManager(ApiManager):
             )
 
     @expand_action
+    @com_call(Lane.SEND)
     def send_raw_xml(
         self, user_id: str, xml: str, image_path: str = ""
     ) -> ActionResponse:
@@ -1004,7 +1226,6 @@ class ActionManager(ApiManager):
         """
         status = self.com_api.send_xml(user_id, xml, image_path)
         if status:
-            self.com_api.get_contacts()
             return ActionResponse(status="ok", retcode=0, data=None)
         else:
             return ActionResponse(
@@ -1012,13 +1233,13 @@ class ActionManager(ApiManager):
             )
 
     @expand_action
+    @com_call(Lane.SEND)
     def send_card(self, user_id: str, card_id: str, nickname: str) -> ActionResponse:
         """
         发送名片
         """
         status = self.com_api.send_contact_card(user_id, card_id, nickname)
         if status:
-            self.com_api.get_contacts()
             return ActionResponse(status="ok", retcode=0, data=None)
         else:
             return ActionResponse(
@@ -0,0 +1,502 @@
+"""
+发送调度，`send_message`的消息先进入发送队列，再由后台任务按优先级与速率限制发送
+
+ - 全局与每个聊天各有一个令牌桶，每次com发送消耗一个令牌，避免突发发送被微信限制；
+ - 优先级高的消息先发送(回复优先于广播)，同一聊天内按提交顺序发送；
+ - 同一聊天中排队的纯文本消息会合并为一次发送。
+"""
+import asyncio
+import contextlib
+import itertools
+import time
+from collections import deque
+from enum import IntEnum
+from typing import Awaitable, Callable, Optional
+from uuid import uuid4
+
+from wechatbot_client.metrics import REGISTRY
+from wechatbot_client.onebot12 import Message, MessageSegment
+from wechatbot_client.utils import logger_wrapper
+
+from .model import ActionResponse
+
+log = logger_wrapper("Send Scheduler")
+
+MAX_RECEIPTS = 1000
+"""最多保留的已完成发送回执数，超过时丢弃最早完成的回执，排队中的回执不会丢弃"""
+COALESCE_MAX_CHARS = 2000
+"""合并后的文本最大长度"""
+COALESCE_SEPARATOR = "\n"
+"""合并文本消息时的分隔符"""
+
+SEND_WAIT = REGISTRY.histogram(
+    "onebot_send_queue_wait_seconds", "消息在发送队列中的等待时间", ("priority",)
+)
+SEND_MESSAGES = REGISTRY.counter(
+    "onebot_send_messages_total", "发送队列处理的消息数", ("result",)
+)
+
+SendFunc = Callable[[str, str, Message], Awaitable[ActionResponse]]
+"""实际发送消息的函数：(消息类型, 聊天id, 消息) -> 发送结果"""
+
+
+class SendPriority(IntEnum):
+    """
+    发送优先级，值越小越先发送
+    """
+
+    REPLY = 0
+    """回复消息"""
+    NORMAL = 1
+    """普通消息"""
+    BROADCAST = 2
+    """广播、群发消息"""
+
+
+class TokenBucket:
+    """
+    令牌桶，令牌可以透支，透支后需要等待补足
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    rate: float
+    """每秒补充的令牌数，为0时不限制"""
+    burst: int
+    """令牌桶容量"""
+    tokens: float
+    """当前令牌数"""
+    updated: float
+    """上次补充令牌的时间"""
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        """补充令牌"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """至少有一个令牌前需要等待的时间，单位：秒"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, cost: int, now: float) -> None:
+        """消耗令牌"""
+        if self.rate <= 0:
+            return
+        self._refill(now)
+        self.tokens -= cost
+
+    def is_full(self, now: float) -> bool:
+        """令牌桶是否已满，满时可以丢弃"""
+        if self.rate <= 0:
+            return True
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+def send_count(message: Message) -> int:
+    """
+    说明:
+        估算消息需要的com发送次数，连续的文本与@会合并为一次发送
+
+    参数:
+        * `message`: 消息
+
+    返回:
+        * `int`: 发送次数，至少为1
+    """
+    count = 0
+    in_text = False
+    for segment in message:
+        if segment.type in ("text", "mention", "mention_all"):
+            if not in_text:
+                count += 1
+            in_text = True
+        else:
+            count += 1
+            in_text = False
+    return max(count, 1)
+
+
+def is_plain_text(message: Message) -> bool:
+    """消息是否只有文本"""
+    return len(message) > 0 and all(segment.type == "text" for segment in message)
+
+
+class SendJob:
+    """
+    一条排队发送的消息，同时也是发送回执
+    """
+
+    __slots__ = (
+        "id",
+        "detail_type",
+        "chat_id",
+        "message",
+        "priority",
+        "seq",
+        "time",
+        "queued",
+        "status",
+        "response",
+        "future",
+        "merged",
+    )
+
+    id: str
+    """回执id"""
+    detail_type: str
+    """消息类型：`private`或`group`"""
+    chat_id: str
+    """好友或群聊id"""
+    message: Message
+    """消息内容"""
+    priority: SendPriority
+    """优先级"""
+    seq: int
+    """入队序号"""
+    time: float
+    """提交时间戳"""
+    queued: float
+    """入队时间，用于计算等待时间"""
+    status: str
+    """状态：`queued`、`sending`、`ok`、`failed`"""
+    response: Optional[ActionResponse]
+    """发送结果"""
+    future: asyncio.Future
+    """发送完成时设置为发送结果"""
+    merged: list["SendJob"]
+    """合并到本次发送中的其他消息"""
+
+    def __init__(
+        self,
+        detail_type: str,
+        chat_id: str,
+        message: Message,
+        priority: SendPriority,
+        seq: int,
+    ) -> None:
+        self.id = str(uuid4())
+        self.detail_type = detail_type
+        self.chat_id = chat_id
+        self.message = message
+        self.priority = priority
+        self.seq = seq
+        self.time = time.time()
+        self.queued = time.monotonic()
+        self.status = "queued"
+        self.response = None
+        self.future = asyncio.get_running_loop().create_future()
+        self.merged = []
+
+    def finish(self, response: ActionResponse) -> None:
+        """记录发送结果"""
+        self.status = response.status
+        self.response = response
+        SEND_MESSAGES.inc(response.status)
+        if not self.future.done():
+            self.future.set_result(response)
+
+    def receipt(self) -> dict:
+        """获取回执"""
+        response = self.response
+        return {
+            "message_id": self.id,
+            "time": self.time,
+            "status": self.status,
+            "retcode": response.retcode if response else 0,
+            "message": response.message if response else "",
+        }
+
+
+class SendScheduler:
+    """
+    发送调度器，所有方法都需要在事件循环中调用
+    """
+
+    send: SendFunc
+    """实际发送消息的函数"""
+    chat_rate: float
+    """每个聊天每秒的发送次数，为0时不限制"""
+    chat_burst: int
+    """每个聊天最多连续发送的次数"""
+    max_queue: int
+    """最多排队的消息数"""
+    coalesce: bool
+    """是否合并同一聊天中排队的纯文本消息"""
+    coalesced: int
+    """被合并发送的消息数"""
+    _global: TokenBucket
+    """全局令牌桶"""
+    _buckets: dict[str, TokenBucket]
+    """聊天id -> 令牌桶"""
+    _chats: dict[str, deque[SendJob]]
+    """聊天id -> 排队中的消息，按提交顺序"""
+    _receipts: dict[str, SendJob]
+    """回执id -> 消息"""
+    _size: int
+    """排队中的消息数"""
+    _counter: itertools.count
+    """入队序号"""
+    _wakeup: Optional[asyncio.Event]
+    """有新消息时唤醒发送任务"""
+    _task: Optional[asyncio.Task]
+    """发送任务"""
+
+    def __init__(
+        self,
+        send: SendFunc,
+        rate: float = 0,
+        burst: int = 1,
+        chat_rate: float = 0,
+        chat_burst: int = 1,
+        max_queue: int = 1000,
+        coalesce: bool = True,
+    ) -> None:
+        """
+        参数:
+            * `send`: 实际发送消息的函数
+            * `rate`, `burst`: 全局每秒发送次数与最多连续发送次数，`rate`为0时不限制
+            * `chat_rate`, `chat_burst`: 每个聊天的每秒发送次数与最多连续发送次数
+            * `max_queue`: 最多排队的消息数
+            * `coalesce`: 是否合并纯文本消息
+        """
+        self.send = send
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_queue = max_queue
+        self.coalesce = coalesce
+        self.coalesced = 0
+        self._global = TokenBucket(rate, burst)
+        self._buckets = {}
+        self._chats = {}
+        self._receipts = {}
+        self._size = 0
+        self._counter = itertools.count()
+        self._wakeup = None
+        self._task = None
+
+    def configure(
+        self,
+        rate: float,
+        burst: int,
+        chat_rate: float,
+        chat_burst: int,
+        max_queue: int,
+        coalesce: bool,
+    ) -> None:
+        """修改速率限制等设置，参数同构造函数"""
+        self._global = TokenBucket(rate, burst)
+        self._buckets = {}
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_queue = max_queue
+        self.coalesce = coalesce
+
+    def start(self) -> None:
+        """启动发送任务，已启动时不做处理"""
+        if self._task is not None and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        """停止发送任务，排队中的消息返回失败"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        response = ActionResponse(
+            status="failed", retcode=20002, data=None, message="发送已取消"
+        )
+        for jobs in self._chats.values():
+            for job in jobs:
+                job.finish(response)
+        self._chats = {}
+        self._size = 0
+
+    def submit(
+        self,
+        detail_type: str,
+        chat_id: str,
+        message: Message,
+        priority: SendPriority = SendPriority.NORMAL,
+    ) -> SendJob:
+        """
+        说明:
+            提交一条消息，立即返回，可以通过`job.future`等待发送结果
+
+        参数:
+            * `detail_type`: 消息类型：`private`或`group`
+            * `chat_id`: 好友或群聊id
+            * `message`: 消息内容
+            * `priority`: 优先级
+
+        返回:
+            * `SendJob`: 发送回执
+
+        错误:
+            * `asyncio.QueueFull`: 排队的消息过多
+        """
+        if self._size >= self.max_queue:
+            raise asyncio.QueueFull
+        self.start()
+        job = SendJob(detail_type, chat_id, message, priority, next(self._counter))
+        self._chats.setdefault(chat_id, deque()).append(job)
+        self._size += 1
+        self._receipts[job.id] = job
+        if len(self._receipts) > self._size + MAX_RECEIPTS:
+            self._evict_receipts()
+        self._wakeup.set()
+        return job
+
+    def _evict_receipts(self) -> None:
+        """丢弃最早的已完成回执，直到已完成的回执不超过`MAX_RECEIPTS`"""
+        extra = len(self._receipts) - self._size - MAX_RECEIPTS
+        finished = []
+        for message_id, job in self._receipts.items():
+            if len(finished) >= extra:
+                break
+            if job.future.done():
+                finished.append(message_id)
+        for message_id in finished:
+            del self._receipts[message_id]
+
+    def get_receipt(self, message_id: str) -> Optional[dict]:
+        """获取发送回执，不存在时返回None"""
+        job = self._receipts.get(message_id)
+        return job.receipt() if job is not None else None
+
+    def get_status(self) -> dict:
+        """获取运行状态"""
+        queue = {one.name.lower(): 0 for one in SendPriority}
+        for jobs in self._chats.values():
+            for job in jobs:
+                queue[job.priority.name.lower()] += 1
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "queue": queue,
+            "max_queue": self.max_queue,
+            "chats": len(self._chats),
+            "coalesced": self.coalesced,
+        }
+
+    def _bucket(self, chat_id: str) -> TokenBucket:
+        """获取聊天的令牌桶"""
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(
+                self.chat_rate, self.chat_burst
+            )
+        return bucket
+
+    def _prune_buckets(self, now: float) -> None:
+        """丢弃没有排队消息且已补满的令牌桶"""
+        self._buckets = {
+            chat_id: bucket
+            for chat_id, bucket in self._buckets.items()
+            if chat_id in self._chats or not bucket.is_full(now)
+        }
+
+    def _next_job(self) -> tuple[Optional[SendJob], Optional[float]]:
+        """
+        说明:
+            选出下一条可以发送的消息
+
+        返回:
+            * `SendJob | None`: 可以发送的消息
+            * `float | None`: 没有可以发送的消息时，需要等待的时间，没有排队的消息时为None
+        """
+        if not self._chats:
+            return None, None
+        now = time.monotonic()
+        wait = self._global.wait_time(now)
+        if wait > 0:
+            return None, wait
+        best: Optional[SendJob] = None
+        for chat_id, jobs in self._chats.items():
+            chat_wait = self._bucket(chat_id).wait_time(now)
+            if chat_wait > 0:
+                wait = chat_wait if wait == 0 else min(wait, chat_wait)
+                continue
+            head = jobs[0]
+            if best is None or (head.priority, head.seq) < (best.priority, best.seq):
+                best = head
+        if best is None:
+            return None, wait
+        jobs = self._chats[best.chat_id]
+        jobs.popleft()
+        self._size -= 1
+        if self.coalesce:
+            self._coalesce(best, jobs)
+        if not jobs:
+            del self._chats[best.chat_id]
+        return best, None
+
+    def _coalesce(self, job: SendJob, jobs: deque[SendJob]) -> None:
+        """将紧接着的同优先级纯文本消息合并到`job`中"""
+        if not is_plain_text(job.message):
+            return
+        text = "".join(segment.data["text"] for segment in job.message)
+        while jobs:
+            nxt = jobs[0]
+            if nxt.priority != job.priority or not is_plain_text(nxt.message):
+                break
+            more = "".join(segment.data["text"] for segment in nxt.message)
+            if len(text) + len(COALESCE_SEPARATOR) + len(more) > COALESCE_MAX_CHARS:
+                break
+            text = f"{text}{COALESCE_SEPARATOR}{more}"
+            job.merged.append(jobs.popleft())
+            self._size -= 1
+        if job.merged:
+            self.coalesced += len(job.merged)
+            job.message = Message(MessageSegment.text(text))
+
+    async def _run(self) -> None:
+        """发送循环"""
+        while True:
+            self._wakeup.clear()
+            job, wait = self._next_job()
+            if job is None:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                continue
+            await self._dispatch(job)
+
+    async def _dispatch(self, job: SendJob) -> None:
+        """发送一条消息(包括合并进来的消息)"""
+        jobs = [job, *job.merged]
+        now = time.monotonic()
+        cost = send_count(job.message)
+        self._global.consume(cost, now)
+        self._bucket(job.chat_id).consume(cost, now)
+        for one in jobs:
+            one.status = "sending"
+            SEND_WAIT.observe(now - one.queued, one.priority.name.lower())
+        try:
+            response = await self.send(job.detail_type, job.chat_id, job.message)
+        except asyncio.CancelledError:
+            response = ActionResponse(
+                status="failed", retcode=20002, data=None, message="发送已取消"
+            )
+            for one in jobs:
+                one.finish(response)
+            raise
+        except Exception as e:
+            log("ERROR", f"发送消息出错:{e}")
+            response = ActionResponse(
+                status="failed", retcode=20002, data=None, message=f"发送消息出错:{e}"
+            )
+        for one in jobs:
+            one.finish(response)
+        if len(self._buckets) > self.max_queue:
+            self._prune_buckets(time.monotonic())
@@ -1,68 +1,135 @@
 import asyncio
 import json
+from functools import partial
 from pathlib import Path
-from typing import Callable, Literal, Optional, Tuple, Union
+from typing import Any, Awaitable, Callable, Literal, Optional, Tuple, Union
 
+import comtypes
 import psutil
-from comtypes.client import CreateObject, GetEvents
+from comtypes.client import CreateObject, GetEvents, PumpEvents
 
 from wechatbot_client.utils import escape_tag, logger_wrapper
 
+from .directory import ContactDirectory, ContactType
+from .executor import ComExecutor, ComObjectProxy, Lane, com_call
+from .members import GroupEntry, GroupMemberCache
+from .pump import MessagePump, MessageSource
+
 log = logger_wrapper("Com WeChat")
 
 
 class MessageReporter:
     """
-    消息接收器
+    消息接收器，com回调在泵线程中执行
     """
 
     func: Callable[[str], None] = None
-    """消息处理器"""
+    """消息处理器，将消息交给泵的队列"""
 
     def OnGetMessageEvent(self, message: Tuple[str, None]):
         msg = message[0]
         log("DEBUG", f"<g>接收到wechat消息</g> - {escape_tag(msg)}")
         if self.func:
-            asyncio.create_task(self.func(msg))
+            self.func(msg)
 
     def register_message_handler(self, func: Callable[[str], None]) -> None:
         """注册一个消息处理器"""
         self.func = func
 
 
-class ComProgress:
+class ComMessageSource(MessageSource):
     """
-    com通讯组件
+    com消息源，event对象在泵线程中创建，com回调与消息循环都在泵线程中执行
     """
 
-    robot = None
-    """com通讯robot"""
-    event = None
-    """com通讯event"""
-    com_pid: int
-    """com进程的pid"""
     wechat_pid: int
     """微信pid"""
+    event = None
+    """com通讯event"""
     connection_point = None
     """消息接收点"""
     msg_reporter: MessageReporter
     """消息接收器"""
 
-    def __init__(self) -> None:
-        self.robot = None
+    def __init__(self, wechat_pid: int) -> None:
+        self.wechat_pid = wechat_pid
         self.event = None
-        self.com_pid = None
-        self.wechat_pid = None
         self.connection_point = None
         self.msg_reporter = MessageReporter()
 
+    def open(self, emit: Callable[[str], None]) -> None:
+        comtypes.CoInitialize()
+        self.msg_reporter.register_message_handler(emit)
+        try:
+            self.event = CreateObject("WeChatRobot.RobotEvent")
+            self.connection_point = GetEvents(self.event, self.msg_reporter)
+            self.event.CRegisterWxPidWithCookie(
+                self.wechat_pid, self.connection_point.cookie
+            )
+        except BaseException:
+            self.close()
+            raise
+
+    def pump(self, timeout: float) -> None:
+        PumpEvents(timeout)
+
+    def close(self) -> None:
+        self.connection_point = None
+        self.event = None
+        comtypes.CoUninitialize()
+
+
+class ComProgress:
+    """
+    com通讯组件
+    """
+
+    robot: Optional[ComObjectProxy] = None
+    """com通讯robot，方法调用都在执行器线程中执行"""
+    robot_factory: Callable[[], Any]
+    """创建robot对象的函数，在执行器线程中调用"""
+    executor: ComExecutor
+    """com执行器"""
+    com_pid: int
+    """com进程的pid"""
+    wechat_pid: int
+    """微信pid"""
+    message_handler: Optional[Callable[[str], Awaitable[None]]]
+    """消息处理器"""
+    pump: Optional[MessagePump]
+    """消息泵，注册消息事件后创建"""
+
+    def __init__(
+        self,
+        robot_factory: Optional[Callable[[], Any]] = None,
+        executor: Optional[ComExecutor] = None,
+    ) -> None:
+        """
+        参数:
+            * `robot_factory`: 创建robot对象的函数，默认创建com对象，测试时可以返回`FakeRobot`
+            * `executor`: com执行器，默认在执行器线程中初始化com套间
+        """
+        self.robot = None
+        self.robot_factory = robot_factory or partial(
+            CreateObject, "WeChatRobot.CWeChatRobot"
+        )
+        self.executor = executor or ComExecutor(
+            comtypes.CoInitialize, comtypes.CoUninitialize
+        )
+        self.com_pid = None
+        self.wechat_pid = None
+        self.message_handler = None
+        self.pump = None
+
     def init(self) -> bool:
         """
-        初始化com组件
+        初始化com组件，robot对象在执行器线程中创建
         """
+        self.executor.start()
         try:
-            self.robot = CreateObject("WeChatRobot.CWeChatRobot")
-            self.event = CreateObject("WeChatRobot.RobotEvent")
+            self.robot = ComObjectProxy(
+                self.executor, self.executor.call(self.robot_factory)
+            )
             self.com_pid = self.robot.CStopRobotService(0)
         except OSError:
             return False
@@ -72,6 +139,9 @@ class ComProgress:
         """
         关闭com进程
         """
+        if self.pump is not None:
+            self.pump.stop()
+            self.pump = None
         if self.com_pid is not None:
             try:
                 com_process = psutil.Process(self.com_pid)
@@ -79,19 +149,31 @@ class ComProgress:
             except psutil.NoSuchProcess:
                 pass
         self.com_pid = None
+        if self.robot is not None:
+            self.executor.call(self.robot.release)
+            self.robot = None
+        self.executor.shutdown()
 
-    def register_msg_event(self) -> None:
+    def register_msg_event(
+        self, source: Optional[MessageSource] = None, queue_size: int = 1000
+    ) -> None:
         """
-        注册消息事件
+        说明:
+            注册消息事件，在独立线程中接收消息，需要在事件循环中调用
+
+        参数:
+            * `source`: 消息源，默认为com消息源
+            * `queue_size`: 线程间消息队列大小
         """
-        self.connection_point = GetEvents(self.event, self.msg_reporter)
-        self.event.CRegisterWxPidWithCookie(
-            self.wechat_pid, self.connection_point.cookie
-        )
+        if source is None:
+            source = ComMessageSource(self.wechat_pid)
+        pump = MessagePump(source, self.message_handler, queue_size)
+        pump.start()
+        self.pump = pump
 
-    def register_message_handler(self, func: Callable[[str], None]) -> None:
+    def register_message_handler(self, func: Callable[[str], Awaitable[None]]) -> None:
         """注册一个消息处理器"""
-        self.msg_reporter.register_message_handler(func)
+        self.message_handler = func
 
 
 class ComWechatApi(ComProgress):
@@ -99,8 +181,19 @@ class ComWechatApi(ComProgress):
     com微信通信接口，继承ComProgress，这里只定义方法
     """
 
-    AddressBook: list[dict] = None
-    """通讯录列表"""
+    contacts: ContactDirectory
+    """通讯录目录，第一次使用时获取，之后增量更新"""
+    members: GroupMemberCache
+    """群成员缓存"""
+
+    def __init__(
+        self,
+        robot_factory: Optional[Callable[[], Any]] = None,
+        executor: Optional[ComExecutor] = None,
+    ) -> None:
+        super().__init__(robot_factory, executor)
+        self.contacts = ContactDirectory()
+        self.members = GroupMemberCache()
 
     def init_wechat_pid(self) -> bool:
         """
@@ -174,6 +267,7 @@ class ComWechatApi(ComProgress):
         status = self.robot.CIsWxLogin(self.wechat_pid)
         return status == 1
 
+    @com_call(Lane.SEND)
     def send_text(self, wxid: str, message: str) -> bool:
         """
         说明:
@@ -190,6 +284,7 @@ class ComWechatApi(ComProgress):
         status = self.robot.CSendText(self.wechat_pid, wxid, message)
         return status == 0
 
+    @com_call(Lane.SEND)
     def send_image(self, wxid: str, image_path: str) -> bool:
         """
         说明:
@@ -206,6 +301,7 @@ class ComWechatApi(ComProgress):
         status = self.robot.CSendImage(self.wechat_pid, wxid, image_path)
         return status == 0
 
+    @com_call(Lane.SEND)
     def send_file(self, wxid: str, file_path: str) -> bool:
         """
         说明:
@@ -222,6 +318,7 @@ class ComWechatApi(ComProgress):
         status = self.robot.CSendFile(self.wechat_pid, wxid, file_path)
         return status == 0
 
+    @com_call(Lane.SEND)
     def send_message_card(
         self,
         wxid: str,
@@ -250,6 +347,7 @@ class ComWechatApi(ComProgress):
         )
         return status == 0
 
+    @com_call(Lane.SEND)
     def send_contact_card(self, receiver: str, shared_wxid: str, nickname: str) -> bool:
         """
         说明:
@@ -267,6 +365,7 @@ class ComWechatApi(ComProgress):
         status = self.robot.CSendCard(self.wechat_pid, receiver, shared_wxid, nickname)
         return status == 0
 
+    @com_call(Lane.SEND)
     def send_at_message(
         self,
         group_id: str,
@@ -307,10 +406,11 @@ class ComWechatApi(ComProgress):
         self_info = self.robot.CGetSelfInfo(self.wechat_pid)
         return json.loads(self_info)
 
+    @com_call(Lane.BULK)
     def get_contacts(self) -> list:
         """
         说明:
-            获取所有联系人列表
+            获取所有联系人列表，同时刷新通讯录目录
 
         返回:
             * `list`: 调用成功返回通讯录列表，调用失败返回空列表
@@ -319,15 +419,22 @@ class ComWechatApi(ComProgress):
 
         try:
             friend_tuple = self.robot.CGetFriendList(self.wechat_pid)
-            self.AddressBook = [dict(i) for i in list(friend_tuple)]
+            self.contacts.load(dict(i) for i in list(friend_tuple))
         except IndexError:
-            self.AddressBook = []
-        return self.AddressBook
+            self.contacts.load([])
+        return self.contacts.all()
 
+    def ensure_contacts(self, use_cache: bool = True) -> ContactDirectory:
+        """获取通讯录目录，未获取过或不使用缓存时先获取通讯录"""
+        if not self.contacts.loaded or not use_cache:
+            self.get_contacts()
+        return self.contacts
+
+    @com_call(Lane.BULK)
     def get_friend_list(self, use_cache: bool = True) -> list:
         """
         说明:
-            从通讯录列表中筛选出好友列表
+            从通讯录目录中获取好友列表
 
         参数:
             * `use_cache`: 是否使用缓存，默认使用
@@ -336,19 +443,13 @@ class ComWechatApi(ComProgress):
             * `list`: 好友列表
 
         """
-        if self.AddressBook is None or not use_cache:
-            self.get_contacts()
-        friend_list = [
-            item
-            for item in self.AddressBook
-            if (item["wxType"] == 3 and item["wxid"][0:3] != "gh_")
-        ]
-        return friend_list
+        return self.ensure_contacts(use_cache).partition(ContactType.FRIEND)
 
+    @com_call(Lane.BULK)
     def get_group_list(self, use_cache: bool = True) -> list:
         """
         说明:
-            从通讯录列表中筛选出群聊列表
+            从通讯录目录中获取群聊列表
 
         参数:
             * `use_cache`: 是否使用缓存，默认使用
@@ -356,15 +457,13 @@ class ComWechatApi(ComProgress):
         返回:
             * `list`: 群聊列表
         """
-        if self.AddressBook is None or not use_cache:
-            self.get_contacts()
-        chatroom_list = [item for item in self.AddressBook if item["wxType"] == 2]
-        return chatroom_list
+        return self.ensure_contacts(use_cache).partition(ContactType.GROUP)
 
+    @com_call(Lane.BULK)
     def get_public_account_list(self, use_cache: bool = True) -> list:
         """
         说明:
-            从通讯录列表中筛选出公众号列表
+            从通讯录目录中获取公众号列表
 
         参数:
             * `use_cache`: 是否使用缓存，默认使用
@@ -373,14 +472,7 @@ class ComWechatApi(ComProgress):
             * `list`: 公众号列表
 
         """
-        if self.AddressBook is None or not use_cache:
-            self.get_contacts()
-        official_account_list = [
-            item
-            for item in self.AddressBook
-            if (item["wxType"] == 3 and item["wxid"][0:3] == "gh_")
-        ]
-        return official_account_list
+        return self.ensure_contacts(use_cache).partition(ContactType.PUBLIC)
 
     def search_friend_by_remark(
         self, remark: str, use_cache: bool = True
@@ -396,12 +488,7 @@ class ComWechatApi(ComProgress):
         返回:
             * `dict | None`: 搜索到返回联系人信息，否则返回None
         """
-        if self.AddressBook is None or not use_cache:
-            self.get_contacts()
-        for item in self.AddressBook:
-            if item["wxRemark"] == remark:
-                return item
-        return None
+        return self.ensure_contacts(use_cache).find("wxRemark", remark)
 
     def search_friend_by_wxnumber(
         self, wxnumber: str, use_cache: bool = True
@@ -417,12 +504,7 @@ class ComWechatApi(ComProgress):
         返回:
             * `dict | None`: 搜索到返回联系人信息，否则返回None
         """
-        if self.AddressBook is None or not use_cache:
-            self.get_contacts()
-        for item in self.AddressBook:
-            if item["wxNumber"] == wxnumber:
-                return item
-        return None
+        return self.ensure_contacts(use_cache).find("wxNumber", wxnumber)
 
     def search_friend_by_nickname(
         self, nickname: str, use_cache: bool = True
@@ -438,12 +520,41 @@ class ComWechatApi(ComProgress):
         返回:
             * `dict | None`: 搜索到返回联系人信息，否则返回None
         """
-        if self.AddressBook is None or not use_cache:
-            self.get_contacts()
-        for item in self.AddressBook:
-            if item["wxNickName"] == nickname:
-                return item
-        return None
+        return self.ensure_contacts(use_cache).find("wxNickName", nickname)
+
+    def refresh_contact(self, wxid: str, wx_type: int = 3) -> Optional[dict]:
+        """
+        说明:
+            查询一个联系人的信息并更新到通讯录目录，用于好友增加等增量更新，
+            通讯录还未获取过时不做处理
+
+        参数:
+            * `wxid`: 联系人wxid
+            * `wx_type`: 通讯录中的联系人类型，好友为3，群聊为2
+
+        返回:
+            * `dict | None`: 更新后的联系人
+        """
+        if not self.contacts.loaded:
+            return None
+        info = self.get_user_info(wxid)
+        if not info or info.get("wxId") != wxid:
+            return None
+        exist = self.contacts.get(wxid) or {}
+        contact = {
+            **exist,
+            "wxid": wxid,
+            "wxNickName": info.get("wxNickName", ""),
+            "wxRemark": info.get("wxRemark", ""),
+            "wxNumber": info.get("wxNumber", ""),
+            "wxType": exist.get("wxType", wx_type),
+            "wxVerifyFlag": exist.get("wxVerifyFlag", 0),
+        }
+        # 没有备注时接口返回"null"
+        if contact["wxRemark"] == "null":
+            contact["wxRemark"] = ""
+        self.contacts.upsert(contact)
+        return contact
 
     def get_user_info(self, wxid: str) -> dict:
         """
@@ -461,29 +572,75 @@ class ComWechatApi(ComProgress):
         userinfo = self.robot.CGetWxUserInfo(self.wechat_pid, wxid)
         return json.loads(userinfo)
 
-    def get_group_members(self, group_id: str) -> Optional[dict]:
+    def _load_member_ids(self, group_id: str, entry: GroupEntry) -> bool:
+        """获取群成员wxid列表到缓存，返回是否成功"""
+        if entry.member_ids is not None:
+            return True
+        info = dict(self.robot.CGetChatRoomMembers(self.wechat_pid, group_id))
+        if not info:
+            return False
+        entry.member_ids = dict.fromkeys(info["members"].split("^G"))
+        return True
+
+    def _load_member(self, entry: GroupEntry, wxid: str) -> dict:
+        """获取群成员信息到缓存"""
+        member = entry.members.get(wxid)
+        if member is None:
+            member = entry.members[wxid] = self.get_user_info(wxid)
+        return member
+
+    @com_call(Lane.BULK)
+    def get_group_members(
+        self, group_id: str, use_cache: bool = True
+    ) -> Optional[dict]:
         """
         说明:
-            获取群成员信息
+            获取群成员信息，结果按群缓存
 
         参数:
             * `group_id`: 群聊id
+            * `use_cache`: 是否使用缓存，为False时重新获取并更新缓存
 
         返回:
             * `dict | None`: 获取成功返回群成员信息，失败返回None
 
         """
-        info = dict(self.robot.CGetChatRoomMembers(self.wechat_pid, group_id))
-        if not info:
+        if not use_cache:
+            self.members.invalidate(group_id)
+        entry = self.members.entry(group_id)
+        cached = (
+            entry.info is not None
+            and entry.member_ids is not None
+            and all(one in entry.members for one in entry.member_ids)
+        )
+        self.members.count(int(cached), int(not cached))
+        if not self._load_member_ids(group_id, entry):
             return None
-        members = info["members"].split("^G")
-        data = self.get_user_info(group_id)
-        data["members"] = []
-        for member in members:
-            member_info = self.get_user_info(member)
-            data["members"].append(member_info)
+        if entry.info is None:
+            entry.info = self.get_user_info(group_id)
+        data = dict(entry.info)
+        data["members"] = [self._load_member(entry, one) for one in entry.member_ids]
         return data
 
+    def get_group_member(self, group_id: str, wxid: str) -> Optional[dict]:
+        """
+        说明:
+            获取一个群成员的信息，只查询该成员，不获取整个群的成员信息
+
+        参数:
+            * `group_id`: 群聊id
+            * `wxid`: 群成员wxid
+
+        返回:
+            * `dict | None`: 成员信息，不在群内或获取失败时返回None
+        """
+        entry = self.members.entry(group_id)
+        cached = wxid in entry.members
+        self.members.count(int(cached), int(not cached))
+        if not self._load_member_ids(group_id, entry) or not entry.has_member(wxid):
+            return None
+        return self._load_member(entry, wxid)
+
     def check_friend_status(self, wxid: str) -> int:
         """
         说明:
@@ -536,6 +693,7 @@ class ComWechatApi(ComProgress):
         status = self.robot.CStopReceiveMessage(self.wechat_pid)
         return status == 0
 
+    @com_call(Lane.BULK)
     def get_db_handles(self) -> dict:
         """
         说明:
@@ -562,6 +720,7 @@ class ComWechatApi(ComProgress):
             )
         return dbs
 
+    @com_call(Lane.BULK)
     def execute_sql(self, handle: int, sql: str) -> list:
         """
         说明:
@@ -590,6 +749,7 @@ class ComWechatApi(ComProgress):
             query_list.append(query_dict)
         return query_list
 
+    @com_call(Lane.BULK, timeout=300)
     def backup_db(self, handle: int, file_path: str) -> bool:
         """
         说明:
@@ -880,20 +1040,73 @@ class ComWechatApi(ComProgress):
         )
         return stauts == 0
 
-    def get_groupmember_nickname(self, group_id: str, wxid: str) -> str:
+    def get_groupmember_nickname(
+        self, group_id: str, wxid: str, use_cache: bool = True
+    ) -> str:
         """
         说明:
-            获取群成员昵称
+            获取群成员昵称，结果按群缓存
 
         参数:
             * `group_id`: 群聊id
             * `wxid`: 群成员wxid
+            * `use_cache`: 是否使用缓存
 
         返回:
             * `str`: 成功返回群成员昵称,失败返回空字符串
         """
+        entry = self.members.entry(group_id)
+        nickname = entry.nicknames.get(wxid) if use_cache else None
+        self.members.count(int(nickname is not None), int(nickname is None))
+        if nickname is None:
+            nickname = self.robot.CGetChatRoomMemberNickname(
+                self.wechat_pid, group_id, wxid
+            )
+            if nickname:
+                entry.nicknames[wxid] = nickname
+        return nickname
 
-        return self.robot.CGetChatRoomMemberNickname(self.wechat_pid, group_id, wxid)
+    @com_call(Lane.SEND)
+    def get_groupmember_nicknames(
+        self, group_id: str, wxid_list: list[str]
+    ) -> dict[str, str]:
+        """
+        说明:
+            批量获取群成员昵称，用于一次解析一条消息中的所有@；
+            有未缓存的昵称时先获取群成员列表，不在群内的成员不再逐个查询
+
+        参数:
+            * `group_id`: 群聊id
+            * `wxid_list`: 群成员wxid列表
+
+        返回:
+            * `dict[str, str]`: wxid -> 昵称，不在群内或获取失败时为空字符串
+        """
+        entry = self.members.entry(group_id)
+        result: dict[str, str] = {}
+        missing: list[str] = []
+        for wxid in wxid_list:
+            nickname = entry.nicknames.get(wxid)
+            if nickname is not None:
+                result[wxid] = nickname
+            elif wxid not in result:
+                missing.append(wxid)
+                result[wxid] = ""
+        self.members.count(len(wxid_list) - len(missing), len(missing))
+        if not missing:
+            return result
+        # 成员列表获取失败时逐个查询
+        self._load_member_ids(group_id, entry)
+        for wxid in missing:
+            if entry.has_member(wxid) is False:
+                continue
+            nickname = self.robot.CGetChatRoomMemberNickname(
+                self.wechat_pid, group_id, wxid
+            )
+            if nickname:
+                entry.nicknames[wxid] = nickname
+                result[wxid] = nickname
+        return result
 
     def delete_groupmember(self, group_id: str, wxid_list: Union[str, list]) -> bool:
         """
@@ -909,6 +1122,7 @@ class ComWechatApi(ComProgress):
         """
 
         status = self.robot.CDelChatRoomMember(self.wechat_pid, group_id, wxid_list)
+        self.members.invalidate(group_id)
         return status == 0
 
     def add_groupmember(self, group_id: str, wxid_list: Union[str, list]) -> bool:
@@ -925,6 +1139,7 @@ class ComWechatApi(ComProgress):
         """
 
         status = self.robot.CAddChatRoomMember(self.wechat_pid, group_id, wxid_list)
+        self.members.invalidate(group_id)
         return status == 0
 
     def open_browser(self, url: str) -> bool:
@@ -942,6 +1157,7 @@ class ComWechatApi(ComProgress):
         status = self.robot.COpenBrowser(self.wechat_pid, url)
         return status == 0
 
+    @com_call(Lane.BULK)
     def get_history_public_msg(self, public_id: str, offset: str = "") -> dict:
         """
         说明:
@@ -962,6 +1178,7 @@ class ComWechatApi(ComProgress):
             pass
         return ret
 
+    @com_call(Lane.SEND)
     def send_forward_msg(self, wxid: str, message_id: int) -> bool:
         """
         说明:
@@ -1017,6 +1234,7 @@ class ComWechatApi(ComProgress):
             pass
         return ret
 
+    @com_call(Lane.SEND)
     def send_xml(self, wxid: str, xml: str, image_path: str = "") -> bool:
         """
         说明:
@@ -1067,6 +1285,7 @@ class ComWechatApi(ComProgress):
         )
         return status == 0
 
+    @com_call(Lane.SEND)
     def send_gif(self, wxid: str, image_path: str) -> bool:
         """
         说明:
@@ -1116,7 +1335,7 @@ class ComWechatApi(ComProgress):
             成功返回文件路径，失败返回空字符串.
 
         """
-        path = self._GetMsgCDN(msgid=msgid)
+        path = await self.executor.run(self._GetMsgCDN, msgid=msgid)
         if path != "":
             file = Path(path)
             while not file.exists():
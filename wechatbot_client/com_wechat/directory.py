@@ -0,0 +1,266 @@
+"""
+通讯录目录，在内存中索引`CGetFriendList`返回的通讯录
+
+通讯录只在第一次使用时整体获取一次，之后由好友增加、通过好友请求、删除好友、
+修改备注等操作增量更新，按wxid、备注、微信号、昵称的查找都是一次字典查找。
+"""
+import threading
+from bisect import bisect_left
+from enum import Enum
+from typing import Iterable, Literal, Optional
+
+SearchField = Literal["wxRemark", "wxNumber", "wxNickName"]
+"""可以搜索的字段"""
+
+INDEXED_FIELDS: tuple[SearchField, ...] = ("wxRemark", "wxNumber", "wxNickName")
+"""建立索引的字段"""
+
+MAX_REQUESTS = 1000
+"""最多记录的未处理好友请求数，超过时丢弃最早的请求"""
+
+
+class ContactType(str, Enum):
+    """
+    联系人分类
+    """
+
+    FRIEND = "friend"
+    """好友"""
+    GROUP = "group"
+    """群聊"""
+    PUBLIC = "public"
+    """公众号"""
+    OTHER = "other"
+    """其他"""
+
+
+def contact_type(contact: dict) -> ContactType:
+    """获取联系人分类，规则与原来的好友、群聊、公众号列表筛选一致"""
+    wx_type = contact.get("wxType")
+    if wx_type == 2:
+        return ContactType.GROUP
+    if wx_type == 3:
+        if contact["wxid"].startswith("gh_"):
+            return ContactType.PUBLIC
+        return ContactType.FRIEND
+    return ContactType.OTHER
+
+
+class ContactDirectory:
+    """
+    通讯录目录
+
+    联系人为通讯录中的原始字典(`wxid`、`wxNickName`、`wxRemark`、`wxNumber`、`wxType`等)，
+    所有方法都可以在任意线程中调用。
+    """
+
+    loaded: bool
+    """是否已经获取过通讯录"""
+    _contacts: dict[str, dict]
+    """wxid -> 联系人，按加入顺序"""
+    _partitions: dict[ContactType, dict[str, dict]]
+    """分类 -> (wxid -> 联系人)"""
+    _indexes: dict[SearchField, dict[str, dict[str, None]]]
+    """字段 -> (字段值 -> 有序的wxid集合)"""
+    _sorted: dict[SearchField, Optional[list[str]]]
+    """字段 -> 排序后的字段值，用于前缀搜索，修改后在下次搜索时重建"""
+    _requests: dict[str, tuple[str, str]]
+    """未处理的好友请求：v3 -> (wxid, 昵称)"""
+    _lock: threading.RLock
+    """保护以上数据"""
+
+    def __init__(self) -> None:
+        self.loaded = False
+        self._contacts = {}
+        self._partitions = {one: {} for one in ContactType}
+        self._indexes = {field: {} for field in INDEXED_FIELDS}
+        self._sorted = {field: None for field in INDEXED_FIELDS}
+        self._requests = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._contacts)
+
+    def _index(self, contact: dict) -> None:
+        """加入索引"""
+        wxid = contact["wxid"]
+        self._contacts[wxid] = contact
+        self._partitions[contact_type(contact)][wxid] = contact
+        for field in INDEXED_FIELDS:
+            value = contact.get(field)
+            if value:
+                self._indexes[field].setdefault(value, {})[wxid] = None
+                self._sorted[field] = None
+
+    def _unindex(self, wxid: str) -> Optional[dict]:
+        """移出索引"""
+        contact = self._contacts.pop(wxid, None)
+        if contact is None:
+            return None
+        self._partitions[contact_type(contact)].pop(wxid, None)
+        for field in INDEXED_FIELDS:
+            value = contact.get(field)
+            if not value:
+                continue
+            wxids = self._indexes[field].get(value)
+            if wxids is not None:
+                wxids.pop(wxid, None)
+                if not wxids:
+                    del self._indexes[field][value]
+                    self._sorted[field] = None
+        return contact
+
+    def load(self, contacts: Iterable[dict]) -> None:
+        """
+        说明:
+            用完整的通讯录替换目录
+
+        参数:
+            * `contacts`: 通讯录列表
+        """
+        with self._lock:
+            self._contacts = {}
+            self._partitions = {one: {} for one in ContactType}
+            self._indexes = {field: {} for field in INDEXED_FIELDS}
+            self._sorted = {field: None for field in INDEXED_FIELDS}
+            for contact in contacts:
+                self._index(contact)
+            self.loaded = True
+
+    def upsert(self, contact: dict) -> None:
+        """
+        说明:
+            加入或替换一个联系人
+
+        参数:
+            * `contact`: 联系人，需要有`wxid`字段
+        """
+        with self._lock:
+            self._unindex(contact["wxid"])
+            self._index(contact)
+
+    def update(self, wxid: str, **fields: object) -> Optional[dict]:
+        """
+        说明:
+            修改联系人的字段，联系人不存在时不做处理
+
+        参数:
+            * `wxid`: 联系人wxid
+            * `fields`: 要修改的字段，如`wxRemark="备注"`
+
+        返回:
+            * `dict | None`: 修改后的联系人
+        """
+        with self._lock:
+            contact = self._contacts.get(wxid)
+            if contact is None:
+                return None
+            contact = {**contact, **fields}
+            self._unindex(wxid)
+            self._index(contact)
+            return contact
+
+    def remove(self, wxid: str) -> Optional[dict]:
+        """移除联系人，返回被移除的联系人"""
+        with self._lock:
+            return self._unindex(wxid)
+
+    def get(self, wxid: str) -> Optional[dict]:
+        """通过wxid获取联系人"""
+        return self._contacts.get(wxid)
+
+    def all(self) -> list[dict]:
+        """获取所有联系人"""
+        with self._lock:
+            return list(self._contacts.values())
+
+    def partition(self, type: ContactType) -> list[dict]:
+        """获取一类联系人"""
+        with self._lock:
+            return list(self._partitions[type].values())
+
+    def find(self, field: SearchField, value: str) -> Optional[dict]:
+        """
+        说明:
+            按字段精确查找，有多个时返回最早加入的联系人
+
+        参数:
+            * `field`: 字段名
+            * `value`: 字段值
+
+        返回:
+            * `dict | None`: 联系人
+        """
+        with self._lock:
+            wxids = self._indexes[field].get(value)
+            if not wxids:
+                return None
+            return self._contacts[next(iter(wxids))]
+
+    def search(
+        self,
+        field: SearchField,
+        keyword: str,
+        match: Literal["exact", "prefix", "substring"] = "prefix",
+        limit: int = 20,
+    ) -> list[dict]:
+        """
+        说明:
+            按字段搜索联系人
+
+        参数:
+            * `field`: 字段名
+            * `keyword`: 关键字
+            * `match`: 匹配方式：精确、前缀(按字段值排序)、包含(按加入顺序)
+            * `limit`: 最多返回的数量
+
+        返回:
+            * `list[dict]`: 联系人列表
+        """
+        with self._lock:
+            index = self._indexes[field]
+            if match == "exact":
+                values: Iterable[str] = [keyword] if keyword in index else []
+            elif match == "prefix":
+                values = self._prefix_values(field, keyword)
+            else:
+                values = (value for value in index if keyword in value)
+            result = []
+            for value in values:
+                for wxid in index[value]:
+                    result.append(self._contacts[wxid])
+                    if len(result) >= limit:
+                        return result
+            return result
+
+    def _prefix_values(self, field: SearchField, prefix: str) -> Iterable[str]:
+        """按前缀匹配的字段值"""
+        values = self._sorted[field]
+        if values is None:
+            values = self._sorted[field] = sorted(self._indexes[field])
+        for position in range(bisect_left(values, prefix), len(values)):
+            value = values[position]
+            if not value.startswith(prefix):
+                break
+            yield value
+
+    def add_request(self, v3: str, wxid: str, nickname: str) -> None:
+        """记录一个好友请求，通过请求后用于更新目录"""
+        with self._lock:
+            self._requests[v3] = (wxid, nickname)
+            if len(self._requests) > MAX_REQUESTS:
+                del self._requests[next(iter(self._requests))]
+
+    def pop_request(self, v3: str) -> Optional[tuple[str, str]]:
+        """取出好友请求的(wxid, 昵称)"""
+        with self._lock:
+            return self._requests.pop(v3, None)
+
+    def get_status(self) -> dict:
+        """获取目录状态"""
+        return {
+            "loaded": self.loaded,
+            "total": len(self._contacts),
+            **{one.value: len(self._partitions[one]) for one in ContactType},
+            "pending_requests": len(self._requests),
+        }
@@ -0,0 +1,410 @@
+"""
+com调用执行器，所有com调用都在同一个专用线程中执行
+
+com接口都是同步阻塞的，直接在事件循环中调用时，慢的调用(如`CGetFriendList`、`CExecuteSQL`)
+会卡住所有连接。这里用一个单线程执行器串行执行com调用：
+ - 线程启动时初始化com套间，robot对象也在该线程中创建，调用不需要跨套间；
+ - 调用按通道排队，发送消息优先于普通查询，普通查询优先于批量查询；
+ - 异步调用有超时，超时后未开始的调用会被取消。
+"""
+import asyncio
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from enum import IntEnum
+from typing import Any, Callable, NamedTuple, Optional
+
+from wechatbot_client.metrics import REGISTRY
+
+COM_QUEUE = REGISTRY.gauge("com_queue_depth", "等待执行的com调用数", ("lane",))
+COM_WAIT = REGISTRY.histogram("com_queue_wait_seconds", "com调用的排队时间", ("lane",))
+COM_SECONDS = REGISTRY.histogram(
+    "com_call_seconds", "com调用的执行时间", ("method", "result")
+)
+
+
+class Lane(IntEnum):
+    """
+    调用通道，值越小越先执行
+    """
+
+    SEND = 0
+    """发送消息"""
+    QUERY = 1
+    """普通查询与其他操作"""
+    BULK = 2
+    """批量查询，如通讯录、数据库"""
+
+
+class ComCall(NamedTuple):
+    """
+    com调用的执行方式
+    """
+
+    lane: Lane
+    """调用通道"""
+    timeout: Optional[float]
+    """超时时间，单位：秒，为None时使用通道的默认超时"""
+
+
+DEFAULT_CALL = ComCall(Lane.QUERY, None)
+"""未标注的调用的执行方式"""
+
+
+def com_call(lane: Lane, timeout: Optional[float] = None) -> Callable:
+    """
+    说明:
+        标注函数在执行器中的调用通道与超时时间
+
+    参数:
+        * `lane`: 调用通道
+        * `timeout`: 超时时间，单位：秒，默认使用通道的默认超时
+    """
+
+    def _decorator(func: Callable) -> Callable:
+        func.__com_call__ = ComCall(lane, timeout)
+        return func
+
+    return _decorator
+
+
+def get_com_call(func: Callable) -> ComCall:
+    """获取函数标注的执行方式"""
+    return getattr(func, "__com_call__", DEFAULT_CALL)
+
+
+class ComCallTimeout(TimeoutError):
+    """com调用超时"""
+
+    method: str
+    timeout: float
+
+    def __init__(self, method: str, timeout: float) -> None:
+        self.method = method
+        self.timeout = timeout
+
+    def __repr__(self) -> str:
+        return f"com调用超时:{self.method}({self.timeout}s)"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+
+class _WorkItem:
+    """
+    一次排队的调用
+    """
+
+    __slots__ = ("future", "func", "args", "kwargs", "lane", "queued", "started")
+
+    def __init__(
+        self, future: Future, func: Callable, args: tuple, kwargs: dict, lane: Lane
+    ) -> None:
+        self.future = future
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.lane = lane
+        self.queued = time.perf_counter()
+        self.started = 0.0
+
+    def run(self) -> None:
+        """在执行器线程中执行"""
+        if not self.future.set_running_or_notify_cancel():
+            return
+        self.started = time.perf_counter()
+        try:
+            result = self.func(*self.args, **self.kwargs)
+        except BaseException as e:
+            self.future.set_exception(e)
+        else:
+            self.future.set_result(result)
+
+
+class ComExecutor:
+    """
+    单线程com执行器
+    """
+
+    initializer: Optional[Callable[[], None]]
+    """线程启动时调用，用于初始化com套间"""
+    finalizer: Optional[Callable[[], None]]
+    """线程退出时调用"""
+    timeouts: dict[Lane, Optional[float]]
+    """各通道的默认超时时间，单位：秒，为None时不超时"""
+    timeout_count: int
+    """超时的调用数"""
+    _queue: "queue.PriorityQueue[tuple[int, int, Optional[_WorkItem]]]"
+    """调用队列，按(通道, 序号)排序"""
+    _counter: itertools.count
+    """入队序号，同一通道内先进先出"""
+    _depth: dict[Lane, int]
+    """各通道排队中的调用数"""
+    _lock: threading.Lock
+    """保护`_depth`"""
+    _thread: Optional[threading.Thread]
+    """执行器线程"""
+    _current: Optional[_WorkItem]
+    """正在执行的调用"""
+
+    def __init__(
+        self,
+        initializer: Optional[Callable[[], None]] = None,
+        finalizer: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """
+        参数:
+            * `initializer`: 线程启动时调用，如`comtypes.CoInitialize`
+            * `finalizer`: 线程退出时调用，如`comtypes.CoUninitialize`
+        """
+        self.initializer = initializer
+        self.finalizer = finalizer
+        self.timeouts = {lane: None for lane in Lane}
+        self.timeout_count = 0
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._depth = {lane: 0 for lane in Lane}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._current = None
+        COM_QUEUE.set_function(self._depth_samples)
+
+    def _depth_samples(self) -> dict[tuple[str, ...], int]:
+        """队列长度指标"""
+        return {(lane.name.lower(),): depth for lane, depth in self._depth.items()}
+
+    @property
+    def running(self) -> bool:
+        """执行器线程是否在运行"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def in_executor(self) -> bool:
+        """当前是否在执行器线程中"""
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def start(self) -> None:
+        """
+        说明:
+            启动执行器线程，已启动时不做处理
+
+        错误:
+            * `initializer`抛出的异常
+        """
+        if self.running:
+            return
+        started = threading.Event()
+        error: list[BaseException] = []
+        self._thread = threading.Thread(
+            target=self._run, args=(started, error), name="com-executor", daemon=True
+        )
+        self._thread.start()
+        started.wait()
+        if error:
+            self._thread.join()
+            self._thread = None
+            raise error[0]
+
+    def shutdown(self, timeout: Optional[float] = 5) -> None:
+        """
+        说明:
+            停止执行器，排队中的调用会被取消，正在执行的调用会执行完
+
+        参数:
+            * `timeout`: 等待线程退出的时间，单位：秒
+        """
+        if self._thread is None:
+            return
+        while True:
+            try:
+                _, _, item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                with self._lock:
+                    self._depth[item.lane] -= 1
+                item.future.cancel()
+        self._queue.put((len(Lane), next(self._counter), None))
+        if not self.in_executor():
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self, started: threading.Event, error: list[BaseException]) -> None:
+        """执行器线程"""
+        try:
+            if self.initializer is not None:
+                self.initializer()
+        except BaseException as e:
+            error.append(e)
+            started.set()
+            return
+        started.set()
+        try:
+            while True:
+                _, _, item = self._queue.get()
+                if item is None:
+                    break
+                with self._lock:
+                    self._depth[item.lane] -= 1
+                self._current = item
+                item.run()
+                self._current = None
+        finally:
+            if self.finalizer is not None:
+                self.finalizer()
+
+    def submit(
+        self, func: Callable, *args: Any, lane: Lane = Lane.QUERY, **kwargs: Any
+    ) -> Future:
+        """
+        说明:
+            提交一个调用，可以在任意线程中调用
+
+        参数:
+            * `func`: 调用的函数
+            * `args`, `kwargs`: 调用参数
+            * `lane`: 调用通道
+
+        返回:
+            * `Future`: 调用结果
+
+        错误:
+            * `RuntimeError`: 执行器未启动
+        """
+        return self._enqueue(func, args, kwargs, lane).future
+
+    def _enqueue(
+        self, func: Callable, args: tuple, kwargs: dict, lane: Lane
+    ) -> _WorkItem:
+        """调用入队"""
+        if self._thread is None:
+            raise RuntimeError("com执行器未启动")
+        item = _WorkItem(Future(), func, args, kwargs, lane)
+        with self._lock:
+            self._depth[lane] += 1
+        self._queue.put((lane, next(self._counter), item))
+        return item
+
+    def call(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        """
+        说明:
+            同步调用，在执行器线程中直接执行，在其他线程中提交后阻塞等待结果；
+            不要在事件循环中使用，事件循环中应使用`run`
+        """
+        if self._thread is None or self.in_executor():
+            return func(*args, **kwargs)
+        return self.submit(func, *args, lane=get_com_call(func).lane, **kwargs).result()
+
+    async def run(
+        self,
+        func: Callable,
+        *args: Any,
+        lane: Optional[Lane] = None,
+        timeout: Optional[float] = None,
+        **kwargs: Any,
+    ) -> Any:
+        """
+        说明:
+            在执行器中异步调用，通道与超时默认使用`com_call`的标注
+
+        参数:
+            * `func`: 调用的函数
+            * `args`, `kwargs`: 调用参数
+            * `lane`: 调用通道
+            * `timeout`: 超时时间，单位：秒
+
+        返回:
+            * `Any`: 调用结果
+
+        错误:
+            * `ComCallTimeout`: 调用超时，已开始执行的调用无法中断，会在后台执行完
+            * 调用抛出的异常
+        """
+        mark = get_com_call(func)
+        lane = mark.lane if lane is None else lane
+        if timeout is None:
+            timeout = mark.timeout if mark.timeout is not None else self.timeouts[lane]
+        name = getattr(func, "__name__", repr(func))
+        item = self._enqueue(func, args, kwargs, lane)
+        result = "ok"
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(item.future), timeout)
+        except asyncio.TimeoutError:
+            result = "timeout"
+            self.timeout_count += 1
+            raise ComCallTimeout(name, timeout) from None
+        except BaseException:
+            result = "error"
+            raise
+        finally:
+            # 未开始执行的调用按入队时间计算
+            started = item.started or item.queued
+            if item.started:
+                COM_WAIT.observe(item.started - item.queued, lane.name.lower())
+            COM_SECONDS.observe(time.perf_counter() - started, name, result)
+
+    def get_status(self) -> dict:
+        """获取运行状态"""
+        current = self._current
+        return {
+            "running": self.running,
+            "queue": {lane.name.lower(): depth for lane, depth in self._depth.items()},
+            "current": getattr(current.func, "__name__", None) if current else None,
+            "current_seconds": (
+                round(time.perf_counter() - current.started, 3) if current else 0
+            ),
+            "timeouts": self.timeout_count,
+        }
+
+
+class ComObjectProxy:
+    """
+    com对象代理，在其他线程中调用方法时转到执行器线程执行，保证对象只在创建它的套间中使用
+    """
+
+    def __init__(self, executor: ComExecutor, obj: Any) -> None:
+        self._executor = executor
+        self._obj = obj
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._obj, name)
+        if not callable(attr):
+            return attr
+        executor = self._executor
+
+        def _call(*args: Any, **kwargs: Any) -> Any:
+            return executor.call(attr, *args, **kwargs)
+
+        return _call
+
+    def release(self) -> None:
+        """释放com对象，需要在执行器线程中调用"""
+        self._obj = None
+
+
+class AsyncComApi:
+    """
+    com接口的异步门面，`await api.send_text(...)`会在执行器中调用`target.send_text(...)`，
+    通道与超时使用方法上`com_call`的标注
+    """
+
+    def __init__(self, target: Any, executor: ComExecutor) -> None:
+        """
+        参数:
+            * `target`: 被包装的同步接口，如`ComWechatApi`
+            * `executor`: com执行器
+        """
+        self._target = target
+        self._executor = executor
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        func = getattr(self._target, name)
+        executor = self._executor
+
+        async def _call(*args: Any, **kwargs: Any) -> Any:
+            return await executor.run(func, *args, **kwargs)
+
+        _call.__name__ = name
+        setattr(self, name, _call)
+        return _call
@@ -0,0 +1,53 @@
+"""
+模拟的com robot对象，用于在没有微信与com组件的环境下测试与基准测试
+
+用法:
+    robot = FakeRobot({"CSendText": 0}, delays={"CGetFriendList": 2})
+    api = ComWechatApi(robot_factory=lambda: robot, executor=ComExecutor())
+"""
+import threading
+import time
+from typing import Any, Callable, Optional, Union
+
+
+class FakeRobot:
+    """
+    模拟的`WeChatRobot.CWeChatRobot`，任意`C`开头的方法都可以调用
+    """
+
+    responses: dict[str, Union[Any, Callable[..., Any]]]
+    """方法名 -> 返回值，为可调用对象时使用调用参数调用它获取返回值；未设置的方法返回None"""
+    delays: dict[str, float]
+    """方法名 -> 模拟的阻塞时间，单位：秒"""
+    calls: list[tuple[str, tuple, str]]
+    """调用记录：(方法名, 参数, 调用所在线程名)"""
+
+    def __init__(
+        self,
+        responses: Optional[dict[str, Any]] = None,
+        delays: Optional[dict[str, float]] = None,
+    ) -> None:
+        self.responses = responses or {}
+        self.delays = delays or {}
+        self.calls = []
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        if not name.startswith("C"):
+            raise AttributeError(name)
+
+        def _method(*args: Any) -> Any:
+            self.calls.append((name, args, threading.current_thread().name))
+            delay = self.delays.get(name)
+            if delay:
+                time.sleep(delay)
+            response = self.responses.get(name)
+            if callable(response):
+                return response(*args)
+            return response
+
+        _method.__name__ = name
+        return _method
+
+    def called(self, name: str) -> list[tuple]:
+        """获取某个方法的所有调用参数"""
+        return [args for method, args, _ in self.calls if method == name]
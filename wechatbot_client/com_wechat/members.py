@@ -0,0 +1,126 @@
+"""
+群成员缓存，按群缓存成员列表、成员信息与群昵称
+
+发送群消息时每个`mention`都需要查询一次群昵称，获取群成员信息时需要查询整个群，
+这里按群缓存查询结果，缓存在`ttl`秒后过期，收到群成员增加、减少的系统提示，
+或者通过接口增删群成员后整个群的缓存失效。
+"""
+import re
+import threading
+import time
+from typing import Optional
+
+MEMBER_CHANGE_PATTERN = re.compile(r"(加入了?群聊|移出了?群聊|退出了?群聊)")
+"""群成员变动的系统提示，如：邀请xxx加入了群聊、通过扫描xxx分享的二维码加入群聊、将xxx移出了群聊"""
+
+
+def is_member_change(group_id: str, text: str) -> bool:
+    """系统提示是否为群成员变动"""
+    return "@chatroom" in group_id and MEMBER_CHANGE_PATTERN.search(text) is not None
+
+
+class GroupEntry:
+    """
+    一个群的缓存，失效后仍在执行的查询只会写入已丢弃的对象
+    """
+
+    __slots__ = ("info", "member_ids", "members", "nicknames", "created")
+
+    info: Optional[dict]
+    """群聊信息，`get_user_info(group_id)`的结果"""
+    member_ids: Optional[dict[str, None]]
+    """有序的成员wxid集合，为None时未获取"""
+    members: dict[str, dict]
+    """wxid -> 成员信息"""
+    nicknames: dict[str, str]
+    """wxid -> 群昵称"""
+    created: float
+    """创建时间"""
+
+    def __init__(self) -> None:
+        self.info = None
+        self.member_ids = None
+        self.members = {}
+        self.nicknames = {}
+        self.created = time.monotonic()
+
+    def has_member(self, wxid: str) -> Optional[bool]:
+        """是否为群成员，成员列表未获取时返回None"""
+        if self.member_ids is None:
+            return None
+        return wxid in self.member_ids
+
+
+class GroupMemberCache:
+    """
+    群成员缓存，所有方法都可以在任意线程中调用
+    """
+
+    ttl: float
+    """缓存有效时间，单位：秒，为0时不缓存"""
+    hits: int
+    """命中次数"""
+    misses: int
+    """未命中次数"""
+    invalidations: int
+    """失效次数"""
+    _groups: dict[str, GroupEntry]
+    """群id -> 缓存"""
+    _lock: threading.Lock
+    """保护`_groups`"""
+
+    def __init__(self, ttl: float = 600) -> None:
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    def entry(self, group_id: str) -> GroupEntry:
+        """
+        说明:
+            获取群的缓存，不存在或已过期时创建新的缓存
+
+        参数:
+            * `group_id`: 群聊id
+
+        返回:
+            * `GroupEntry`: 群缓存，不缓存时每次都是新对象
+        """
+        if self.ttl <= 0:
+            return GroupEntry()
+        with self._lock:
+            entry = self._groups.get(group_id)
+            if entry is None or time.monotonic() - entry.created > self.ttl:
+                entry = self._groups[group_id] = GroupEntry()
+            return entry
+
+    def count(self, hits: int, misses: int) -> None:
+        """记录命中与未命中次数"""
+        self.hits += hits
+        self.misses += misses
+
+    def invalidate(self, group_id: str) -> bool:
+        """使一个群的缓存失效，返回是否存在缓存"""
+        with self._lock:
+            entry = self._groups.pop(group_id, None)
+        if entry is None:
+            return False
+        self.invalidations += 1
+        return True
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._groups = {}
+
+    def get_status(self) -> dict:
+        """获取缓存状态"""
+        return {
+            "ttl": self.ttl,
+            "groups": len(self._groups),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
@@ -866,6 +866,25 @@ class SysNoticeHandler(Generic[E]):
     系统提示处理器
     """
 
+    @classmethod
+    @add_sys_notice_handler
+    def friend_added(cls, msg: WechatMessage) -> Optional[E]:
+        """
+        好友增加，提示为：你已添加了xxx，现在可以开始聊天了。
+        """
+        if "@chatroom" in msg.sender:
+            return None
+        if not (
+            msg.message.startswith("你已添加了") and "现在可以开始聊天了" in msg.message
+        ):
+            return None
+        return FriendIncreaseEvent(
+            id=str(uuid4()),
+            time=msg.timestamp,
+            self=BotSelf(user_id=msg.self),
+            user_id=msg.sender,
+        )
+
     @classmethod
     @add_sys_notice_handler
     def read_bag(cls, msg: WechatMessage) -> Optional[E]:
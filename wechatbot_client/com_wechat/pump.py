@@ -0,0 +1,264 @@
+"""
+消息泵，在独立线程中接收com消息，通过有界队列交给事件循环
+
+com的消息循环(`PumpEvents`)会阻塞线程，放在事件循环中会让事件循环每次被阻塞一段时间，
+空闲时也一直占用cpu。这里每个消息源有一个专用线程，消息先进入有界队列，
+再用`call_soon_threadsafe`唤醒事件循环批量取出，队列满时阻塞泵线程而不是事件循环。
+
+只依赖标准库，可以用`FakeMessageSource`在非Windows环境下测试。
+"""
+import abc
+import asyncio
+import queue
+import threading
+from signal import SIGINT, raise_signal
+from typing import Awaitable, Callable, Optional
+
+MessageHandler = Callable[[str], Awaitable[None]]
+"""消息处理函数"""
+
+DRAIN_BATCH = 100
+"""事件循环每次从队列取出的最大消息数，避免消息积压时长时间占用事件循环"""
+
+
+class MessageSource(abc.ABC):
+    """
+    消息源，所有方法都在泵线程中调用
+    """
+
+    @abc.abstractmethod
+    def open(self, emit: Callable[[str], None]) -> None:
+        """
+        说明:
+            开始接收消息
+
+        参数:
+            * `emit`: 收到消息时调用，可能阻塞到队列有空位
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def pump(self, timeout: float) -> None:
+        """
+        说明:
+            处理到达的消息，没有消息时最多阻塞`timeout`秒
+
+        参数:
+            * `timeout`: 最长阻塞时间，单位：秒
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """停止接收消息，释放资源"""
+
+
+class FakeMessageSource(MessageSource):
+    """
+    模拟的消息源，`send`可以在任意线程调用，用于测试与基准测试
+    """
+
+    _messages: "queue.SimpleQueue[str]"
+    """待发出的消息"""
+    _emit: Optional[Callable[[str], None]]
+    """消息回调"""
+
+    def __init__(self) -> None:
+        self._messages = queue.SimpleQueue()
+        self._emit = None
+
+    def send(self, message: str) -> None:
+        """模拟com上报一条消息"""
+        self._messages.put(message)
+
+    def open(self, emit: Callable[[str], None]) -> None:
+        self._emit = emit
+
+    def pump(self, timeout: float) -> None:
+        try:
+            message = self._messages.get(timeout=timeout)
+        except queue.Empty:
+            return
+        self._emit(message)
+        # 一次处理完已到达的消息
+        while True:
+            try:
+                message = self._messages.get_nowait()
+            except queue.Empty:
+                return
+            self._emit(message)
+
+
+class MessagePump:
+    """
+    消息泵，管理泵线程与线程间的消息队列
+    """
+
+    source: MessageSource
+    """消息源"""
+    handler: MessageHandler
+    """消息处理函数，在事件循环中为每条消息创建一个任务"""
+    interval: float
+    """泵线程检查停止标记的间隔，单位：秒"""
+    received: int
+    """收到的消息数"""
+    dispatched: int
+    """交给事件循环的消息数"""
+    dropped: int
+    """停止时仍未交给事件循环而丢弃的消息数"""
+    _queue: "queue.Queue[str]"
+    """泵线程与事件循环之间的有界队列"""
+    _loop: Optional[asyncio.AbstractEventLoop]
+    """事件循环"""
+    _thread: Optional[threading.Thread]
+    """泵线程"""
+    _stopping: threading.Event
+    """停止标记"""
+    _scheduled: bool
+    """是否已经安排了一次取出，避免每条消息都唤醒一次事件循环"""
+    _lock: threading.Lock
+    """保护`_scheduled`"""
+    _tasks: set[asyncio.Task]
+    """处理中的消息任务，保存引用防止被回收"""
+
+    def __init__(
+        self,
+        source: MessageSource,
+        handler: MessageHandler,
+        maxsize: int = 1000,
+        interval: float = 0.5,
+    ) -> None:
+        """
+        参数:
+            * `source`: 消息源
+            * `handler`: 消息处理函数
+            * `maxsize`: 队列大小，队列满时泵线程等待
+            * `interval`: 泵线程检查停止标记的间隔，单位：秒
+        """
+        self.source = source
+        self.handler = handler
+        self.interval = interval
+        self.received = 0
+        self.dispatched = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize)
+        self._loop = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._scheduled = False
+        self._lock = threading.Lock()
+        self._tasks = set()
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """
+        说明:
+            启动泵线程，等待消息源打开后返回
+
+        参数:
+            * `loop`: 处理消息的事件循环，默认为当前运行的事件循环
+
+        错误:
+            * 消息源打开失败时抛出其异常
+        """
+        self._loop = loop or asyncio.get_running_loop()
+        self._stopping.clear()
+        opened = threading.Event()
+        error: list[BaseException] = []
+        self._thread = threading.Thread(
+            target=self._run, args=(opened, error), name="com-pump", daemon=True
+        )
+        self._thread.start()
+        opened.wait()
+        if error:
+            self._thread.join()
+            self._thread = None
+            raise error[0]
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        说明:
+            停止泵线程，未交给事件循环的消息会被丢弃
+
+        参数:
+            * `timeout`: 等待线程退出的时间，默认等待`interval`的两倍
+        """
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(self.interval * 2 if timeout is None else timeout)
+        self._thread = None
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self.dropped += 1
+
+    def get_status(self) -> dict:
+        """获取运行状态"""
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "queue": self._queue.qsize(),
+            "max_queue": self._queue.maxsize,
+            "received": self.received,
+            "dispatched": self.dispatched,
+            "dropped": self.dropped,
+        }
+
+    def _run(self, opened: threading.Event, error: list[BaseException]) -> None:
+        """泵线程"""
+        try:
+            self.source.open(self._emit)
+        except BaseException as e:
+            error.append(e)
+            opened.set()
+            return
+        opened.set()
+        try:
+            while not self._stopping.is_set():
+                self.source.pump(self.interval)
+        except KeyboardInterrupt:
+            # 控制台中断在泵线程中触发时，交给主线程处理
+            raise_signal(SIGINT)
+        finally:
+            self.source.close()
+
+    def _emit(self, message: str) -> None:
+        """在泵线程中调用，放入队列并唤醒事件循环"""
+        self.received += 1
+        while True:
+            try:
+                self._queue.put(message, timeout=self.interval)
+                break
+            except queue.Full:
+                if self._stopping.is_set():
+                    self.dropped += 1
+                    return
+        with self._lock:
+            if self._scheduled:
+                return
+            self._scheduled = True
+        try:
+            self._loop.call_soon_threadsafe(self._drain)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+    def _drain(self) -> None:
+        """在事件循环中调用，取出队列中的消息并创建处理任务，每次最多取`DRAIN_BATCH`条"""
+        with self._lock:
+            self._scheduled = False
+        for _ in range(DRAIN_BATCH):
+            try:
+                message = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            self.dispatched += 1
+            task = self._loop.create_task(self.handler(message))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        # 还有剩余消息，先让出事件循环
+        with self._lock:
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._loop.call_soon(self._drain)
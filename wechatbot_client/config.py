@@ -178,16 +178,38 @@ class Config(BaseConfig):
     """心跳间隔"""
     enable_http_api: bool = False
     """是否开启http api"""
+    http_stream_threshold: int = 1
+    """json请求体超过该大小时流式解析，`upload_file`的data字段直接解码写入文件，单位(Mb)，0 表示不开启"""
     event_enabled: bool = False
     """是否启用 get_latest_events 元动作"""
     event_buffer_size: int = 0
     """事件缓冲区大小，超过该大小将会丢弃最旧的事件，0 表示不限大小"""
+    event_buffer_memory: int = 64
+    """事件缓冲区内存上限，超过该大小将会丢弃最旧的事件，单位(Mb)，0 表示不限大小"""
     enable_http_webhook: bool = False
     """是否启用http webhook"""
     webhook_url: set[AnyUrl] = Field(default_factory=set)
     """webhook 上报地址"""
     webhook_timeout: int = 5000
     """上报请求超时时间，单位：毫秒，0 表示不超时"""
+    webhook_queue_size: int = 1000
+    """每个上报地址的内存队列大小，队列满时事件暂存到数据库或丢弃"""
+    webhook_retry_times: int = 3
+    """上报失败的重试次数"""
+    webhook_retry_interval: int = 1000
+    """首次重试间隔，之后每次翻倍，单位：毫秒"""
+    webhook_batch_size: int = 1
+    """单次上报的最大事件数，大于 1 时以json数组上报"""
+    webhook_batch_interval: int = 100
+    """批量上报时凑齐一批的最长等待时间，单位：毫秒"""
+    webhook_spill: bool = True
+    """队列满时是否将事件暂存到数据库，关闭时丢弃新事件"""
+    http_max_connections: int = 100
+    """http客户端连接池的最大连接数"""
+    http_max_keepalive: int = 20
+    """http客户端连接池保持的最大空闲长连接数"""
+    http_keepalive_expiry: int = 5000
+    """http客户端空闲长连接的保持时间，单位：毫秒"""
     websocekt_type: WebsocketType = WebsocketType.Backward
     """websocket连接方式"""
     websocket_url: set[WSUrl] = Field(default_factory=set)
@@ -196,12 +218,36 @@ class Config(BaseConfig):
     """反向 WebSocket 的缓冲区大小，单位(Mb)"""
     reconnect_interval: int = 5000
     """反向 WebSocket 重连间隔"""
+    websocket_action_concurrency: int = Field(default=16, ge=1)
+    """单个 WebSocket 连接同时处理的action数量上限"""
     log_level: Union[int, str] = "INFO"
     """默认日志等级"""
     log_days: int = 10
     """日志保存天数"""
     cache_days: int = 3
     """文件缓存天数"""
+    com_queue_size: int = Field(default=1000, ge=1)
+    """com消息线程与事件循环之间的队列大小"""
+    com_timeout: int = Field(default=10000, ge=0)
+    """com调用超时时间，单位：毫秒"""
+    com_bulk_timeout: int = Field(default=60000, ge=0)
+    """批量查询类com调用超时时间，单位：毫秒"""
+    group_member_ttl: int = Field(default=600, ge=0)
+    """群成员缓存有效时间，单位：秒"""
+    send_rate: float = Field(default=5, ge=0)
+    """全局每秒发送次数，0 为不限制"""
+    send_burst: int = Field(default=10, ge=1)
+    """全局最多连续发送次数"""
+    chat_send_rate: float = Field(default=1, ge=0)
+    """每个聊天每秒发送次数，0 为不限制"""
+    chat_send_burst: int = Field(default=5, ge=1)
+    """每个聊天最多连续发送次数"""
+    send_queue_size: int = Field(default=1000, ge=1)
+    """发送队列大小"""
+    send_coalesce: bool = True
+    """是否合并同一聊天中排队的纯文本消息"""
+    enable_metrics: bool = True
+    """是否开启 `/metrics` 指标接口"""
 
     class Config:
         extra = "allow"
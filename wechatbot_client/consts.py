@@ -24,3 +24,5 @@ DATABASE_PATH = "data"
 """数据库存放目录"""
 DOWNLOAD_TIMEOUT = 10
 """下载超时时间"""
+EVENT_CONSUMER_TIMEOUT = 600
+"""get_latest_events消费者过期时间，超过该时间未读取的消费者游标将被移除，单位：秒"""
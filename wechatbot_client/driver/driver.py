@@ -4,6 +4,7 @@
 import contextlib
 import logging
 import sys
+from http.cookiejar import CookieJar, DefaultCookiePolicy
 from typing import Any, AsyncGenerator, Callable, Optional, Tuple, Union
 
 import httpx
@@ -58,10 +59,13 @@ class Driver:
     connects: dict[int, Union[FastAPIWebSocket, BackwardWebSocket]]
     """维护的连接字典"""
     _seq: int
+    _clients: dict[Tuple[Optional[str], bool], httpx.AsyncClient]
+    """http客户端连接池，按(代理, 是否http2)复用"""
 
     def __init__(self, config: BaseConfig) -> None:
         self._seq = 0
         self.connects = {}
+        self._clients = {}
         self.config = config
         self.fastapi_config: Config = Config(**config.dict())
 
@@ -169,11 +173,42 @@ class Driver:
             **kwargs,
         )
 
+    def _should_stream(self, request: Request) -> bool:
+        """json请求体超过`http_stream_threshold`或长度未知时，不读入内存"""
+        threshold = self.config.http_stream_threshold
+        if threshold <= 0:
+            return False
+        if not request.headers.get("content-type", "").startswith("application/json"):
+            return False
+        length = request.headers.get("content-length")
+        if length is None or not length.isdigit():
+            return True
+        return int(length) > threshold * 1024 * 1024
+
     async def _handle_http(
         self,
         request: Request,
         setup: HTTPServerSetup,
     ) -> Response:
+        if self._should_stream(request):
+            http_request = BaseRequest(
+                request.method,
+                str(request.url),
+                headers=request.headers.items(),
+                cookies=request.cookies,
+                stream=request.stream(),
+                version=request.scope["http_version"],
+            )
+        else:
+            http_request = await self._read_request(request)
+
+        response = await setup.handle_func(http_request)
+        return Response(
+            response.content, response.status_code, dict(response.headers.items())
+        )
+
+    async def _read_request(self, request: Request) -> BaseRequest:
+        """读取完整的请求体"""
         json: Any = None
         with contextlib.suppress(Exception):
             json = await request.json()
@@ -192,7 +227,7 @@ class Driver:
                 else:
                     data[key] = value
 
-        http_request = BaseRequest(
+        return BaseRequest(
             request.method,
             str(request.url),
             headers=request.headers.items(),
@@ -204,11 +239,6 @@ class Driver:
             version=request.scope["http_version"],
         )
 
-        response = await setup.handle_func(http_request)
-        return Response(
-            response.content, response.status_code, dict(response.headers.items())
-        )
-
     async def _handle_ws(
         self, websocket: WebSocket, setup: WebSocketServerSetup
     ) -> None:
@@ -226,32 +256,66 @@ class Driver:
 
         await setup.handle_func(ws)
 
+    def get_client(self, setup: BaseRequest) -> httpx.AsyncClient:
+        """
+        说明:
+            获取请求对应的http客户端，相同代理与http版本的请求共用一个长连接池
+
+        参数:
+            * `setup`: 请求
+
+        返回:
+            * `httpx.AsyncClient`: http客户端
+        """
+        key = (setup.proxy, setup.version == HTTPVersion.H2)
+        client = self._clients.get(key)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                http2=key[1],
+                proxies=key[0],
+                # 连接池是共用的，拒绝保存任何cookie，请求的cookie通过请求头发送
+                cookies=CookieJar(DefaultCookiePolicy(allowed_domains=[])),
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=self.config.http_max_connections,
+                    max_keepalive_connections=self.config.http_max_keepalive,
+                    keepalive_expiry=self.config.http_keepalive_expiry / 1000,
+                ),
+            )
+            self._clients[key] = client
+        return client
+
     async def request(self, setup: BaseRequest) -> BaseResponse:
         """
         发起一个http请求
         """
-        async with httpx.AsyncClient(
-            cookies=setup.cookies.jar,
-            http2=setup.version == HTTPVersion.H2,
-            proxies=setup.proxy,
-            follow_redirects=True,
-        ) as client:
-            response = await client.request(
-                setup.method,
-                str(setup.url),
-                content=setup.content,
-                data=setup.data,
-                json=setup.json,
-                files=setup.files,
-                headers=tuple(setup.headers.items()),
-                timeout=setup.timeout,
-            )
-            return Response(
-                response.status_code,
-                headers=response.headers.multi_items(),
-                content=response.content,
-                request=setup,
-            )
+        client = self.get_client(setup)
+        response = await client.request(
+            setup.method,
+            str(setup.url),
+            content=setup.content,
+            data=setup.data,
+            json=setup.json,
+            files=setup.files,
+            headers=(
+                *setup.headers.items(),
+                *setup.cookies.as_header(setup).items(),
+            ),
+            timeout=setup.timeout,
+        )
+        return BaseResponse(
+            response.status_code,
+            headers=response.headers.multi_items(),
+            content=response.content,
+            request=setup,
+        )
+
+    async def close_clients(self) -> None:
+        """关闭所有http客户端连接池"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
 
     @contextlib.asynccontextmanager
     async def start_websocket(
@@ -2,6 +2,7 @@
 通用请求模型
 """
 import abc
+import asyncio
 import urllib.request
 from dataclasses import dataclass
 from enum import Enum
@@ -9,6 +10,7 @@ from http.cookiejar import Cookie, CookieJar
 from typing import (
     IO,
     Any,
+    AsyncIterator,
     Awaitable,
     Callable,
     Dict,
@@ -75,6 +77,7 @@ class Request:
         data: DataTypes = None,
         json: Any = None,
         files: FilesTypes = None,
+        stream: Optional[AsyncIterator[bytes]] = None,
         version: Union[str, HTTPVersion] = HTTPVersion.H11,
         timeout: Optional[float] = None,
         proxy: Optional[str] = None,
@@ -119,6 +122,8 @@ class Request:
         self.content: ContentTypes = content
         self.data: DataTypes = data
         self.json: Any = json
+        # 未读取的请求体，大请求体不读入内存，由处理函数流式读取
+        self.stream: Optional[AsyncIterator[bytes]] = stream
         self.files: Optional[List[Tuple[str, FileType]]] = None
         if files:
             self.files = []
@@ -165,6 +170,8 @@ class WebSocket(abc.ABC):
     def __init__(self, *, request: Request):
         # request
         self.request: Request = request
+        # 事件与action响应可能同时发送，写入需要互斥
+        self.send_lock: asyncio.Lock = asyncio.Lock()
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}('{self.request.url!s}')"
@@ -205,9 +212,11 @@ class WebSocket(abc.ABC):
     async def send(self, data: Union[str, bytes]) -> None:
         """发送一条 WebSocket text/bytes 信息"""
         if isinstance(data, str):
-            await self.send_text(data)
+            async with self.send_lock:
+                await self.send_text(data)
         elif isinstance(data, bytes):
-            await self.send_bytes(data)
+            async with self.send_lock:
+                await self.send_bytes(data)
         else:
             raise TypeError("WebSocker send method expects str or bytes!")
 
@@ -8,3 +8,5 @@ from .manager import FileManager as FileManager
 from .model import FileCache as FileCache
 from .model import database_close as database_close
 from .model import database_init as database_init
+from .spool import Base64Spooler as Base64Spooler
+from .spool import SpooledFile as SpooledFile
@@ -1,4 +1,5 @@
 import asyncio
+import os
 from pathlib import Path
 from shutil import copyfile
 from typing import Optional, Tuple
@@ -10,6 +11,7 @@ from wechatbot_client.consts import DOWNLOAD_TIMEOUT, FILE_CACHE
 from wechatbot_client.utils import logger_wrapper, run_sync
 
 from .model import FileCache
+from .spool import SpooledFile
 
 log = logger_wrapper("File Manager")
 
@@ -129,8 +131,27 @@ class FileManager:
         file_id = str(uuid4())
         file_path = self.file_path / name
         file_path = self.get_file_name(file_path)
-        with open(file_path, mode="wb") as f:
-            f.write(data)
+        await run_sync(file_path.write_bytes)(data)
+        await FileCache.create_file_cache(
+            file_id=file_id, file_path=str(file_path.absolute()), file_name=name
+        )
+        return file_id
+
+    async def cache_file_id_from_spooled(self, spooled: SpooledFile, name: str) -> str:
+        """
+        说明:
+            缓存已写入临时文件的上传数据，临时文件与缓存在同一目录，只需重命名
+
+        参数:
+            * `spooled`: 临时文件
+            * `name`: 文件名
+
+        返回:
+            * `str`: 文件id
+        """
+        file_id = str(uuid4())
+        file_path = self.get_file_name(self.file_path / name)
+        os.replace(spooled.path, file_path)
         await FileCache.create_file_cache(
             file_id=file_id, file_path=str(file_path.absolute()), file_name=name
         )
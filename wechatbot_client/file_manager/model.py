@@ -110,6 +110,7 @@ async def database_init() -> None:
     # 这里填要加载的表
     models = [
         "wechatbot_client.file_manager.model",
+        "wechatbot_client.wechat.model",
     ]
     modules = {"models": models}
     await Tortoise.init(db_url=db_url, modules=modules)
@@ -0,0 +1,123 @@
+"""
+上传数据暂存，base64数据边接收边解码写入临时文件，同时计算sha256
+"""
+import binascii
+from base64 import b64decode
+from hashlib import sha256
+from pathlib import Path
+from typing import Any, BinaryIO, Optional
+from uuid import uuid4
+
+WHITESPACE = b" \t\r\n"
+"""base64数据中允许出现的空白字符"""
+
+
+class SpooledFile:
+    """
+    已写入临时文件的上传数据，只能由服务端生成，不能通过请求参数构造
+    """
+
+    path: Path
+    """临时文件路径"""
+    size: int
+    """文件大小"""
+    sha256: str
+    """文件数据的sha256，全小写"""
+
+    def __init__(self, path: Path, size: int, sha256: str) -> None:
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(path={self.path}, size={self.size})"
+
+    def discard(self) -> None:
+        """删除未被使用的临时文件"""
+        self.path.unlink(missing_ok=True)
+
+
+class Base64Spooler:
+    """
+    base64增量解码器
+
+    接收到的base64数据先缓存在内存中，由`flush`在线程池中解码、计算sha256并写入临时文件，
+    每次只解码4的整数倍长度，剩余部分留到下一次。
+    """
+
+    path: Path
+    """临时文件路径"""
+    size: int
+    """已写入的字节数"""
+    _buffer: bytearray
+    """待解码的base64数据"""
+    _remainder: bytes
+    """上次解码剩余的不足4字节的数据"""
+    _hash: Any
+    """sha256计算"""
+    _file: Optional[BinaryIO]
+    """临时文件，第一次写入时打开"""
+
+    def __init__(self, directory: Path) -> None:
+        self.path = directory / f"{uuid4().hex}.upload"
+        self.size = 0
+        self._buffer = bytearray()
+        self._remainder = b""
+        self._hash = sha256()
+        self._file = None
+
+    @property
+    def buffered(self) -> int:
+        """内存中待解码的数据长度"""
+        return len(self._buffer)
+
+    def feed(self, data: bytes) -> None:
+        """
+        说明:
+            添加一段base64数据，不做解码，在事件循环中调用
+
+        参数:
+            * `data`: base64数据
+        """
+        self._buffer += data
+
+    def flush(self, final: bool = False) -> None:
+        """
+        说明:
+            解码缓存的数据并写入临时文件，会阻塞，需要在线程池中执行
+
+        参数:
+            * `final`: 是否为最后一次，最后一次会解码全部剩余数据并关闭文件
+
+        错误:
+            * `ValueError`: base64数据不合法
+        """
+        data = self._remainder + bytes(self._buffer).translate(None, WHITESPACE)
+        self._buffer.clear()
+        if final:
+            self._remainder = b""
+        else:
+            cut = len(data) - len(data) % 4
+            data, self._remainder = data[:cut], data[cut:]
+        try:
+            decoded = b64decode(data)
+        except binascii.Error as e:
+            raise ValueError(f"base64数据不合法:{e}") from e
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, mode="wb")
+        self._file.write(decoded)
+        self._hash.update(decoded)
+        self.size += len(decoded)
+        if final:
+            self._file.close()
+
+    def result(self) -> SpooledFile:
+        """获取写入完成的文件，需要先`flush(final=True)`"""
+        return SpooledFile(self.path, self.size, self._hash.hexdigest())
+
+    def discard(self) -> None:
+        """放弃写入，删除临时文件"""
+        if self._file is not None:
+            self._file.close()
+        self.path.unlink(missing_ok=True)
@@ -0,0 +1,325 @@
+"""
+运行指标，记录计数器与直方图，以Prometheus文本格式输出
+
+只依赖标准库，记录一次观测只有一次字典查找与一次二分查找，可以在生产环境常开。
+指标都在事件循环中记录，不需要加锁。
+"""
+from bisect import bisect_left
+from typing import Callable, Optional, Union
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+"""Prometheus文本格式的Content-Type"""
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+"""默认的直方图分桶上界，单位：秒"""
+
+
+def _escape(value: str) -> str:
+    """转义标签值"""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(
+    names: tuple[str, ...], values: tuple[str, ...], extra: str = ""
+) -> str:
+    """拼接标签，`extra`为已格式化好的附加标签"""
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: Union[int, float]) -> str:
+    """格式化数值"""
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(value)
+    return str(value)
+
+
+class Metric:
+    """
+    指标基类
+    """
+
+    type: str = "untyped"
+    """指标类型"""
+    name: str
+    """指标名"""
+    documentation: str
+    """指标说明"""
+    labelnames: tuple[str, ...]
+    """标签名"""
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> list[str]:
+        """指标的所有样本行"""
+        raise NotImplementedError
+
+    def render(self) -> list[str]:
+        """
+        说明:
+            生成指标的文本格式
+
+        返回:
+            * `list[str]`: 包含HELP、TYPE与样本的各行
+        """
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+            *self.samples(),
+        ]
+
+
+class Counter(Metric):
+    """
+    计数器，只增不减
+    """
+
+    type = "counter"
+    _values: dict[tuple[str, ...], Union[int, float]]
+    """标签值 -> 计数"""
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, *labels: str, value: Union[int, float] = 1) -> None:
+        """
+        说明:
+            增加计数
+
+        参数:
+            * `labels`: 标签值，顺序与`labelnames`一致
+            * `value`: 增加的数值
+        """
+        self._values[labels] = self._values.get(labels, 0) + value
+
+    def get(self, *labels: str) -> Union[int, float]:
+        """获取计数"""
+        return self._values.get(labels, 0)
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Gauge(Metric):
+    """
+    仪表，记录可增可减的当前值
+
+    设置了`function`时，输出时调用它获取各标签的当前值，适合队列长度等由其他线程维护的状态
+    """
+
+    type = "gauge"
+    function: Optional[Callable[[], dict[tuple[str, ...], Union[int, float]]]]
+    """输出时获取当前值的函数，返回 标签值 -> 当前值"""
+    _values: dict[tuple[str, ...], Union[int, float]]
+    """标签值 -> 当前值"""
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.function = None
+        self._values = {}
+
+    def set(self, value: Union[int, float], *labels: str) -> None:
+        """
+        说明:
+            设置当前值
+
+        参数:
+            * `value`: 当前值
+            * `labels`: 标签值，顺序与`labelnames`一致
+        """
+        self._values[labels] = value
+
+    def set_function(
+        self, function: Callable[[], dict[tuple[str, ...], Union[int, float]]]
+    ) -> None:
+        """设置输出时获取当前值的函数"""
+        self.function = function
+
+    def get(self, *labels: str) -> Union[int, float]:
+        """获取当前值"""
+        if self.function is not None:
+            return self.function().get(labels, 0)
+        return self._values.get(labels, 0)
+
+    def samples(self) -> list[str]:
+        values = self.function() if self.function is not None else self._values
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in values.items()
+        ]
+
+
+class Histogram(Metric):
+    """
+    直方图，按分桶统计观测值的分布，以及总数与总和
+    """
+
+    type = "histogram"
+    buckets: tuple[float, ...]
+    """分桶上界，不含+Inf"""
+    _values: dict[tuple[str, ...], list]
+    """标签值 -> [各分桶计数(不累加)..., +Inf分桶计数, 总和]"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        """
+        说明:
+            记录一次观测
+
+        参数:
+            * `value`: 观测值，耗时类指标单位为秒
+            * `labels`: 标签值，顺序与`labelnames`一致
+        """
+        data = self._values.get(labels)
+        if data is None:
+            data = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        data[bisect_left(self.buckets, value)] += 1
+        data[-1] += value
+
+    def count(self, *labels: str) -> int:
+        """获取观测次数"""
+        data = self._values.get(labels)
+        return sum(data[:-1]) if data else 0
+
+    def samples(self) -> list[str]:
+        lines = []
+        bounds = [_format_value(float(bound)) for bound in self.buckets] + ["+Inf"]
+        for labels, data in self._values.items():
+            cumulative = 0
+            for bound, count in zip(bounds, data):
+                cumulative += count
+                label_str = _format_labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{label_str} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(data[-1])}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    指标注册表，同名指标只会创建一次
+    """
+
+    metrics: dict[str, Metric]
+    """指标名 -> 指标"""
+
+    def __init__(self) -> None:
+        self.metrics = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        """注册指标，已存在时返回已有的指标"""
+        exist = self.metrics.get(metric.name)
+        if exist is not None:
+            if type(exist) is not type(metric):
+                raise ValueError(f"指标 {metric.name} 已注册为 {exist.type}")
+            return exist
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> Counter:
+        """
+        说明:
+            获取或创建一个计数器
+
+        参数:
+            * `name`: 指标名
+            * `documentation`: 指标说明
+            * `labelnames`: 标签名
+        """
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> Gauge:
+        """
+        说明:
+            获取或创建一个仪表
+
+        参数:
+            * `name`: 指标名
+            * `documentation`: 指标说明
+            * `labelnames`: 标签名
+        """
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: Optional[tuple[float, ...]] = None,
+    ) -> Histogram:
+        """
+        说明:
+            获取或创建一个直方图
+
+        参数:
+            * `name`: 指标名
+            * `documentation`: 指标说明
+            * `labelnames`: 标签名
+            * `buckets`: 分桶上界，默认为`DEFAULT_BUCKETS`
+        """
+        return self._register(
+            Histogram(name, documentation, labelnames, buckets or DEFAULT_BUCKETS)
+        )
+
+    def render(self) -> str:
+        """
+        说明:
+            以Prometheus文本格式输出所有指标
+
+        返回:
+            * `str`: 指标文本
+        """
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+"""全局指标注册表，`/metrics`输出其中的所有指标"""
@@ -1,14 +1,10 @@
 """
 启动行为管理，将各类业务剥离开
 """
-import asyncio
 import time
 from functools import partial
-from signal import SIGINT, raise_signal
 from uuid import uuid4
 
-from comtypes.client import PumpEvents
-
 from wechatbot_client import get_driver, get_wechat
 from wechatbot_client.action_manager import router
 from wechatbot_client.config import Config, WebsocketType
@@ -21,7 +17,6 @@ from wechatbot_client.scheduler import scheduler, scheduler_init, scheduler_shut
 
 driver = get_driver()
 wechat = get_wechat()
-pump_event_task: asyncio.Task = None
 
 
 @driver.on_startup
@@ -29,7 +24,6 @@ async def start_up() -> None:
     """
     启动行为管理
     """
-    global pump_event_task
     config: Config = wechat.config
     # 开启定时器
     scheduler_init()
@@ -53,10 +47,11 @@ async def start_up() -> None:
         )
     # 开启数据库
     await database_init()
-    # 注册消息事件
+    # 开启webhook投递
+    if config.enable_http_webhook:
+        await wechat.start_webhook()
+    # 注册消息事件，在独立线程中接收消息
     wechat.open_recv_msg(f"./{FILE_CACHE}")
-    # 开始监听event
-    pump_event_task = asyncio.create_task(pump_event())
     # 开启http路由
     if config.enable_http_api:
         wechat.setup_http_server(
@@ -73,6 +68,11 @@ async def start_up() -> None:
         await wechat.start_backward()
     # 添加get_file路由
     driver.server_app.include_router(router)
+    # 开启指标接口
+    if config.enable_metrics:
+        wechat.setup_http_server(
+            HTTPServerSetup(URL("/metrics"), "GET", "metrics", wechat.handle_metrics)
+        )
 
 
 @driver.on_shutdown
@@ -82,26 +82,16 @@ async def shutdown() -> None:
     """
     # 关闭定时器
     scheduler_shutdown()
+    # 关闭webhook投递，未投递的事件暂存到数据库
+    await wechat.stop_webhook()
     # 关闭数据库
     await database_close()
-    if pump_event_task:
-        if not pump_event_task.done():
-            pump_event_task.cancel()
     await wechat.stop_backward()
+    # 关闭http连接池
+    await driver.close_clients()
     wechat.close()
 
 
-async def pump_event() -> None:
-    """接收event循环"""
-    while True:
-        try:
-            await asyncio.sleep(0)
-            PumpEvents(0.01)
-        except KeyboardInterrupt:
-            raise_signal(SIGINT)
-            return
-
-
 async def heartbeat_event(interval: int) -> None:
     """
     心跳事件
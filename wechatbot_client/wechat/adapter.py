@@ -19,7 +19,7 @@ from wechatbot_client.action_manager import (
     WsActionResponse,
 )
 from wechatbot_client.config import Config, WebsocketType
-from wechatbot_client.consts import IMPL, ONEBOT_VERSION, USER_AGENT, VERSION
+from wechatbot_client.consts import IMPL, ONEBOT_VERSION, PREFIX, USER_AGENT, VERSION
 from wechatbot_client.driver import (
     URL,
     BackwardWebSocket,
@@ -32,15 +32,24 @@ from wechatbot_client.driver import (
     WebSocketServerSetup,
 )
 from wechatbot_client.exception import WebSocketClosed
+from wechatbot_client.metrics import CONTENT_TYPE, REGISTRY
 from wechatbot_client.onebot12 import ConnectEvent, Event, StatusUpdateEvent
 from wechatbot_client.utils import DataclassEncoder, escape_tag, logger_wrapper
 
+from .envelope import EventEnvelope, dump_events_response
+from .event_buffer import EventBuffer
+from .stream import UPLOAD_TEMP, parse_action_stream
 from .utils import get_auth_bearer
+from .webhook import WebhookManager
 
 log = logger_wrapper("OneBot V12")
 
-HTTP_EVENT_LIST: list[Event] = []
-"""get_latest_events的event储存"""
+EVENTS_TOTAL = REGISTRY.counter("onebot_events_total", "生成的事件数", ("type",))
+EVENT_FANOUT = REGISTRY.histogram(
+    "onebot_event_fanout_seconds",
+    "事件从生成到交给各传输方式(缓冲区、webhook队列、ws发送完成)的耗时",
+    ("transport",),
+)
 
 
 def get_connet_event() -> ConnectEvent:
@@ -69,11 +78,22 @@ class Adapter:
     """反向连接ws任务列表"""
     driver: Driver
     """后端驱动"""
+    event_buffer: EventBuffer
+    """get_latest_events的事件缓冲区"""
+    webhook: WebhookManager
+    """webhook投递管理"""
+    ws_action_tasks: set[asyncio.Task]
+    """处理中的ws action任务，保存引用防止执行中被回收"""
 
     def __init__(self, config: Config) -> None:
         self.config = config
         self.driver = Driver(config)
         self.tasks = []
+        self.event_buffer = EventBuffer(
+            config.event_buffer_size, (2**20) * config.event_buffer_memory
+        )
+        self.webhook = WebhookManager()
+        self.ws_action_tasks = set()
 
     def setup_http_server(self, setup: HTTPServerSetup) -> None:
         """设置一个 HTTP 服务器路由配置"""
@@ -140,16 +160,7 @@ class Adapter:
         except Exception as e:
             log("ERROR", f"发送status_update事件失败:{e}")
         try:
-            while True:
-                data = await websocket.receive()
-                raw_data = (
-                    json.loads(data) if isinstance(data, str) else msgpack.unpackb(data)
-                )
-                if action := self.json_to_ws_action(raw_data):
-                    response = await self.action_ws_request(action)
-                    await websocket.send(
-                        response.json(ensure_ascii=False, cls=DataclassEncoder)
-                    )
+            await self._ws_receive_loop(websocket)
         except WebSocketClosed:
             log(
                 "WARNING",
@@ -167,6 +178,17 @@ class Adapter:
                 await websocket.close()
             self.driver.ws_disconnect(seq)
 
+    async def handle_metrics(self, request: Request) -> Response:
+        """输出运行指标，格式为Prometheus文本格式"""
+
+        # check access_token
+        response = self._check_access_token(request)
+        if response is not None:
+            return response
+        return Response(
+            200, headers={"Content-Type": CONTENT_TYPE}, content=REGISTRY.render()
+        )
+
     async def handle_http(self, request: Request) -> Response:
         """处理http任务"""
 
@@ -175,25 +197,33 @@ class Adapter:
         if response is not None:
             return response
 
-        data = request.content
-        if data is not None:
-            json_data = json.loads(data)
+        spooled = None
+        if request.stream is not None:
+            # 大请求体，边接收边解析，data字段直接写入临时文件
+            try:
+                json_data, spooled = await parse_action_stream(
+                    request.stream, UPLOAD_TEMP
+                )
+            except ValueError as e:
+                log("ERROR", f"请求体解析失败:{e}")
+                return Response(400)
+        elif request.json is not None:
+            # driver已经解析过json
+            json_data = request.json
+        elif request.content is not None:
+            json_data = json.loads(request.content)
+        else:
+            return Response(204)
+        try:
             if action := self.json_to_action(json_data):
                 # get_latest_events处理
                 if action.action == "get_latest_events":
-                    if not self.config.event_enabled:
-                        response = ActionResponse(
-                            status="failed",
-                            retcode=10002,
-                            data=None,
-                            message="未开启该action",
-                        )
-                    else:
-                        data = HTTP_EVENT_LIST.copy()
-                        HTTP_EVENT_LIST.clear()
-                        response = ActionResponse(status="ok", retcode=0, data=data)
+                    content = await self.get_latest_events(action.params)
                 else:
                     response = await self.action_request(action)
+                    content = response.json(
+                        by_alias=True, ensure_ascii=False, cls=DataclassEncoder
+                    )
                 headers = {
                     "Content-Type": "application/json",
                     "User-Agent": USER_AGENT,
@@ -202,15 +232,47 @@ class Adapter:
                 }
                 if self.config.access_token != "":
                     headers["Authorization"] = f"Bearer {self.config.access_token}"
-                return Response(
-                    200,
-                    headers=headers,
-                    content=response.json(
-                        by_alias=True, ensure_ascii=False, cls=DataclassEncoder
-                    ),
-                )
+                return Response(200, headers=headers, content=content)
+        finally:
+            if spooled is not None:
+                # 未被action使用的临时文件
+                spooled.discard()
         return Response(204)
 
+    async def get_latest_events(self, params: dict) -> str:
+        """
+        说明:
+            处理get_latest_events，没有事件时会等待直到事件到达或超时
+
+        参数:
+            * `params`: 请求参数
+                * `limit`: 获取的事件数量上限，0 表示不限制
+                * `timeout`: 没有事件时最多等待的秒数，0 表示不等待
+                * `wx.consumer`: 消费者标识，不同消费者各自维护读取进度
+
+        返回:
+            * `str`: 响应的json字符串，事件部分直接复用缓存的编码
+        """
+        if not self.config.event_enabled:
+            response = ActionResponse(
+                status="failed",
+                retcode=10002,
+                data=None,
+                message="未开启该action",
+            )
+            return response.json(by_alias=True, ensure_ascii=False)
+        try:
+            limit = int(params.get("limit", 0))
+            timeout = float(params.get("timeout", 0))
+        except (TypeError, ValueError):
+            response = ActionResponse(
+                status="failed", retcode=10003, data=None, message="Param参数错误"
+            )
+            return response.json(by_alias=True, ensure_ascii=False)
+        consumer = str(params.get(f"{PREFIX}.consumer", "default"))
+        envelopes = await self.event_buffer.get(consumer, limit, timeout)
+        return dump_events_response(envelopes)
+
     async def start_backward(self) -> None:
         """
         开启反向ws连接应用端
@@ -264,20 +326,7 @@ class Adapter:
                     except Exception as e:
                         log("ERROR", f"发送status_update事件失败:{e}")
                     try:
-                        while True:
-                            data = await websocket.receive()
-                            raw_data = (
-                                json.loads(data)
-                                if isinstance(data, str)
-                                else msgpack.unpackb(data)
-                            )
-                            if action := self.json_to_ws_action(raw_data):
-                                response = await self.action_ws_request(action)
-                                await websocket.send(
-                                    response.json(
-                                        ensure_ascii=False, cls=DataclassEncoder
-                                    )
-                                )
+                        await self._ws_receive_loop(websocket)
                     except WebSocketClosed as e:
                         log(
                             "ERROR",
@@ -301,6 +350,61 @@ class Adapter:
 
             await asyncio.sleep(self.config.reconnect_interval / 1000)
 
+    async def _ws_receive_loop(self, websocket: WebSocket) -> None:
+        """
+        说明:
+            接收ws请求，每个action作为独立任务处理，响应按完成顺序发送，由`echo`对应请求。
+            同时处理的action达到`websocket_action_concurrency`时暂停读取。
+            连接断开时，已开始的action会继续执行完，只是响应无法送达。
+
+        参数:
+            * `websocket`: ws连接
+        """
+        semaphore = asyncio.Semaphore(self.config.websocket_action_concurrency)
+        while True:
+            data = await websocket.receive()
+            raw_data = (
+                json.loads(data) if isinstance(data, str) else msgpack.unpackb(data)
+            )
+            if action := self.json_to_ws_action(raw_data):
+                await semaphore.acquire()
+                task = asyncio.create_task(
+                    self._ws_action(websocket, action, semaphore)
+                )
+                self.ws_action_tasks.add(task)
+                task.add_done_callback(self.ws_action_tasks.discard)
+
+    async def _ws_action(
+        self,
+        websocket: WebSocket,
+        action: WsActionRequest,
+        semaphore: asyncio.Semaphore,
+    ) -> None:
+        """处理一个ws action并发送响应"""
+        try:
+            response = await self.action_ws_request(action)
+            await websocket.send(
+                response.json(ensure_ascii=False, cls=DataclassEncoder)
+            )
+        except WebSocketClosed:
+            log("WARNING", f"websocket已关闭，action响应未送达: {action.action}")
+        except Exception as e:
+            log("ERROR", f"<r>处理ws action出错: {e}</r>")
+        finally:
+            semaphore.release()
+
+    async def start_webhook(self) -> None:
+        """
+        开启webhook投递任务
+        """
+        await self.webhook.start(self.config, self.driver.request)
+
+    async def stop_webhook(self) -> None:
+        """
+        关闭webhook投递任务，未投递的事件会暂存到数据库
+        """
+        await self.webhook.stop()
+
     async def stop_backward(self) -> None:
         """关闭反向ws连接任务"""
         for task in self.tasks:
@@ -360,77 +464,51 @@ class Adapter:
         """
         raise NotImplementedError
 
-    async def http_event(self, event: Event) -> None:
+    async def http_event(self, envelope: EventEnvelope) -> None:
         """
         http处理event
         """
-        global HTTP_EVENT_LIST
         if self.config.event_enabled:
             # 开启 get_latest_events
-            if (
-                self.config.event_buffer_size != 0
-                and len(HTTP_EVENT_LIST) == self.config.event_buffer_size
-            ):
-                HTTP_EVENT_LIST.pop(0)
-            HTTP_EVENT_LIST.append(event)
+            await self.event_buffer.put(envelope)
+            EVENT_FANOUT.observe(time.perf_counter() - envelope.created, "http")
 
-    async def webhook_event(self, event: Event) -> None:
+    async def webhook_event(self, envelope: EventEnvelope) -> None:
         """
-        处理webhook
+        处理webhook，事件进入各上报地址的投递队列
         """
-        log("DEBUG", "发送webhook...")
-
-        headers = {
-            "User-Agent": USER_AGENT,
-            "Content-Type": "application/json",
-            "X-OneBot-Version": ONEBOT_VERSION,
-            "X-Impl": IMPL,
-        }
-        if self.config.access_token != "":
-            headers["Authorization"] = f"Bearer {self.config.access_token}"
-        for url in self.config.webhook_url:
-            try:
-                post_url = URL(url)
-                setup = Request(
-                    method="POST",
-                    url=post_url,
-                    headers=headers,
-                    json=event.json(
-                        by_alias=True, ensure_ascii=False, cls=DataclassEncoder
-                    ),
-                    timeout=self.config.webhook_timeout / 1000,
-                )
-                await self.driver.request(setup)
-            except Exception as e:
-                log("ERROR", f"发送webhook出现错误:{e}")
+        await self.webhook.put(envelope)
+        EVENT_FANOUT.observe(time.perf_counter() - envelope.created, "webhook")
 
     async def _send_ws(
-        self, ws: Union[FastAPIWebSocket, BackwardWebSocket], event: Event
+        self, ws: Union[FastAPIWebSocket, BackwardWebSocket], envelope: EventEnvelope
     ) -> None:
         """
         发送ws消息
         """
-        await ws.send(
-            event.json(by_alias=True, ensure_ascii=False, cls=DataclassEncoder)
-        )
+        await ws.send(envelope.json)
 
-    async def websocket_event(self, event: Event) -> None:
+    async def websocket_event(self, envelope: EventEnvelope) -> None:
         """
         处理websocket发送事件
         """
-        task = [self._send_ws(one, event) for one in self.driver.connects.values()]
-        try:
-            asyncio.gather(*task)
-        except Exception as e:
-            log("ERROR", f"发送ws消息出错:{e}")
+        task = [self._send_ws(one, envelope) for one in self.driver.connects.values()]
+        results = await asyncio.gather(*task, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                log("ERROR", f"发送ws消息出错:{result}")
+        if task:
+            EVENT_FANOUT.observe(time.perf_counter() - envelope.created, "websocket")
 
     async def handle_event(self, event: Event) -> None:
         """
-        处理event
+        处理event，事件只序列化一次，各传输方式共用编码结果
         """
+        envelope = EventEnvelope(event)
+        EVENTS_TOTAL.inc(event.type)
         if self.config.enable_http_api:
-            asyncio.create_task(self.http_event(event))
+            asyncio.create_task(self.http_event(envelope))
         if self.config.enable_http_webhook:
-            asyncio.create_task(self.webhook_event(event))
+            asyncio.create_task(self.webhook_event(envelope))
         if self.config.websocekt_type != WebsocketType.Unable:
-            asyncio.create_task(self.websocket_event(event))
+            asyncio.create_task(self.websocket_event(envelope))
@@ -0,0 +1,66 @@
+"""
+事件信封，事件只序列化一次，所有传输方式共用同一份数据
+"""
+import time
+from typing import Optional
+
+from wechatbot_client.onebot12 import Event
+from wechatbot_client.utils import DataclassEncoder
+
+
+class EventEnvelope:
+    """
+    事件信封，在第一次使用时缓存事件的json编码
+    """
+
+    __slots__ = ("event", "created", "_json", "_json_bytes")
+
+    event: Event
+    """原始事件"""
+    created: float
+    """创建时间(`time.perf_counter`)，用于统计各传输方式的分发延迟"""
+    _json: Optional[str]
+    _json_bytes: Optional[bytes]
+
+    def __init__(self, event: Event) -> None:
+        self.event = event
+        self.created = time.perf_counter()
+        self._json = None
+        self._json_bytes = None
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.event.__repr_name__()})"
+
+    @property
+    def json(self) -> str:
+        """事件的json编码"""
+        if self._json is None:
+            self._json = self.event.json(
+                by_alias=True, ensure_ascii=False, cls=DataclassEncoder
+            )
+        return self._json
+
+    @property
+    def json_bytes(self) -> bytes:
+        """事件的json编码(utf-8)"""
+        if self._json_bytes is None:
+            self._json_bytes = self.json.encode("utf-8")
+        return self._json_bytes
+
+    def __len__(self) -> int:
+        return len(self.json_bytes)
+
+
+def dump_events_response(envelopes: list[EventEnvelope]) -> str:
+    """
+    说明:
+        将事件列表拼接为get_latest_events的响应，直接复用已缓存的事件编码
+
+    参数:
+        * `envelopes`: 事件信封列表
+
+    返回:
+        * `str`: 响应的json字符串
+    """
+    data = ",".join(envelope.json for envelope in envelopes)
+    return f'{{"status":"ok","retcode":0,"data":[{data}],"message":""}}'
@@ -0,0 +1,157 @@
+"""
+get_latest_events的事件缓冲区，支持长轮询与多消费者游标
+"""
+import asyncio
+import contextlib
+import time
+from collections import deque
+from itertools import islice
+
+from wechatbot_client.consts import EVENT_CONSUMER_TIMEOUT
+
+from .envelope import EventEnvelope
+
+
+class EventBuffer:
+    """
+    事件缓冲区
+
+    使用环形缓冲区存储事件，追加与淘汰都是O(1)，同时限制事件数量与占用字节数。
+    每个事件分配一个递增序号，每个消费者维护自己的游标，
+    事件只有在被所有活跃消费者读取后才会被移除
+    """
+
+    max_size: int
+    """事件数量上限，超过该大小将会丢弃最旧的事件，0 表示不限大小"""
+    max_bytes: int
+    """事件占用字节上限，超过该大小将会丢弃最旧的事件，0 表示不限大小"""
+    events: deque[tuple[int, int, EventEnvelope]]
+    """缓存的事件: (序号, 字节数, 事件)，从旧到新排序"""
+    total_bytes: int
+    """当前缓存事件的总字节数"""
+    dropped_count: int
+    """因超出上限被丢弃的事件数"""
+    dropped_bytes: int
+    """因超出上限被丢弃的事件字节数"""
+    cursors: dict[str, int]
+    """消费者游标，记录消费者下一个要读取的事件序号"""
+    active_time: dict[str, float]
+    """消费者最后一次读取的时间"""
+    _next_seq: int
+    """下一个事件的序号"""
+    _condition: asyncio.Condition
+    """事件到达通知"""
+
+    def __init__(self, max_size: int = 0, max_bytes: int = 0) -> None:
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.events = deque()
+        self.total_bytes = 0
+        self.dropped_count = 0
+        self.dropped_bytes = 0
+        self.cursors = {}
+        self.active_time = {}
+        self._next_seq = 0
+        self._condition = asyncio.Condition()
+
+    @property
+    def first_seq(self) -> int:
+        """缓冲区中最旧事件的序号"""
+        return self.events[0][0] if self.events else self._next_seq
+
+    async def put(self, event: EventEnvelope) -> None:
+        """
+        说明:
+            添加一个事件，超出上限时丢弃最旧的事件，并唤醒等待中的消费者
+
+        参数:
+            * `event`: 事件信封
+        """
+        size = len(event)
+        async with self._condition:
+            self.events.append((self._next_seq, size, event))
+            self._next_seq += 1
+            self.total_bytes += size
+            while self.events and self._is_full():
+                _, dropped, _ = self.events.popleft()
+                self.total_bytes -= dropped
+                self.dropped_count += 1
+                self.dropped_bytes += dropped
+            self._condition.notify_all()
+
+    async def get(
+        self, consumer: str, limit: int = 0, timeout: float = 0
+    ) -> list[EventEnvelope]:
+        """
+        说明:
+            获取消费者尚未读取的事件，没有事件时最多等待`timeout`秒
+
+        参数:
+            * `consumer`: 消费者标识
+            * `limit`: 获取的事件数量上限，0 表示不限制
+            * `timeout`: 没有事件时最多等待的秒数，0 表示不等待
+
+        返回:
+            * `list[EventEnvelope]`: 事件信封列表，从旧到新排序
+        """
+        async with self._condition:
+            self.cursors.setdefault(consumer, self.first_seq)
+            self.active_time[consumer] = time.time()
+            if timeout > 0 and not self._has_new(consumer):
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(
+                        self._condition.wait_for(lambda: self._has_new(consumer)),
+                        timeout,
+                    )
+            cursor = max(self.cursors.get(consumer, 0), self.first_seq)
+            start = cursor - self.first_seq
+            end = None if limit <= 0 else start + limit
+            result = list(islice(self.events, start, end))
+            if result:
+                cursor = result[-1][0] + 1
+            self.cursors[consumer] = cursor
+            self.active_time[consumer] = time.time()
+            self._trim()
+            return [event for _, _, event in result]
+
+    def get_status(self) -> dict:
+        """
+        获取缓冲区状态
+        """
+        return {
+            "size": len(self.events),
+            "bytes": self.total_bytes,
+            "max_size": self.max_size,
+            "max_bytes": self.max_bytes,
+            "dropped": self.dropped_count,
+            "dropped_bytes": self.dropped_bytes,
+            "consumers": len(self.cursors),
+        }
+
+    def _is_full(self) -> bool:
+        """缓冲区是否超出上限"""
+        return (self.max_size != 0 and len(self.events) > self.max_size) or (
+            self.max_bytes != 0 and self.total_bytes > self.max_bytes
+        )
+
+    def _has_new(self, consumer: str) -> bool:
+        """消费者是否有未读取的事件"""
+        return self.cursors.get(consumer, self.first_seq) < self._next_seq
+
+    def _trim(self) -> None:
+        """移除过期的消费者，并丢弃所有活跃消费者都已读取的事件"""
+        now = time.time()
+        expired = [
+            consumer
+            for consumer, active in self.active_time.items()
+            if now - active > EVENT_CONSUMER_TIMEOUT
+        ]
+        for consumer in expired:
+            self.cursors.pop(consumer, None)
+            self.active_time.pop(consumer, None)
+        if not self.cursors:
+            return
+        count = min(self.cursors.values()) - self.first_seq
+        for _ in range(count):
+            _, size, _ = self.events.popleft()
+            self.total_bytes -= size
@@ -0,0 +1,65 @@
+from datetime import datetime
+
+from tortoise import fields
+from tortoise.models import Model
+
+
+class WebhookSpill(Model):
+    """webhook溢出表，内存队列已满时事件暂存在这里"""
+
+    id = fields.IntField(pk=True, generated=True)
+    url = fields.CharField(max_length=255, index=True)
+    """上报地址"""
+    content = fields.BinaryField()
+    """事件json编码"""
+    create_time = fields.DatetimeField()
+    """创建时间"""
+
+    class Meta:
+        table = "webhook_spill"
+        table_description = "webhook溢出事件"
+
+    @classmethod
+    async def spill(cls, url: str, contents: list[bytes]) -> None:
+        """
+        说明:
+            暂存事件
+
+        参数:
+            * `url`: 上报地址
+            * `contents`: 事件json编码列表
+        """
+        time = datetime.now()
+        await cls.bulk_create(
+            [cls(url=url, content=content, create_time=time) for content in contents]
+        )
+
+    @classmethod
+    async def pop(cls, url: str, limit: int) -> list[bytes]:
+        """
+        说明:
+            按写入顺序取出并删除暂存的事件
+
+        参数:
+            * `url`: 上报地址
+            * `limit`: 最多取出的数量
+
+        返回:
+            * `list[bytes]`: 事件json编码列表
+        """
+        models = await cls.filter(url=url).order_by("id").limit(limit)
+        if not models:
+            return []
+        await cls.filter(id__in=[model.id for model in models]).delete()
+        return [model.content for model in models]
+
+    @classmethod
+    async def get_count(cls, url: str) -> int:
+        """
+        说明:
+            获取暂存的事件数量
+
+        参数:
+            * `url`: 上报地址
+        """
+        return await cls.filter(url=url).count()
@@ -0,0 +1,207 @@
+"""
+大请求体的流式解析，用于`upload_file`等携带大段base64数据的action
+
+请求体不整体读入内存：扫描器边接收边跟踪json结构，`params.data`字符串的内容交给
+`Base64Spooler`在线程池中解码写入临时文件，其余内容(都是较小的参数)照常拼成json再解析。
+"""
+import json
+import re
+from pathlib import Path
+from typing import Any, AsyncIterator, Optional
+
+from wechatbot_client.consts import FILE_CACHE
+from wechatbot_client.file_manager import Base64Spooler, SpooledFile
+from wechatbot_client.utils import run_sync
+
+STRUCTURE = re.compile(rb'["{}\[\]:,]')
+"""字符串外需要处理的字符"""
+STRING_END = re.compile(rb'["\\]')
+"""字符串内需要处理的字符"""
+
+ESCAPES = {ord("/"): b"/", ord("n"): b"", ord("r"): b"", ord("t"): b""}
+"""base64字符串中允许的转义：`\\/`还原为`/`，换行等空白直接丢弃"""
+
+FLUSH_SIZE = 1024 * 1024
+"""内存中的base64数据超过该大小时解码写入文件"""
+
+UPLOAD_TEMP = Path(f"./{FILE_CACHE}/temp")
+"""临时文件目录，与文件缓存在同一目录下，缓存时只需重命名"""
+
+
+class ActionStreamParser:
+    """
+    action请求体的增量扫描器
+
+    只跟踪对象/数组的嵌套、当前键名与字符串边界，不解析数值等内容；
+    `params.data`以外的部分原样写入`skeleton`，`params.data`在`skeleton`中替换为`null`。
+    """
+
+    skeleton: bytearray
+    """除大字段外的请求体"""
+    spooler: Optional[Base64Spooler]
+    """`params.data`的解码器，请求体中没有该字段时为None"""
+    _directory: Path
+    """临时文件目录"""
+    _stack: list[int]
+    """容器嵌套，元素为`{`或`[`"""
+    _keys: list[Optional[str]]
+    """每层对象的当前键名"""
+    _expect_key: bool
+    """下一个字符串是否为键名"""
+    _string_start: int
+    """当前字符串在`skeleton`中的起始位置，-1 表示不在字符串中"""
+    _diverting: bool
+    """是否正在将字符串内容写入`spooler`"""
+    _escape: bool
+    """上一个字节是否为转义符"""
+
+    def __init__(self, directory: Path) -> None:
+        self.skeleton = bytearray()
+        self.spooler = None
+        self._directory = directory
+        self._stack = []
+        self._keys = []
+        self._expect_key = False
+        self._string_start = -1
+        self._diverting = False
+        self._escape = False
+
+    def _is_data_value(self) -> bool:
+        """当前位置是否为`params.data`的值"""
+        return (
+            self.spooler is None
+            and not self._expect_key
+            and len(self._stack) == 2
+            and self._stack[1] == ord("{")
+            and self._keys == ["params", "data"]
+        )
+
+    def feed(self, chunk: bytes) -> None:
+        """
+        说明:
+            扫描一段请求体
+
+        参数:
+            * `chunk`: 请求体数据
+
+        错误:
+            * `ValueError`: 请求体不是合法的json，或`params.data`中有不支持的转义
+        """
+        pos = 0
+        end = len(chunk)
+        while pos < end:
+            if self._escape:
+                # 转义符后的字节
+                self._escape = False
+                if self._diverting:
+                    if chunk[pos] not in ESCAPES:
+                        raise ValueError("data字段中有不支持的转义字符")
+                    self.spooler.feed(ESCAPES[chunk[pos]])
+                else:
+                    self.skeleton.append(chunk[pos])
+                pos += 1
+                continue
+
+            if self._diverting or self._string_start >= 0:
+                match = STRING_END.search(chunk, pos)
+                stop = match.start() if match else end
+                if self._diverting:
+                    self.spooler.feed(chunk[pos:stop])
+                else:
+                    self.skeleton += chunk[pos:stop]
+                if match is None:
+                    return
+                pos = stop + 1
+                if chunk[stop] == ord("\\"):
+                    self._escape = True
+                    if not self._diverting:
+                        self.skeleton.append(chunk[stop])
+                    continue
+                # 字符串结束
+                if self._diverting:
+                    self._diverting = False
+                    continue
+                self.skeleton.append(chunk[stop])
+                if self._expect_key and self._stack and self._stack[-1] == ord("{"):
+                    self._keys[-1] = json.loads(self.skeleton[self._string_start :])
+                self._string_start = -1
+                continue
+
+            match = STRUCTURE.search(chunk, pos)
+            stop = match.start() if match else end
+            self.skeleton += chunk[pos:stop]
+            if match is None:
+                return
+            pos = stop + 1
+            char = chunk[stop]
+            if char == ord('"'):
+                if self._is_data_value():
+                    self.spooler = Base64Spooler(self._directory)
+                    self.skeleton += b"null"
+                    self._diverting = True
+                    continue
+                self._string_start = len(self.skeleton)
+            elif char in b"{[":
+                self._stack.append(char)
+                self._keys.append(None)
+                self._expect_key = char == ord("{")
+            elif char in b"}]":
+                if not self._stack:
+                    raise ValueError("请求体不是合法的json")
+                self._stack.pop()
+                self._keys.pop()
+                self._expect_key = False
+            elif char == ord(":"):
+                self._expect_key = False
+            elif char == ord(","):
+                self._expect_key = bool(self._stack) and self._stack[-1] == ord("{")
+            self.skeleton.append(char)
+
+    def result(self) -> Any:
+        """
+        说明:
+            解析除大字段外的请求体
+
+        错误:
+            * `ValueError`: 请求体不是合法的json
+        """
+        if self._stack or self._string_start >= 0 or self._diverting:
+            raise ValueError("请求体不完整")
+        return json.loads(self.skeleton)
+
+
+async def parse_action_stream(
+    stream: AsyncIterator[bytes], directory: Path
+) -> tuple[Any, Optional[SpooledFile]]:
+    """
+    说明:
+        流式解析action请求体，`params.data`解码写入临时文件
+
+    参数:
+        * `stream`: 请求体数据流
+        * `directory`: 临时文件目录
+
+    返回:
+        * `Any`: 解析后的请求，`params.data`为`SpooledFile`
+        * `SpooledFile | None`: 临时文件，请求处理完后需要`discard`未被使用的文件
+
+    错误:
+        * `ValueError`: 请求体不合法
+    """
+    parser = ActionStreamParser(directory)
+    try:
+        async for chunk in stream:
+            parser.feed(chunk)
+            if parser.spooler is not None and parser.spooler.buffered >= FLUSH_SIZE:
+                await run_sync(parser.spooler.flush)()
+        data = parser.result()
+        if parser.spooler is None:
+            return data, None
+        await run_sync(parser.spooler.flush)(final=True)
+    except BaseException:
+        if parser.spooler is not None:
+            parser.spooler.discard()
+        raise
+    spooled = parser.spooler.result()
+    data["params"]["data"] = spooled
+    return data, spooled
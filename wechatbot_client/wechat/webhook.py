@@ -0,0 +1,327 @@
+"""
+webhook上报，每个上报地址一个投递任务，支持重试、批量上报与溢出暂存
+"""
+import asyncio
+import contextlib
+import time
+from typing import Awaitable, Callable, Optional
+
+from wechatbot_client.config import Config
+from wechatbot_client.consts import IMPL, ONEBOT_VERSION, USER_AGENT
+from wechatbot_client.driver import URL, Request, Response
+from wechatbot_client.metrics import REGISTRY
+from wechatbot_client.utils import escape_tag, logger_wrapper
+
+from .envelope import EventEnvelope
+from .model import WebhookSpill
+
+log = logger_wrapper("Webhook")
+
+LATENCY_ALPHA = 0.2
+"""投递延迟滑动平均的权重"""
+
+DELIVERY_SECONDS = REGISTRY.histogram(
+    "onebot_webhook_delivery_seconds", "事件从入队到webhook投递成功的延迟", ("url",)
+)
+WEBHOOK_EVENTS = REGISTRY.counter(
+    "onebot_webhook_events_total", "webhook投递结果", ("url", "result")
+)
+
+
+def retryable_status(status_code: int) -> bool:
+    """状态码是否为暂时性的失败：5xx、408和429可以重试，其他状态码重试也不会成功"""
+    return status_code >= 500 or status_code in (408, 429)
+
+
+class WebhookWorker:
+    """
+    单个webhook地址的投递任务
+
+    事件先进入有界的内存队列，由后台任务按顺序投递，暂时性的失败按指数退避重试。
+    内存队列已满时，事件会暂存到数据库，直到队列排空后再按原顺序取回，
+    未开启暂存时则丢弃新事件。
+    """
+
+    url: str
+    """上报地址"""
+    config: Config
+    """应用设置"""
+    queue: asyncio.Queue[tuple[float, bytes]]
+    """待投递的事件: (入队时间, 事件json编码)"""
+    spilled: int
+    """暂存在数据库中的事件数"""
+    delivered: int
+    """投递成功的事件数"""
+    failed: int
+    """重试后仍投递失败的事件数"""
+    dropped: int
+    """因队列已满被丢弃的事件数"""
+    latency: float
+    """事件从入队到投递成功的平均延迟，单位：秒"""
+    last_latency: float
+    """最近一次投递的延迟，单位：秒"""
+    _request: Callable[[Request], Awaitable[Response]]
+    """http请求方法"""
+    _headers: dict[str, str]
+    """上报请求头"""
+    _task: Optional[asyncio.Task]
+    """投递任务"""
+    _batch: list[tuple[float, bytes]]
+    """正在投递的事件"""
+    _spill_lock: asyncio.Lock
+    """保证暂存与取回的顺序"""
+
+    def __init__(
+        self,
+        url: str,
+        config: Config,
+        request: Callable[[Request], Awaitable[Response]],
+    ) -> None:
+        self.url = url
+        self.config = config
+        self.queue = asyncio.Queue(config.webhook_queue_size)
+        self.spilled = 0
+        self.delivered = 0
+        self.failed = 0
+        self.dropped = 0
+        self.latency = 0.0
+        self.last_latency = 0.0
+        self._request = request
+        self._headers = {
+            "User-Agent": USER_AGENT,
+            "Content-Type": "application/json",
+            "X-OneBot-Version": ONEBOT_VERSION,
+            "X-Impl": IMPL,
+        }
+        if config.access_token != "":
+            self._headers["Authorization"] = f"Bearer {config.access_token}"
+        self._task = None
+        self._batch = []
+        self._spill_lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        """
+        启动投递任务，会先取回上次未投递完的暂存事件
+        """
+        if self.config.webhook_spill:
+            self.spilled = await WebhookSpill.get_count(self.url)
+            if self.spilled:
+                log(
+                    "INFO",
+                    f"<y>{escape_tag(self.url)}</y> 有 {self.spilled} 个暂存事件待投递",
+                )
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        停止投递任务，开启暂存时将队列中剩余的事件写入数据库
+        """
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        contents = [content for _, content in self._batch]
+        self._batch = []
+        while not self.queue.empty():
+            _, content = self.queue.get_nowait()
+            contents.append(content)
+        if not self.config.webhook_spill or not contents:
+            return
+        # 暂存的事件在队列之后，这里需要保持原来的顺序
+        async with self._spill_lock:
+            remains = await WebhookSpill.pop(self.url, self.spilled)
+            await WebhookSpill.spill(self.url, contents + remains)
+            self.spilled = len(contents) + len(remains)
+        log("INFO", f"<y>{escape_tag(self.url)}</y> 已暂存 {self.spilled} 个未投递事件")
+
+    async def put(self, envelope: EventEnvelope) -> None:
+        """
+        说明:
+            添加一个待投递事件，不会等待投递完成
+
+        参数:
+            * `envelope`: 事件信封
+        """
+        item = (time.time(), envelope.json_bytes)
+        # 已有暂存事件时，新事件也要进入暂存，保证投递顺序
+        if self.spilled == 0 and not self.queue.full():
+            self.queue.put_nowait(item)
+            return
+        if not self.config.webhook_spill:
+            self.dropped += 1
+            WEBHOOK_EVENTS.inc(self.url, "dropped")
+            log("WARNING", f"<y>{escape_tag(self.url)}</y> 上报队列已满，丢弃事件")
+            return
+        async with self._spill_lock:
+            await WebhookSpill.spill(self.url, [envelope.json_bytes])
+            self.spilled += 1
+
+    def get_status(self) -> dict:
+        """
+        获取投递状态
+        """
+        return {
+            "queue": self.queue.qsize(),
+            "max_queue": self.queue.maxsize,
+            "spilled": self.spilled,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "latency": round(self.latency * 1000),
+            "last_latency": round(self.last_latency * 1000),
+        }
+
+    async def _run(self) -> None:
+        """投递循环"""
+        while True:
+            try:
+                if self.queue.empty() and self.spilled:
+                    await self._refill()
+                await self._next_batch()
+                await self._deliver(self._batch)
+                self._batch = []
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log("ERROR", f"<r>{escape_tag(self.url)} 投递任务出错:{e}</r>")
+                await asyncio.sleep(self.config.webhook_retry_interval / 1000)
+
+    async def _refill(self) -> None:
+        """从数据库取回暂存的事件"""
+        async with self._spill_lock:
+            contents = await WebhookSpill.pop(self.url, self.queue.maxsize or 100)
+            self.spilled = max(self.spilled - len(contents), 0)
+            if not contents:
+                self.spilled = 0
+        now = time.time()
+        for content in contents:
+            self.queue.put_nowait((now, content))
+
+    async def _next_batch(self) -> None:
+        """获取一批待投递的事件，数量不足时最多等待`webhook_batch_interval`"""
+        batch = self._batch = [await self.queue.get()]
+        batch_size = self.config.webhook_batch_size
+        if batch_size <= 1:
+            return
+        deadline = time.time() + self.config.webhook_batch_interval / 1000
+        while len(batch) < batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            wait = deadline - time.time()
+            if wait <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), wait))
+            except asyncio.TimeoutError:
+                break
+
+    async def _deliver(self, batch: list[tuple[float, bytes]]) -> None:
+        """投递一批事件，请求出错或状态码为5xx、408、429时按指数退避重试"""
+        if self.config.webhook_batch_size > 1:
+            content = b"[" + b",".join(content for _, content in batch) + b"]"
+        else:
+            content = batch[0][1]
+        setup = Request(
+            method="POST",
+            url=URL(self.url),
+            headers=self._headers,
+            content=content,
+            timeout=self.config.webhook_timeout / 1000 or None,
+        )
+        retry_times = self.config.webhook_retry_times
+        for times in range(retry_times + 1):
+            try:
+                response = await self._request(setup)
+                if 200 <= response.status_code < 300:
+                    self._record(batch)
+                    return
+                error = f"状态码 {response.status_code}"
+                if not retryable_status(response.status_code):
+                    break
+            except Exception as e:
+                error = str(e) or e.__class__.__name__
+            if times < retry_times:
+                interval = self.config.webhook_retry_interval / 1000 * 2**times
+                log(
+                    "WARNING",
+                    f"<y>{escape_tag(self.url)}</y> 上报失败:{escape_tag(error)}，"
+                    f"{interval:.1f}s 后重试({times + 1}/{retry_times})",
+                )
+                await asyncio.sleep(interval)
+        self.failed += len(batch)
+        WEBHOOK_EVENTS.inc(self.url, "failed", value=len(batch))
+        log(
+            "ERROR",
+            f"<r>{escape_tag(self.url)} 上报失败，丢弃 {len(batch)} 个事件:"
+            f"{escape_tag(error)}</r>",
+        )
+
+    def _record(self, batch: list[tuple[float, bytes]]) -> None:
+        """记录投递结果"""
+        now = time.time()
+        self.delivered += len(batch)
+        WEBHOOK_EVENTS.inc(self.url, "delivered", value=len(batch))
+        for created, _ in batch:
+            DELIVERY_SECONDS.observe(now - created, self.url)
+        self.last_latency = now - batch[0][0]
+        if self.latency == 0:
+            self.latency = self.last_latency
+        else:
+            self.latency += LATENCY_ALPHA * (self.last_latency - self.latency)
+
+
+class WebhookManager:
+    """
+    webhook管理，为每个上报地址维护一个投递任务
+    """
+
+    workers: dict[str, WebhookWorker]
+    """投递任务，键为上报地址"""
+
+    def __init__(self) -> None:
+        self.workers = {}
+
+    async def start(
+        self, config: Config, request: Callable[[Request], Awaitable[Response]]
+    ) -> None:
+        """
+        说明:
+            为每个上报地址启动投递任务
+
+        参数:
+            * `config`: 应用设置
+            * `request`: http请求方法
+        """
+        for url in config.webhook_url:
+            worker = WebhookWorker(str(url), config, request)
+            await worker.start()
+            self.workers[worker.url] = worker
+        log("DEBUG", f"<g>已启动 {len(self.workers)} 个webhook投递任务</g>")
+
+    async def stop(self) -> None:
+        """
+        停止所有投递任务
+        """
+        workers = list(self.workers.values())
+        self.workers.clear()
+        for worker in workers:
+            await worker.stop()
+
+    async def put(self, envelope: EventEnvelope) -> None:
+        """
+        说明:
+            向所有上报地址投递事件
+
+        参数:
+            * `envelope`: 事件信封
+        """
+        for worker in self.workers.values():
+            await worker.put(envelope)
+
+    def get_status(self) -> dict:
+        """
+        获取各上报地址的投递状态
+        """
+        return {url: worker.get_status() for url, worker in self.workers.items()}
@@ -16,6 +16,7 @@ from wechatbot_client.com_wechat import Message, MessageHandler
 from wechatbot_client.config import Config
 from wechatbot_client.consts import FILE_CACHE
 from wechatbot_client.file_manager import FileManager
+from wechatbot_client.metrics import REGISTRY
 from wechatbot_client.onebot12 import (
     BotSelf,
     BotStatus,
@@ -30,6 +31,15 @@ from .adapter import Adapter
 
 log = logger_wrapper("WeChat Manager")
 
+MESSAGE_SECONDS = REGISTRY.histogram(
+    "wechat_message_handle_seconds", "微信消息从解析到分发事件的耗时", ("type",)
+)
+MESSAGE_DELAY = REGISTRY.histogram(
+    "wechat_message_delay_seconds",
+    "微信消息时间戳到分发事件的延迟，时间戳精度为秒",
+    buckets=(0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0),
+)
+
 
 class WeChatManager(Adapter):
     """
@@ -69,6 +79,13 @@ class WeChatManager(Adapter):
             image_path, voice_path, video_path, self.file_manager
         )
         self.action_manager.register_message_handler(self.handle_msg)
+        self.action_manager.register_status_handler(
+            "event_buffer", self.event_buffer.get_status
+        )
+        if self.config.enable_http_webhook:
+            self.action_manager.register_status_handler(
+                "webhook", self.webhook.get_status
+            )
         log("DEBUG", "<g>微信id获取成功...</g>")
         log("INFO", "<g>初始化完成，启动uvicorn...</g>")
 
@@ -76,7 +93,7 @@ class WeChatManager(Adapter):
         """
         开始接收消息
         """
-        self.action_manager.open_recv_msg(file_path)
+        self.action_manager.open_recv_msg(file_path, self.config.com_queue_size)
 
     def close(self) -> None:
         """
@@ -136,15 +153,22 @@ class WeChatManager(Adapter):
         """
         消息处理函数
         """
+        start = time.perf_counter()
         try:
             message = Message.parse_raw(msg)
         except ValidationError as e:
             log("ERROR", f"微信消息实例化失败:{e}")
+            MESSAGE_SECONDS.observe(time.perf_counter() - start, "invalid")
             return
+        self.action_manager.handle_member_notice(message)
         if message.isSendMsg:
             await self.handle_self_msg(message)
+            msg_type = "self"
         else:
             await self.handle_evnt_msg(message)
+            msg_type = "event"
+        MESSAGE_SECONDS.observe(time.perf_counter() - start, msg_type)
+        MESSAGE_DELAY.observe(max(time.time() - message.timestamp, 0.0))
 
     async def handle_self_msg(self, msg: Message) -> None:
         """
@@ -169,3 +193,7 @@ class WeChatManager(Adapter):
             return
         log("SUCCESS", f"生成事件<g>[{event.__repr_name__()}]</g>:{event.dict()}")
         await self.handle_event(event)
+        try:
+            await self.action_manager.handle_contact_event(event)
+        except Exception as e:
+            log("ERROR", f"更新通讯录出错:{e}")